@@ -47,6 +47,14 @@ SCHEMA_TASK_V1 = 'task-v1'
 DEFAULT_DEPLOYER_URL = os.getenv('CLUSTER_DEPLOYER_URL',
                                  'http://localhost:9000')
 
+# HTTP settings for deployer requests (See
+# orchestrator.services.deployer_client)
+DEPLOYER_HTTP = {
+    'connect-timeout': float(os.getenv('DEPLOYER_CONNECT_TIMEOUT', '5')),
+    'read-timeout': float(os.getenv('DEPLOYER_READ_TIMEOUT', '60')),
+    'pool-max-size': int(os.getenv('DEPLOYER_POOL_MAX_SIZE', '10')),
+}
+
 API_MAX_PAGE_SIZE = 1000
 API_DEFAULT_PAGE_SIZE = 10
 
@@ -71,6 +79,15 @@ ENCRYPTION = {
     'passphrase': os.getenv('ENCRYPTION_PASSPHRASE', None),
 }
 
+# Per process cache for decryption keys and decrypted configs (See
+# orchestrator.services.security)
+DECRYPT_CACHE = {
+    'enabled': os.getenv('DECRYPT_CACHE_ENABLED', 'true').strip().lower() in
+    BOOLEAN_TRUE_VALUES,
+    'max-size': int(os.getenv('DECRYPT_CACHE_MAX_SIZE', '200')),
+    'ttl': int(os.getenv('DECRYPT_CACHE_TTL', '300')),
+}
+
 DEFAULT_DEPLOYER_CONFIG = {
     'url': os.getenv('CLUSTER_DEPLOYER_URL', DEFAULT_DEPLOYER_URL),
     'enabled': False,
@@ -97,11 +114,19 @@ CONFIG_PROVIDERS = {
         'base': TOTEM_ETCD_SETTINGS['base'],
         'host': TOTEM_ETCD_SETTINGS['host'],
         'port': TOTEM_ETCD_SETTINGS['port'],
+        'mirror': {
+            'enabled': os.getenv('CONFIG_ETCD_MIRROR_ENABLED', 'false')
+            .strip().lower() in BOOLEAN_TRUE_VALUES,
+            'watch-timeout': int(
+                os.getenv('CONFIG_ETCD_MIRROR_WATCH_TIMEOUT', '60')),
+        }
     },
     'effective': {},
     'github': {
         'token': os.getenv('GITHUB_TOKEN', None),
         'config_base': os.getenv('GITHUB_CONFIG_BASE', '/'),
+        'connect-timeout': float(os.getenv('GITHUB_CONNECT_TIMEOUT', '5')),
+        'read-timeout': float(os.getenv('GITHUB_READ_TIMEOUT', '30')),
     },
     'default': {
         'config': {
@@ -181,12 +206,44 @@ CONFIG_PROVIDERS = {
 CONFIG_PROVIDER_LIST = os.getenv(
     'CONFIG_PROVIDER_LIST', 'etcd,default').split(',')
 
+# Cache for evaluated job config (keyed by hash of raw config and variables)
+CONFIG_CACHE = {
+    'enabled': os.getenv('CONFIG_CACHE_ENABLED', 'true').strip().lower() in
+    BOOLEAN_TRUE_VALUES,
+    'max-size': int(os.getenv('CONFIG_CACHE_MAX_SIZE', '200')),
+    'ttl': int(os.getenv('CONFIG_CACHE_TTL', '600')),
+    'templates-max-size': int(
+        os.getenv('CONFIG_TEMPLATE_CACHE_MAX_SIZE', '1000')),
+}
+
 HOOK_SETTINGS = {
     'travis': {
         'token': os.getenv('TRAVIS_TOKEN', 'changeit'),
     },
     'secret': os.getenv('HOOK_SECRET', 'changeit'),
-    'hint_secret_size': int(os.getenv('HOOK_SECRET_HINT', '2'))
+    'hint_secret_size': int(os.getenv('HOOK_SECRET_HINT', '2')),
+    # Window (in seconds) for collapsing hooks received for a ref. 0 disables
+    # debouncing.
+    'debounce-window': int(os.getenv('HOOK_DEBOUNCE_WINDOW', '0'))
+}
+
+# Jinja templates for notifications (See orchestrator.templatefactory)
+TEMPLATE_SETTINGS = {
+    'bytecode-cache-enabled': os.getenv(
+        'TEMPLATE_BYTECODE_CACHE_ENABLED', 'true').strip().lower() in
+    BOOLEAN_TRUE_VALUES,
+    # Defaults to user specific folder in system temp directory
+    'bytecode-cache-dir': os.getenv('TEMPLATE_BYTECODE_CACHE_DIR', ''),
+}
+
+NOTIFICATION_SETTINGS = {
+    'connect-timeout': float(
+        os.getenv('NOTIFICATION_CONNECT_TIMEOUT', '5')),
+    'read-timeout': float(os.getenv('NOTIFICATION_READ_TIMEOUT', '30')),
+    # Window (in seconds) for batching notifications sent to same channel
+    # target (e.g. Slack webhook). 0 disables batching.
+    'batch-window': int(os.getenv('NOTIFICATION_BATCH_WINDOW', '0')),
+    'batch-max-size': int(os.getenv('NOTIFICATION_BATCH_MAX_SIZE', '20')),
 }
 
 TASK_SETTINGS = {
@@ -201,6 +258,39 @@ TASK_SETTINGS = {
     'DEPLOY_WAIT_RETRIES': 10
 }
 
+# Serialized dispatch of hooks using per application queue (instead of
+# retrying the application lock)
+APP_QUEUE = {
+    'enabled': os.getenv('APP_QUEUE_ENABLED', 'false').strip().lower() in
+    BOOLEAN_TRUE_VALUES,
+    'ttl': int(os.getenv('APP_QUEUE_TTL', '3600')),
+}
+
+# Celery task payloads (See orchestrator.serializer)
+TASK_PAYLOAD = {
+    # Payloads smaller than this size (in bytes) are not compressed
+    'compress-min-size': int(
+        os.getenv('TASK_PAYLOAD_COMPRESS_MIN_SIZE', '1024')),
+    'cache-max-size': int(os.getenv('TASK_PAYLOAD_CACHE_MAX_SIZE', '500')),
+    # Pass job references (job-id and version) in place of job documents to
+    # deploy tasks. Job snapshot is written by the task publishing the deploy
+    # tasks (See orchestrator.services.job.as_job_ref)
+    'job-refs': os.getenv('TASK_PAYLOAD_JOB_REFS', 'false').strip().lower() in
+    BOOLEAN_TRUE_VALUES,
+}
+
+# Deploy to all deployers from a single task (in place of deploy chord)
+DEPLOY_FANOUT = {
+    'enabled': os.getenv('DEPLOY_FANOUT_ENABLED', 'false').strip().lower() in
+    BOOLEAN_TRUE_VALUES,
+    # Max no. of concurrent deploy requests per task
+    'max-workers': int(os.getenv('DEPLOY_FANOUT_MAX_WORKERS', '8')),
+    # Retries per deployer (with backoff) if deployer is unavailable
+    'retries': int(os.getenv('DEPLOY_FANOUT_RETRIES', '3')),
+    'retry-delay': float(os.getenv('DEPLOY_FANOUT_RETRY_DELAY', '2')),
+    'retry-backoff': 2,
+}
+
 JOB_SETTINGS = {
     'DEFAULT_TTL': 3600
 }
@@ -231,6 +321,36 @@ JOB_EXPIRY_SECONDS = int(
 EVENT_EXPIRY_SECONDS = int(
     os.getenv('EVENT_EXPIRY_SECONDS', DEFAULT_EVENT_EXPIRY_SECONDS))
 
+# Buffer for store events (See
+# orchestrator.services.storage.event_buffer)
+EVENT_BUFFER = {
+    'enabled': os.getenv('EVENT_BUFFER_ENABLED', 'false').strip().lower() in
+    BOOLEAN_TRUE_VALUES,
+    'max-size': int(os.getenv('EVENT_BUFFER_MAX_SIZE', '50')),
+    # Max time (in seconds) for which events are buffered
+    'max-age': float(os.getenv('EVENT_BUFFER_MAX_AGE', '5')),
+    # Spooled events are recovered after restart, hence the directory must
+    # survive restarts (not a temp directory)
+    'spool-dir': os.getenv('EVENT_BUFFER_SPOOL_DIR',
+                           '/var/lib/orchestrator/events'),
+}
+
+# Metrics of every process are published to the store (See
+# orchestrator.services.metrics.MetricsPublisher)
+METRICS = {
+    'publish-interval': float(os.getenv('METRICS_PUBLISH_INTERVAL', '15')),
+    # Metrics of processes that stopped publishing are removed after ttl
+    'ttl': int(os.getenv('METRICS_TTL', '86400')),
+}
+
+# Content addressed snapshots for job configs (See
+# orchestrator.services.storage.config_snapshots)
+CONFIG_SNAPSHOTS = {
+    'enabled': os.getenv('CONFIG_SNAPSHOTS_ENABLED', 'false').strip().lower()
+    in BOOLEAN_TRUE_VALUES,
+    'cache-max-size': int(os.getenv('CONFIG_SNAPSHOTS_CACHE_MAX_SIZE', '100')),
+}
+
 # Mongo Settings
 MONGODB_USERNAME = os.getenv('MONGODB_USERNAME', '')
 MONGODB_PASSWORD = os.getenv('MONGODB_PASSWORD', '')
@@ -256,3 +376,23 @@ MONGODB_JOB_COLLECTION = os.getenv('MONGODB_JOB_COLLECTION') or \
     'orchestrator-jobs'
 MONGODB_EVENT_COLLECTION = os.getenv('MONGODB_EVENT_COLLECTION') or \
     'events'
+MONGODB_JOB_SNAPSHOT_COLLECTION = \
+    os.getenv('MONGODB_JOB_SNAPSHOT_COLLECTION') or \
+    'orchestrator-job-snapshots'
+MONGODB_CONFIG_SNAPSHOT_COLLECTION = \
+    os.getenv('MONGODB_CONFIG_SNAPSHOT_COLLECTION') or \
+    'orchestrator-config-snapshots'
+MONGODB_METRICS_COLLECTION = os.getenv('MONGODB_METRICS_COLLECTION') or \
+    'orchestrator-metrics'
+
+# Mongo connection pool (opt-in). API and workers run with gevent (monkey
+# patched sockets), hence mongo operations of concurrent greenlets share the
+# pool. Settings that are not set use pymongo defaults.
+MONGODB_POOL = {
+    # Max connections per process
+    'max-pool-size': os.getenv('MONGODB_POOL_MAX_POOL_SIZE'),
+    'wait-queue-timeout-ms': os.getenv('MONGODB_POOL_WAIT_QUEUE_TIMEOUT_MS'),
+    'server-selection-timeout-ms':
+        os.getenv('MONGODB_POOL_SERVER_SELECTION_TIMEOUT_MS'),
+    'connect-timeout-ms': os.getenv('MONGODB_POOL_CONNECT_TIMEOUT_MS'),
+}
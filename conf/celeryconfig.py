@@ -42,9 +42,13 @@ CELERY_MONGODB_BACKEND_SETTINGS = {
 CELERY_RESULT_EXCHANGE = 'orchestrator-%s-results' % CLUSTER_NAME
 CELERY_IMPORTS = ('orchestrator.tasks', 'orchestrator.tasks.job',
                   'orchestrator.tasks.common', 'celery.task')
-CELERY_ACCEPT_CONTENT = ['json', 'pickle']
-CELERY_TASK_SERIALIZER = 'pickle'
-CELERY_RESULT_SERIALIZER = 'pickle'
+# pickle is accepted for the messages published prior to switching to
+# orchestrator serializer (See orchestrator.serializer)
+CELERY_ACCEPT_CONTENT = ['json', 'pickle', 'orchestrator']
+# Switch the serializers to orchestrator only after all workers accept it
+# (rolling deploys).
+CELERY_TASK_SERIALIZER = os.getenv('CELERY_TASK_SERIALIZER', 'pickle')
+CELERY_RESULT_SERIALIZER = os.getenv('CELERY_RESULT_SERIALIZER', 'pickle')
 CELERY_ALWAYS_EAGER = literal_eval(os.getenv('CELERY_ALWAYS_EAGER', 'False'))
 CELERY_CHORD_PROPAGATES = True
 
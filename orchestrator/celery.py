@@ -1,5 +1,69 @@
 from __future__ import absolute_import
-from celery import Celery
+from celery import Celery, Task
+from celery.signals import task_prerun, task_postrun, worker_init, \
+    worker_process_init, worker_process_shutdown
+from conf.appconfig import EVENT_BUFFER, METRICS
+from orchestrator import serializer, templatefactory
+from orchestrator.services.metrics import MetricsPublisher
+from orchestrator.services.storage.factory import get_store
 
-app = Celery(__name__)
+
+class OrchestratorTask(Task):
+    """
+    Base task for orchestrator tasks. Job references in task arguments (See
+    orchestrator.serializer) are resolved when the task runs.
+    """
+    abstract = True
+
+    def __call__(self, *args, **kwargs):
+        args, kwargs = serializer.rehydrate((args, kwargs))
+        if self.request.called_directly:
+            return Task.__call__(self, *args, **kwargs)
+        # Invoked by the worker. Task.__call__ would push an empty request
+        # (hiding retries, callbacks of the request pushed by the worker).
+        return self.run(*args, **kwargs)
+
+
+serializer.register()
+app = Celery(__name__, task_cls=OrchestratorTask)
 app.config_from_object('conf.celeryconfig')
+
+
+def _publish_metrics(process_id, snapshot):
+    get_store().publish_metrics(process_id, snapshot)
+
+
+# Publishes metrics of API / worker process (used for aggregating metrics
+# across processes)
+metrics_publisher = MetricsPublisher(_publish_metrics,
+                                     METRICS['publish-interval'])
+
+
+@task_prerun.connect
+def _start_metrics_publisher(**kwargs):
+    # Started lazily (pool processes / greenlets are created after init)
+    metrics_publisher.ensure_started()
+
+
+@worker_process_shutdown.connect
+def _publish_final_metrics(**kwargs):
+    metrics_publisher.publish()
+
+
+@worker_init.connect
+def _precompile_templates(**kwargs):
+    # Compiled before the pool processes are forked
+    templatefactory.precompile()
+
+
+@worker_process_init.connect
+def _recover_events(**kwargs):
+    if EVENT_BUFFER['enabled']:
+        get_store().recover_events()
+
+
+@task_postrun.connect
+@worker_process_shutdown.connect
+def _flush_events(**kwargs):
+    if EVENT_BUFFER['enabled']:
+        get_store().flush_events()
@@ -35,6 +35,45 @@ class AbstractConfigProvider:
         """
         self.not_supported()
 
+    @staticmethod
+    def level_paths(*paths):
+        """
+        Gets the paths for every level starting from given (deepest) level up
+        to the root level.
+
+        :param paths: Tuple consisting of nested level path
+        :return: Generator of path tuples
+        """
+        use_paths = list(paths)
+        while True:
+            yield tuple(use_paths)
+            if not use_paths:
+                break
+            use_paths.pop()
+
+    def load_levels(self, names, *paths, **kwargs):
+        """
+        Loads configs for all given names at every level starting from given
+        (deepest) path up to the root level. Providers that can fetch multiple
+        levels using a single request should override this method.
+
+        :param names: Names of the configs to be loaded
+        :type names: list
+        :param paths: Tuple consisting of nested level path
+        :keyword commit: Git commit for the ref in given path (if known).
+            Providers may use it to cache configs stored in the repository.
+        :type commit: str
+        :return: Dictionary with config name as key and list of parsed configs
+            (ordered from deepest level to root level) as value.
+        :rtype: dict
+        :raise NotImplementedError: If provider does not support this method.
+        """
+        return {
+            name: [self.load(name, *level_paths)
+                   for level_paths in self.level_paths(*paths)]
+            for name in names
+        }
+
     def write(self, name, config, *paths):
         """
         Writes config at given path.
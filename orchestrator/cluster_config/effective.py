@@ -7,7 +7,8 @@ from future.builtins import (  # noqa
     filter, map, zip)
 
 from orchestrator.cluster_config.base import AbstractConfigProvider
-from orchestrator.util import dict_merge
+from orchestrator.services import metrics
+from orchestrator.util import dict_merge_shared
 
 
 class MergedConfigProvider(AbstractConfigProvider):
@@ -20,9 +21,14 @@ class MergedConfigProvider(AbstractConfigProvider):
         :param providers: List of Config providers.
         :param write_provider: Config provider for writing the config to. If
             None, then no write will be done.
+        :keyword provider_names: Names of the providers (in the same order)
+            used for recording load timings. Defaults to provider class names.
+        :type provider_names: list
         """
         self.providers = providers
         self.write_provider = kwargs.get('write_provider', None)
+        self.provider_names = kwargs.get('provider_names') or [
+            provider.__class__.__name__ for provider in providers]
 
     def write(self, name, config, *paths):
         """
@@ -48,28 +54,44 @@ class MergedConfigProvider(AbstractConfigProvider):
         if self.write_provider:
             self.write_provider.delete(name, *paths)
 
-    def load(self, name, *paths):
+    def load_levels(self, names, *paths, **kwargs):
         """
-        Loads config for given path list.
+        Loads configs for all given names at every level using all providers.
 
+        :param names: Names of the configs to be loaded
+        :type names: list
         :param paths: Path list used for loading the config.
-        :return: Merged config from different providers.
+        :keyword commit: Git commit for the ref in given path (if known).
+        :type commit: str
+        :return: Dictionary with config name as key and list of configs as
+            value. Configs are ordered by precedence, i.e. deepest level
+            first and for the same level, in the order of providers.
         :rtype: dict
         """
-        merged_config = {}
+        provider_levels = []
+        for provider, provider_name in zip(self.providers,
+                                           self.provider_names):
+            # Timings are keyed by provider name and level (no. of path
+            # elements), as load time grows with the no. of levels read.
+            with metrics.timed('config.load.%s.%d' %
+                               (provider_name, len(paths))):
+                provider_levels.append(
+                    provider.load_levels(names, *paths, **kwargs))
+        return {
+            name: [levels[name][level]
+                   for level in range(len(paths) + 1)
+                   for levels in provider_levels]
+            for name in names
+        }
 
-        def merge(current_config, provider, *merge_paths):
-            return dict_merge(
-                current_config,
-                provider.load(name, *merge_paths))
-
-        use_paths = list(paths)
-        while True:
-            for provider in self.providers:
-                merged_config = merge(merged_config, provider, *use_paths)
-            if use_paths:
-                use_paths.pop()
-            else:
-                break
+    def load(self, name, *paths):
+        """
+        Loads config for given path list.
 
-        return merged_config
+        :param paths: Path list used for loading the config.
+        :return: Merged config from different providers.
+        :rtype: orchestrator.util.FrozenDict
+        """
+        configs = self.load_levels([name], *paths)[name]
+        # Loaded configs may be shared with providers (e.g. default config).
+        return dict_merge_shared(*configs, frozen=True)
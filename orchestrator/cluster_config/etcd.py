@@ -6,10 +6,225 @@ from future.builtins import (  # noqa
     pow, round, super,
     filter, map, zip)
 
+import copy
+import logging
+import threading
+import time
 import etcd
+from urllib3.exceptions import TimeoutError as WatchTimeoutError, \
+    MaxRetryError
 import yaml
 from orchestrator.cluster_config.base import AbstractConfigProvider
 
+logger = logging.getLogger(__name__)
+
+EVENTS_DELETE = ('delete', 'expire', 'compareAndDelete')
+
+
+class EtcdConfigMirror(object):
+    """
+    In memory mirror of the etcd config tree. The complete tree is loaded
+    once and is kept current by watching the tree for changes. Parsed
+    configs are cached per key, so that reads do not need any network
+    round trip.
+    """
+
+    def __init__(self, etcd_cl, config_base, watch_timeout=60,
+                 retry_delay=5):
+        """
+        :param etcd_cl: Etcd client
+        :type etcd_cl: etcd.Client
+        :param config_base: Base key for the config tree
+        :type config_base: str
+        :keyword watch_timeout: Timeout in seconds for a single watch request
+        :type watch_timeout: int
+        :keyword retry_delay: Delay in seconds before re-syncing the mirror
+            after an unexpected error.
+        :type retry_delay: int
+        """
+        self.etcd_cl = etcd_cl
+        self.config_base = config_base
+        self.watch_timeout = watch_timeout
+        self.retry_delay = retry_delay
+        self.etcd_index = None
+        self.last_sync = None
+        self.last_event = None
+        self._configs = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._watcher = None
+
+    @staticmethod
+    def _key(key):
+        return key.strip('/')
+
+    @staticmethod
+    def _parse(raw):
+        try:
+            return yaml.load(raw)
+        except yaml.YAMLError as error:
+            # Raised when config is read (same as non mirrored load)
+            return error
+
+    def start(self):
+        """
+        Loads the config tree and starts watching it for changes (using a
+        daemon thread).
+
+        :return: self
+        :rtype: EtcdConfigMirror
+        """
+        self.sync()
+        self._stopped.clear()
+        self._watcher = threading.Thread(target=self._watch,
+                                         name='etcd-config-mirror')
+        self._watcher.daemon = True
+        self._watcher.start()
+        return self
+
+    def stop(self):
+        """
+        Stops watching the config tree. The watcher stops after the current
+        watch request completes.
+
+        :return: None
+        """
+        self._stopped.set()
+
+    def sync(self):
+        """
+        Loads the complete config tree using single recursive read.
+
+        :return: None
+        """
+        try:
+            result = self.etcd_cl.read(self.config_base, recursive=True)
+        except etcd.EtcdKeyNotFound as error:
+            configs = {}
+            etcd_index = (error.payload or {}).get('index', 0)
+        else:
+            configs = {
+                self._key(node.key): self._parse(node.value)
+                for node in result.leaves if not node.dir
+            }
+            etcd_index = result.etcd_index
+        with self._lock:
+            self._configs = configs
+            self.etcd_index = etcd_index
+            self.last_sync = time.time()
+
+    def apply(self, event):
+        """
+        Applies the watch event to the mirror.
+
+        :param event: Watch result
+        :type event: etcd.EtcdResult
+        :return: None
+        """
+        key = self._key(event.key)
+        with self._lock:
+            if event.action in EVENTS_DELETE:
+                if event.dir:
+                    prefix = key + '/'
+                    for each_key in [each_key for each_key in self._configs
+                                     if each_key.startswith(prefix)]:
+                        del self._configs[each_key]
+                else:
+                    self._configs.pop(key, None)
+            elif not event.dir:
+                self._configs[key] = self._parse(event.value)
+            self.etcd_index = max(self.etcd_index, event.modifiedIndex)
+            self.last_event = time.time()
+
+    def _watch_timed_out(self, error, started):
+        """
+        Checks if the watch request failed only because no change happened
+        during the watch timeout. python-etcd retries the timed out request
+        (using urllib3) and reports it as EtcdException ('No more machines in
+        the cluster'), which is indistinguishable from connection failures
+        except for the time taken by the request.
+        """
+        if isinstance(error, (WatchTimeoutError, MaxRetryError)):
+            return True
+        # Subclasses (e.g. EtcdKeyNotFound) are actual errors
+        return type(error) is etcd.EtcdException and \
+            time.time() - started >= self.watch_timeout
+
+    def watch_once(self):
+        """
+        Waits (up to watch timeout) for the next change in the config tree and
+        applies it to the mirror. If no change happens during the watch
+        timeout, mirror is left as is (next watch uses the same index).
+
+        :return: None
+        """
+        started = time.time()
+        try:
+            event = self.etcd_cl.read(
+                self.config_base, wait=True, recursive=True,
+                waitIndex=self.etcd_index + 1,
+                timeout=self.watch_timeout)
+        except etcd.EtcdEventIndexCleared:
+            # Missed events are no longer available. Re-sync the tree.
+            self.sync()
+        except Exception as error:
+            if not self._watch_timed_out(error, started):
+                raise
+            # No changes during watch timeout
+        else:
+            self.apply(event)
+
+    def _watch(self):
+        while not self._stopped.is_set():
+            try:
+                self.watch_once()
+            except Exception:
+                logger.exception('Failed to watch config tree: %s. '
+                                 'Mirror will be re-synced.',
+                                 self.config_base)
+                self._stopped.wait(self.retry_delay)
+                try:
+                    self.sync()
+                except Exception:
+                    logger.exception('Failed to sync config tree: %s',
+                                     self.config_base)
+
+    def get(self, key):
+        """
+        Gets the parsed config for given etcd key.
+
+        :param key: Etcd key
+        :type key: str
+        :return: Copy of parsed config or None if key does not exist
+        :rtype: dict
+        :raise yaml.YAMLError: If config stored in etcd is not valid yaml.
+        """
+        with self._lock:
+            config = self._configs.get(self._key(key))
+        if isinstance(config, yaml.YAMLError):
+            raise config
+        return copy.deepcopy(config)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._key(key) in self._configs
+
+    def status(self):
+        """
+        Gets the status of the mirror (used for measuring staleness).
+
+        :return: Dictionary containing etcd index reflected by the mirror,
+            time of last sync and last applied event (in seconds since
+            epoch).
+        :rtype: dict
+        """
+        return {
+            'etcd-index': self.etcd_index,
+            'last-sync': self.last_sync,
+            'last-event': self.last_event,
+            'watching': bool(self._watcher and self._watcher.is_alive())
+        }
+
 
 class EtcdConfigProvider(AbstractConfigProvider):
     """
@@ -17,13 +232,16 @@ class EtcdConfigProvider(AbstractConfigProvider):
     """
 
     def __init__(self, etcd_cl=None, etcd_port=None, etcd_host=None,
-                 config_base=None, ttl=None):
+                 config_base=None, ttl=None, mirror=None):
         """
         Initializes etcd client.
 
         :param etcd_cl:
         :param etcd_port:
         :param etcd_host:
+        :keyword mirror: Optional in memory mirror of the config tree. If
+            specified, configs are loaded from the mirror instead of etcd.
+        :type mirror: EtcdConfigMirror
         :return:
         """
         if not etcd_cl:
@@ -34,6 +252,7 @@ class EtcdConfigProvider(AbstractConfigProvider):
             self.etcd_cl = etcd_cl
         self.config_base = config_base or '/totem/config'
         self.ttl = ttl
+        self.mirror = mirror
 
     def _etcd_path(self, name, *paths):
         if paths:
@@ -55,8 +274,47 @@ class EtcdConfigProvider(AbstractConfigProvider):
             return False
 
     def load(self, name, *paths):
+        if self.mirror:
+            return self.mirror.get(self._etcd_path(name, *paths)) or dict()
         try:
             raw = self.etcd_cl.read(self._etcd_path(name, *paths)).value
         except etcd.EtcdKeyNotFound:
             return dict()
         return yaml.load(raw)
+
+    def _read_level(self, *paths):
+        """
+        Reads the raw configs stored directly under the level directory
+        (non recursive).
+
+        :return: Dictionary of raw configs keyed by config name
+        :rtype: dict
+        """
+        try:
+            result = self.etcd_cl.read(
+                '/'.join((self.config_base,) + tuple(paths)))
+        except etcd.EtcdKeyNotFound:
+            return {}
+        return {
+            node.key.rstrip('/').rsplit('/', 1)[-1]: node.value
+            for node in result.leaves if not node.dir
+        }
+
+    def load_levels(self, names, *paths, **kwargs):
+        """
+        Loads configs for all given names using a single non recursive read
+        of the directory for every level.
+        """
+        if self.mirror:
+            return AbstractConfigProvider.load_levels(self, names, *paths,
+                                                      **kwargs)
+        levels = [self._read_level(*level_paths)
+                  for level_paths in self.level_paths(*paths)]
+
+        def parse(raw):
+            return dict() if raw is None else yaml.load(raw)
+
+        return {
+            name: [parse(raw_configs.get(name)) for raw_configs in levels]
+            for name in names
+        }
@@ -1,31 +1,85 @@
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 import base64
+import copy
+import os
+import threading
 from future.builtins import (  # noqa
     bytes, dict, int, list, object, range, str,
     ascii, chr, hex, input, next, oct, open,
     pow, round, super,
     filter, map, zip)
+import repoze.lru
 import requests
+from requests.adapters import HTTPAdapter
 import yaml
 from orchestrator.cluster_config.base import AbstractConfigProvider
 
+CACHE_MAX_SIZE = 500
+POOL_MAX_SIZE = 10
+# Timeout (in seconds) for connecting to github and for github to respond
+DEFAULT_TIMEOUT = (5, 30)
+
+# Marker returned by fetch when config matches the given ETag
+NOT_MODIFIED = object()
+
+# Marker for configs missing in the cache (cached config can be None)
+_MISSING = object()
+
+# Session is created lazily per process and is shared by all provider
+# instances so that connections to github are reused across hooks.
+_sessions = {}
+_lock = threading.Lock()
+
+# Parsed configs keyed by (owner, repo, ref, path). Entries are validated
+# using ETag (conditional request) before use.
+_ref_cache = repoze.lru.LRUCache(CACHE_MAX_SIZE)
+
+# Parsed configs keyed by (owner, repo, commit, path). Content for a commit
+# is immutable, so entries are used without contacting github.
+_commit_cache = repoze.lru.LRUCache(CACHE_MAX_SIZE)
+
+
+def _get_session():
+    pid = os.getpid()
+    with _lock:
+        if pid not in _sessions:
+            _sessions.clear()
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_maxsize=POOL_MAX_SIZE))
+            _sessions[pid] = session
+        return _sessions[pid]
+
+
+def clear_cache():
+    """
+    Clears the cached github configs.
+
+    :return: None
+    """
+    _ref_cache.clear()
+    _commit_cache.clear()
+
 
 class GithubConfigProvider(AbstractConfigProvider):
     """
     Config provider that fetches totem config from a given repository
     """
 
-    def __init__(self, token=None, config_base='/'):
+    def __init__(self, token=None, config_base='/', timeout=DEFAULT_TIMEOUT):
         """
         :keyword token: Optional github API token for authentication. Needed if
             private repositories are getting deployed.
         :type token: str
+        :keyword timeout: Tuple of connect and read timeout (in seconds) for
+            github requests
+        :type timeout: tuple
         """
         self.auth = (token, 'x-oauth-basic') if token else None
         self.config_base = config_base
+        self.timeout = timeout
 
-    def _github_fetch(self, owner, repo, ref, name):
+    def _github_fetch(self, owner, repo, ref, name, etag=None):
         """
         Fetches the raw totem config for a given owner, repo, ref and name.
 
@@ -33,12 +87,16 @@ class GithubConfigProvider(AbstractConfigProvider):
         :type owner: str
         :param repo: Repository name
         :type repo: str
-        :param ref: Branch/tag
+        :param ref: Branch/tag/commit
         :type ref: str
         :param name: Name of totem config (totem.yml)
         :type name: str
-        :return: Raw totem config
-        :rtype: str
+        :keyword etag: ETag of previously fetched config. If specified, config
+            is fetched using conditional request.
+        :type etag: str
+        :return: Tuple of raw totem config and ETag. Raw config is None if
+            config does not exist and NOT_MODIFIED if it matches given etag.
+        :rtype: tuple
         :raises GithubFetchException: If fetch fails
         """
         path_params = {
@@ -51,11 +109,17 @@ class GithubConfigProvider(AbstractConfigProvider):
         }
         hub_url = 'https://api.github.com/repos/{owner}/{repo}/contents' \
                   '{path}'.format(**path_params)
-        resp = requests.get(hub_url, params=query_params, auth=self.auth)
+        headers = {'If-None-Match': etag} if etag else {}
+        resp = _get_session().get(hub_url, params=query_params,
+                                  auth=self.auth, headers=headers,
+                                  timeout=self.timeout)
         if resp.status_code == 200:
-            return base64.decodestring(resp.json()[u'content'])
+            return base64.decodestring(resp.json()[u'content']), \
+                resp.headers.get('ETag')
+        elif resp.status_code == 304:
+            return NOT_MODIFIED, etag
         elif resp.status_code == 404:
-            return None
+            return None, None
         else:
             hub_response = {
                 'url': hub_url,
@@ -65,7 +129,33 @@ class GithubConfigProvider(AbstractConfigProvider):
             }
             raise GithubFetchException(hub_response)
 
-    def load(self, name, *paths):
+    def _load_for_ref(self, owner, repo, ref, name):
+        cache_key = (owner, repo, ref, self.config_base + name)
+        etag, config = _ref_cache.get(cache_key, (None, None))
+        raw, etag = self._github_fetch(owner, repo, ref, name, etag=etag)
+        if raw is NOT_MODIFIED:
+            return copy.deepcopy(config)
+        config = yaml.load(raw) if raw else {}
+        if etag:
+            _ref_cache.put(cache_key, (etag, config))
+            return copy.deepcopy(config)
+        else:
+            _ref_cache.invalidate(cache_key)
+            return config
+
+    def _load_for_commit(self, owner, repo, commit, name):
+        cache_key = (owner, repo, commit, self.config_base + name)
+        config = _commit_cache.get(cache_key, _MISSING)
+        if config is _MISSING:
+            raw, _ = self._github_fetch(owner, repo, commit, name)
+            if not raw:
+                # Config may become visible later (e.g. after token change)
+                return {}
+            config = yaml.load(raw)
+            _commit_cache.put(cache_key, config)
+        return copy.deepcopy(config)
+
+    def load(self, name, *paths, **kwargs):
         """
         Loads the config for given paths. Github provider only supports
         fetch for full path with (owner, repo, and ref). If partial path is
@@ -74,6 +164,9 @@ class GithubConfigProvider(AbstractConfigProvider):
         :param name: Name of the config file.
         :param paths: Paths used for loading config (owner, repo, and ref):
         :type paths: tuple
+        :keyword commit: Git commit for the ref (if known). If specified,
+            config is loaded for the commit (and cached as it is immutable).
+        :type commit: str
         :return: Totem config as dictionary
         :rtype: dict
         """
@@ -81,11 +174,21 @@ class GithubConfigProvider(AbstractConfigProvider):
             return {}
         else:
             owner, repo, ref = paths[1:4]
-        raw = self._github_fetch(owner, repo, ref, name)
-        if raw:
-            return yaml.load(raw)
-        else:
-            return {}
+        commit = kwargs.get('commit')
+        if commit:
+            return self._load_for_commit(owner, repo, commit, name)
+        return self._load_for_ref(owner, repo, ref, name)
+
+    def load_levels(self, names, *paths, **kwargs):
+        """
+        Loads configs for all given names and levels. Only the deepest level
+        (owner, repo and ref) is fetched from github.
+        """
+        return {
+            name: [self.load(name, *level_paths, **kwargs)
+                   for level_paths in self.level_paths(*paths)]
+            for name in names
+        }
 
 
 class GithubFetchException(Exception):
@@ -5,12 +5,51 @@ from future.builtins import (  # noqa
     ascii, chr, hex, input, next, oct, open,
     pow, round, super,
     filter, map, zip)
+import copy
+from multiprocessing.pool import ThreadPool
+import os
+import threading
 import boto
 from boto.s3.key import Key
+import repoze.lru
 import yaml
 from orchestrator.cluster_config.base import AbstractConfigProvider
 
 
+MAX_FETCH_THREADS = 8
+CACHE_MAX_SIZE = 500
+
+# Connection and thread pool (used for fetching configs in parallel) are
+# created lazily per process and are shared across provider instances. Boto
+# connection uses an internal pool of http connections, so concurrent
+# requests do not share the socket.
+_connections = {}
+_fetch_pools = {}
+_lock = threading.Lock()
+
+# Parsed configs keyed by (bucket, key name). Entries are validated using
+# ETag of the key before use.
+_config_cache = repoze.lru.LRUCache(CACHE_MAX_SIZE)
+
+
+def _get_fetch_pool():
+    pid = os.getpid()
+    with _lock:
+        if pid not in _fetch_pools:
+            _fetch_pools.clear()
+            _fetch_pools[pid] = ThreadPool(MAX_FETCH_THREADS)
+        return _fetch_pools[pid]
+
+
+def clear_cache():
+    """
+    Clears the cached s3 configs.
+
+    :return: None
+    """
+    _config_cache.clear()
+
+
 class S3ConfigProvider(AbstractConfigProvider):
 
     def __init__(self, bucket, config_base='totem/config'):
@@ -26,17 +65,42 @@ class S3ConfigProvider(AbstractConfigProvider):
 
     @staticmethod
     def _s3_connection():
-        # Use default env variable or IAM roles to connect to S3.
-        return boto.connect_s3()
+        # Connection is not reused in forked process (shares the sockets)
+        pid = os.getpid()
+        with _lock:
+            if pid not in _connections:
+                _connections.clear()
+                # Use default env variable or IAM roles to connect to S3.
+                _connections[pid] = boto.connect_s3()
+            return _connections[pid]
 
     def _s3_bucket(self):
         """
-        Gets S3 bucket for storing totem configuration.
+        Gets S3 bucket for storing totem configuration. Bucket is not
+        validated (avoids a HEAD request per call).
 
         :return: S3 Bucket
         :rtype: S3Bucket
         """
-        return self._s3_connection().get_bucket(self.bucket)
+        return self._s3_connection().get_bucket(self.bucket, validate=False)
+
+    def _load_key(self, key):
+        """
+        Loads parsed config for given key. Parsed config is cached and reused
+        as long as ETag of the key does not change.
+
+        :param key: S3 Key (with etag populated using listing or HEAD)
+        :type key: boto.s3.key.Key
+        :return: Parsed config
+        :rtype: dict
+        """
+        cache_key = (self.bucket, key.name)
+        etag, config = _config_cache.get(cache_key, (None, None))
+        if etag is None or etag != key.etag:
+            raw = key.get_contents_as_string()
+            config = yaml.load(raw)
+            _config_cache.put(cache_key, (key.etag, config))
+        return copy.deepcopy(config)
 
     def _get_key(self, name, *paths):
         key_path = self._s3_path(name, *paths)
@@ -50,11 +114,59 @@ class S3ConfigProvider(AbstractConfigProvider):
     def load(self, name, *paths):
         key = self._get_key(name, *paths)
         if key:
-            raw = key.get_contents_as_string()
-            return yaml.load(raw)
+            return self._load_key(key)
         else:
             return {}
 
+    def _list_level(self, *paths):
+        """
+        Lists the keys stored directly under the level (using delimiter, so
+        that nested levels are not listed).
+
+        :return: Dictionary of keys keyed by key name
+        :rtype: dict
+        """
+        prefix = '/'.join((self.config_base,) + tuple(paths)) + '/'
+        return {
+            key.name: key for key in self._s3_bucket().list(
+                prefix=prefix, delimiter='/')
+        }
+
+    def load_levels(self, names, *paths, **kwargs):
+        """
+        Loads configs for all given names using a single listing per level
+        followed by parallel fetch of existing configs. Configs whose ETag
+        (from the listing) matches the cached config are not fetched.
+        """
+        existing_keys = {}
+        for level_keys in _get_fetch_pool().map(
+                lambda level_paths: self._list_level(*level_paths),
+                list(self.level_paths(*paths))):
+            existing_keys.update(level_keys)
+        key_paths = {
+            name: [self._s3_path(name, *level_paths)
+                   for level_paths in self.level_paths(*paths)]
+            for name in names
+        }
+        fetch_paths = list({
+            key_path for name in names for key_path in key_paths[name]
+            if key_path in existing_keys
+        })
+        configs = {}
+        if len(fetch_paths) > 1:
+            configs = dict(zip(fetch_paths, _get_fetch_pool().map(
+                lambda key_path: self._load_key(existing_keys[key_path]),
+                fetch_paths)))
+        elif fetch_paths:
+            configs = {fetch_paths[0]: self._load_key(
+                existing_keys[fetch_paths[0]])}
+
+        return {
+            name: [configs[key_path] if key_path in configs else {}
+                   for key_path in key_paths[name]]
+            for name in names
+        }
+
     def delete(self, name, *paths):
         key = self._get_key(name, *paths)
         if key:
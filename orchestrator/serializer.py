@@ -0,0 +1,160 @@
+"""
+Compact serializer for celery task payloads and results. Payloads are
+pickled (binary protocol) and compressed using zlib and are prefixed with a
+header containing schema version, so that the format can evolve without
+breaking messages that are already queued.
+
+Encoding does not replace job documents or write to the store. Job
+references are created by the task publishing the message (See
+TASK_PAYLOAD['job-refs'] and :func:`orchestrator.services.job.as_job_ref`).
+Messages queued by older workers may still contain :class:`JobReference`.
+Decoding does not resolve these (no store lookups), they are resolved when the
+task runs (See :class:`orchestrator.celery.OrchestratorTask`), so that a
+missing job fails the task (running its error handlers) in place of dropping
+the message.
+"""
+from __future__ import absolute_import
+import copy
+import struct
+import zlib
+from kombu.serialization import register as register_serializer
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: no cover
+    import pickle
+
+from conf.appconfig import TASK_PAYLOAD
+from orchestrator.services import metrics
+from orchestrator.services.job import get_job_for_ref
+
+__author__ = 'sukrit'
+
+SERIALIZER_NAME = 'orchestrator'
+CONTENT_TYPE = 'application/x-orchestrator'
+CONTENT_ENCODING = 'binary'
+
+SCHEMA_VERSION = 1
+PICKLE_PROTOCOL = 2
+
+# Header: schema version, flags
+_HEADER = struct.Struct('>BB')
+_FLAG_COMPRESSED = 0x01
+
+
+class SerializerError(Exception):
+    """
+    Exception representing that payload could not be decoded.
+    """
+
+
+class JobReference(object):
+    """
+    Reference to the job document (in messages queued by older workers)
+    """
+
+    def __init__(self, job_id, version):
+        self.job_id = job_id
+        self.version = version
+
+    def __repr__(self):
+        return 'JobReference({!r}, {!r})'.format(self.job_id, self.version)
+
+
+def _from_reference(ref):
+    return get_job_for_ref({'job-id': ref.job_id, 'version': ref.version})
+
+
+def _replace(obj, func, match):
+    """
+    Replaces the matching objects inside dicts / lists / tuples. Containers
+    are copied only if any of the nested object gets replaced.
+    """
+    if match(obj):
+        return func(obj)
+    if isinstance(obj, dict):
+        replaced = None
+        for key, value in obj.items():
+            new_value = _replace(value, func, match)
+            if new_value is not value:
+                if replaced is None:
+                    replaced = copy.copy(obj)
+                replaced[key] = new_value
+        return obj if replaced is None else replaced
+    if isinstance(obj, (list, tuple)):
+        values = [_replace(value, func, match) for value in obj]
+        if all(new is old for new, old in zip(values, obj)):
+            return obj
+        return type(obj)(values)
+    return obj
+
+
+def rehydrate(body):
+    """
+    Replaces the job references in task message with job documents.
+
+    :param body: Task message body / task arguments (with job references)
+    :type body: dict
+    :return: Task message body / task arguments
+    :rtype: dict
+    :raises JobNotFound: If referenced job no longer exists
+    """
+    return _replace(body, _from_reference,
+                    lambda obj: isinstance(obj, JobReference))
+
+
+def _payload_name(obj):
+    if isinstance(obj, dict) and 'task' in obj and 'args' in obj:
+        return obj['task']
+    return 'result'
+
+
+def dumps(obj):
+    """
+    Encodes the task message / result.
+
+    :param obj: Object to be encoded
+    :return: Encoded payload
+    :rtype: str
+    """
+    name = _payload_name(obj)
+    payload = pickle.dumps(obj, protocol=PICKLE_PROTOCOL)
+    flags = 0
+    if len(payload) >= TASK_PAYLOAD['compress-min-size']:
+        payload = zlib.compress(payload)
+        flags |= _FLAG_COMPRESSED
+    data = _HEADER.pack(SCHEMA_VERSION, flags) + payload
+    metrics.observe('celery.payload.{}'.format(name), len(data),
+                    buckets=metrics.SIZE_BUCKETS)
+    return data
+
+
+def loads(data):
+    """
+    Decodes the task message / result encoded using dumps. Job references
+    are left as is.
+
+    :param data: Encoded payload
+    :type data: str
+    :return: Decoded object
+    """
+    if len(data) < _HEADER.size:
+        raise SerializerError('Payload is too short')
+    version, flags = _HEADER.unpack(data[:_HEADER.size])
+    if version != SCHEMA_VERSION:
+        raise SerializerError(
+            'Unsupported payload schema version: {}'.format(version))
+    payload = data[_HEADER.size:]
+    if flags & _FLAG_COMPRESSED:
+        payload = zlib.decompress(payload)
+    return pickle.loads(payload)
+
+
+def register():
+    """
+    Registers the serializer with kombu (as 'orchestrator').
+
+    :return: None
+    """
+    register_serializer(SERIALIZER_NAME, dumps, loads,
+                        content_type=CONTENT_TYPE,
+                        content_encoding=CONTENT_ENCODING)
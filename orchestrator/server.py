@@ -2,8 +2,9 @@ from flask import Flask
 from flask.ext.cors import CORS
 from conf.appconfig import CORS_SETTINGS
 import orchestrator
+from orchestrator.celery import metrics_publisher
 from orchestrator.views import root, hypermedia, health, error, task, \
-    hooks
+    hooks, metrics
 
 app = Flask(__name__)
 
@@ -12,7 +13,7 @@ hypermedia.register_schema_api(app).register_error_handlers(app)
 if CORS_SETTINGS['enabled']:
     CORS(app, resources={'/*': {'origins': CORS_SETTINGS['origins']}})
 
-for module in [error, root, health, task, hooks]:
+for module in [error, root, health, task, hooks, metrics]:
     module.register(app)
 
 
@@ -21,3 +22,4 @@ def set_current_app():
     # DO not remove line below
     # Explanation: https://github.com/celery/celery/issues/2315
     orchestrator.celery.app.set_current()
+    metrics_publisher.ensure_started()
@@ -0,0 +1,138 @@
+"""
+Provides ordered per application work queue using Etcd Backed store
+"""
+import json
+from etcd import EtcdKeyNotFound, EtcdException
+
+from conf.appconfig import TOTEM_ETCD_SETTINGS, APP_QUEUE
+from orchestrator.etcd import get_etcd_client
+
+
+__author__ = 'sukrit'
+
+
+class AppQueueService:
+    """
+    Queue Service for serializing the work for an application. Items are
+    appended to an ordered etcd directory (per application) and are drained
+    by the task holding the application lock (See LockService). This avoids
+    tasks spinning on the lock while it is held by another task.
+
+    Queued items expire after certain TTL (Default: 3600s).
+    """
+
+    def __init__(self, etcd_cl=None, etcd_base=TOTEM_ETCD_SETTINGS['base'],
+                 queue_base='/orchestrator/queues/apps',
+                 queue_ttl=APP_QUEUE['ttl']):
+        """
+        :param etcd_cl: Etcd Client instance. If None, a new client is created
+            based on env settings.
+        :type etcd_cl: etcd.Client
+        :param etcd_base: Base Key for totem etcd. Defaults to /totem (From
+            TOTEM_ETCD_SETTINGS
+        :type etcd_base: str
+        :param queue_base: Base folder to be used to store queues.
+        :type queue_base: str
+        :param queue_ttl: TTL for queued items in seconds. Defaults to 3600s
+        :type queue_ttl: int
+        """
+        self.etcd_cl = etcd_cl or get_etcd_client()
+        self.etcd_base = etcd_base
+        self.queue_base = queue_base
+        self.queue_ttl = queue_ttl
+
+    def _queue_key(self, app_name):
+        return '%s%s/%s' % (self.etcd_base, self.queue_base, app_name)
+
+    def enqueue(self, app_name, item):
+        """
+        Appends the item to the queue for given application.
+
+        :param app_name: Name of application/resource
+        :type app_name: str
+        :param item: Item to be queued (must be JSON serializable)
+        :type item: dict
+        :return: Key for the queued item
+        :rtype: str
+        """
+        return self.etcd_cl.write(
+            self._queue_key(app_name), json.dumps(item), ttl=self.queue_ttl,
+            append=True).key
+
+    def _queued_nodes(self, app_name):
+        try:
+            queue = self.etcd_cl.read(self._queue_key(app_name),
+                                      recursive=True, sorted=True)
+        except EtcdKeyNotFound:
+            return []
+        # For empty queue, leaves returns the queue directory itself
+        return [node for node in queue.leaves
+                if node.key != queue.key and not node.dir]
+
+    def drain(self, app_name):
+        """
+        Removes and returns all the items queued for given application. The
+        queue directory is removed once it is empty.
+
+        :param app_name: Name of application/resource
+        :type app_name: str
+        :return: List of queued items (in the order these were queued)
+        :rtype: list
+        """
+        items = []
+        for node in self._queued_nodes(app_name):
+            try:
+                self.etcd_cl.delete(node.key, prevIndex=node.modifiedIndex)
+            except EtcdKeyNotFound:
+                # Item expired
+                continue
+            items.append(json.loads(node.value))
+        try:
+            # Fails if items were queued after the queue was read (Directory
+            # not empty). Queue gets re-created on next enqueue.
+            self.etcd_cl.delete(self._queue_key(app_name), dir=True)
+        except EtcdException:
+            pass
+        return items
+
+    def size(self, app_name):
+        """
+        Gets the no. of items queued for given application.
+
+        :param app_name: Name of application/resource
+        :type app_name: str
+        :rtype: int
+        """
+        return len(self._queued_nodes(app_name))
+
+    def is_empty(self, app_name):
+        """
+        Checks if there are no items queued for given application.
+
+        :param app_name: Name of application/resource
+        :type app_name: str
+        :rtype: bool
+        """
+        return not self._queued_nodes(app_name)
+
+
+def coalesce(items, key='commit'):
+    """
+    Coalesces the queued items so that only the items for the latest value
+    of given key (e.g. latest commit) are retained. Items with no value for
+    the key (e.g. branch create hook) are always retained.
+
+    :param items: Queued items (in the order these were queued)
+    :type items: list
+    :keyword key: Item key used for coalescing.
+    :type key: str
+    :return: Tuple of (retained items, superseded items)
+    :rtype: tuple
+    """
+    latest = None
+    for item in items:
+        latest = item.get(key) or latest
+    retained = [item for item in items if item.get(key) in (None, latest)]
+    superseded = [item for item in items
+                  if item.get(key) not in (None, latest)]
+    return retained, superseded
@@ -1,3 +1,4 @@
+import hashlib
 import json
 from parser import ParserError
 from yaml.error import MarkedYAMLError
@@ -6,28 +7,47 @@ from future.builtins import (  # noqa
     ascii, chr, hex, input, next, oct, open,
     pow, round, filter, map, zip)
 import copy
+import os
+import threading
 import types
-from jinja2 import TemplateSyntaxError
-from jinja2.environment import get_spontaneous_environment
-from jsonschema import validate, ValidationError
+from jinja2 import TemplateSyntaxError, Environment
+from jsonschema import Draft4Validator, RefResolver, ValidationError
 from jsonschema.exceptions import SchemaError
+from jsonschema.validators import validator_for
 import repoze.lru
 from conf.appconfig import CONFIG_PROVIDERS, CONFIG_PROVIDER_LIST, \
-    BOOLEAN_TRUE_VALUES, API_PORT, CONFIG_NAMES
+    BOOLEAN_TRUE_VALUES, API_PORT, CONFIG_NAMES, CONFIG_CACHE
 from orchestrator.cluster_config.default import DefaultConfigProvider
 from orchestrator.cluster_config.effective import MergedConfigProvider
-from orchestrator.cluster_config.etcd import EtcdConfigProvider
+import etcd
+from orchestrator.cluster_config.etcd import EtcdConfigProvider, \
+    EtcdConfigMirror
 from orchestrator.cluster_config.github import GithubConfigProvider
 from orchestrator.cluster_config.s3 import S3ConfigProvider
 from orchestrator.jinja import conditions, filters
+from orchestrator.services import metrics
 from orchestrator.services.errors import ConfigProviderNotFound
 from orchestrator.services.exceptions import ConfigValueError, \
     ConfigValidationError, ConfigParseError
-from orchestrator.util import dict_merge
+from orchestrator.util import dict_merge_shared
 
 
 __author__ = 'sukrit'
 
+_config_cache = repoze.lru.ExpiringLRUCache(
+    CONFIG_CACHE['max-size'], default_timeout=CONFIG_CACHE['ttl'])
+
+# Etcd config mirrors per process id (watch threads do not survive fork)
+_etcd_mirrors = {}
+_etcd_mirrors_lock = threading.Lock()
+
+SCHEMA_DIR = os.path.normpath(os.path.join(
+    os.path.dirname(__file__), '..', '..', 'schemas'))
+
+# Validators for all schemas in SCHEMA_DIR (keyed by schema name)
+_validators = {}
+_validators_lock = threading.Lock()
+
 
 def get_providers():
     for provider_type in CONFIG_PROVIDER_LIST:
@@ -45,12 +65,35 @@ def _get_effective_provider():
     :rtype: orchestrator.cluster_config.effective.MergedConfigProvider
     """
     providers = list()
+    provider_names = list()
     for provider_type in get_providers():
         if provider_type != 'effective':
             provider = get_provider(provider_type)
             if provider:
                 providers.append(provider)
-    return MergedConfigProvider(*providers)
+                provider_names.append(provider_type)
+    return MergedConfigProvider(*providers, provider_names=provider_names)
+
+
+def _get_etcd_mirror():
+    """
+    Gets the in memory mirror of etcd config tree for current process. The
+    mirror is created and started on first use.
+
+    :return: Instance of EtcdConfigMirror
+    :rtype: EtcdConfigMirror
+    """
+    pid = os.getpid()
+    with _etcd_mirrors_lock:
+        if pid not in _etcd_mirrors:
+            _etcd_mirrors[pid] = EtcdConfigMirror(
+                etcd.Client(host=CONFIG_PROVIDERS['etcd']['host'],
+                            port=CONFIG_PROVIDERS['etcd']['port']),
+                CONFIG_PROVIDERS['etcd']['base']+'/config',
+                watch_timeout=CONFIG_PROVIDERS['etcd']['mirror'][
+                    'watch-timeout']
+            ).start()
+        return _etcd_mirrors[pid]
 
 
 def _get_etcd_provider(ttl=None):
@@ -62,11 +105,13 @@ def _get_etcd_provider(ttl=None):
     :return: Instance of EtcdConfigProvider
     :rtype: EtcdConfigProvider
     """
+    use_mirror = CONFIG_PROVIDERS['etcd'].get('mirror', {}).get('enabled')
     return EtcdConfigProvider(
         etcd_host=CONFIG_PROVIDERS['etcd']['host'],
         etcd_port=CONFIG_PROVIDERS['etcd']['port'],
         config_base=CONFIG_PROVIDERS['etcd']['base']+'/config',
-        ttl=ttl
+        ttl=ttl,
+        mirror=_get_etcd_mirror() if use_mirror else None
     )
 
 
@@ -92,7 +137,9 @@ def _get_github_provider():
     """
     return GithubConfigProvider(
         token=CONFIG_PROVIDERS['github']['token'],
-        config_base=CONFIG_PROVIDERS['github']['config_base']
+        config_base=CONFIG_PROVIDERS['github']['config_base'],
+        timeout=(CONFIG_PROVIDERS['github']['connect-timeout'],
+                 CONFIG_PROVIDERS['github']['read-timeout'])
     )
 
 
@@ -100,7 +147,6 @@ def _get_default_provider():
     return DefaultConfigProvider()
 
 
-@repoze.lru.lru_cache(1)
 def _load_job_schema(schema_name=None):
     """
     Helper function that loads given schema
@@ -110,12 +156,68 @@ def _load_job_schema(schema_name=None):
     """
     base_url = 'http://localhost:%d' % API_PORT
     schema_name = schema_name or 'job-config-v1'
-    fname = 'schemas/{0}.json'.format(schema_name)
+    fname = '{0}/{1}.json'.format(SCHEMA_DIR, schema_name)
     with open(fname) as schema_file:
         data = schema_file.read().replace('${base_url}', base_url)
         return json.loads(data)
 
 
+def _schema_url(schema_name):
+    return 'http://localhost:%d/schemas/%s' % (API_PORT, schema_name)
+
+
+def _load_validators():
+    """
+    Loads all schemas in SCHEMA_DIR and creates validators for them. Schemas
+    are checked against their meta schema once and references to other
+    schemas in SCHEMA_DIR are resolved without any http request.
+
+    :return: Dictionary of validators keyed by schema name. If schema is not
+        valid, SchemaError is stored instead of the validator.
+    :rtype: dict
+    """
+    schemas = {
+        fname[:-len('.json')]: _load_job_schema(fname[:-len('.json')])
+        for fname in os.listdir(SCHEMA_DIR) if fname.endswith('.json')
+    }
+    store = {_schema_url(schema_name): schema
+             for schema_name, schema in schemas.items()}
+    validators = {}
+    for schema_name, schema in schemas.items():
+        cls = validator_for(schema, default=Draft4Validator)
+        try:
+            cls.check_schema(schema)
+        except SchemaError as error:
+            # Raised when validator is requested
+            validators[schema_name] = error
+            continue
+        resolver = RefResolver(_schema_url(schema_name), schema,
+                               store=store)
+        validators[schema_name] = cls(schema, resolver=resolver)
+    return validators
+
+
+def get_validator(schema_name):
+    """
+    Gets the validator for given schema. Validators for all schemas are
+    created on first use and are reused for the life of the process.
+
+    :param schema_name: Name of the schema (e.g. job-config-v1)
+    :type schema_name: str
+    :return: Validator for the schema
+    :rtype: jsonschema.Draft4Validator
+    :raise SchemaError: If schema is not valid.
+    """
+    if not _validators:
+        with _validators_lock:
+            if not _validators:
+                _validators.update(_load_validators())
+    validator = _validators[schema_name]
+    if isinstance(validator, SchemaError):
+        raise validator
+    return validator
+
+
 def get_provider(provider_type):
     """
     Factory method to create config provider instance.
@@ -145,9 +247,9 @@ def validate_schema(config, schema_name=None):
     :rtype: dict
     """
     schema_name = schema_name or 'job-config-v1'
-    schema = _load_job_schema(schema_name)
     try:
-        validate(config, schema)
+        with metrics.timed('config.validate.%s' % schema_name):
+            get_validator(schema_name).validate(config)
     except ValidationError as ex:
         message = 'Failed to validate config against schema {0}. ' \
                   'Reason: {1}'.format(schema_name, ex.message)
@@ -167,6 +269,49 @@ def _json_compatible_config(config):
     return json.loads(json.dumps(config))
 
 
+def _config_cache_key(raw_config, default_variables):
+    """
+    Creates cache key for evaluated config using content hash of raw
+    (unevaluated) config and template variables.
+
+    :param raw_config: Json compatible raw config
+    :type raw_config: dict
+    :param default_variables: Variables used for template evaluation
+    :type default_variables: dict
+    :return: Hex digest
+    :rtype: str
+    """
+    content = json.dumps([raw_config, default_variables], sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def clear_config_cache():
+    """
+    Clears the cache for evaluated configs.
+
+    :return: None
+    """
+    _config_cache.clear()
+
+
+def _evaluate_raw_config(raw_config, default_variables):
+    """
+    Validates, evaluates and normalizes the raw config.
+
+    :param raw_config: Json compatible raw config
+    :type raw_config: dict
+    :param default_variables: Variables used for template evaluation
+    :type default_variables: dict
+    :return: Evaluated config
+    :rtype: dict
+    """
+    evaluated_config = validate_schema(
+        evaluate_config(validate_schema(raw_config), default_variables),
+        schema_name='job-config-evaluated-v1')
+    with metrics.timed('config.normalize'):
+        return dict(normalize_config(evaluated_config))
+
+
 def load_config(*paths, **kwargs):
     """
     Loads config for given path and provider type.
@@ -181,32 +326,65 @@ def load_config(*paths, **kwargs):
     :keyword config_names: List of config names to be loaded. Defaults to
         CONFIG_NAMES defined in appconfig
     :type config_names: list
+    :keyword use_cache: If True, evaluated config is cached using hash of raw
+        config and default variables. Defaults to CONFIG_CACHE['enabled']
+    :type use_cache: bool
+    :keyword commit: Git commit for the ref in given path (if known).
+    :type commit: str
     :return: Parsed configuration
     :rtype: dict
     """
     default_variables = kwargs.get('default_variables', {})
     provider_type = kwargs.get('provider_type', 'effective')
     config_names = kwargs.get('config_names', CONFIG_NAMES)
+    use_cache = kwargs.get('use_cache', CONFIG_CACHE['enabled'])
     provider = get_provider(provider_type)
     try:
-        configs = [provider.load(name, *paths) for name in config_names]
-        unified_config = dict_merge(*configs)
-        return dict(
-            normalize_config(
-                validate_schema(
-                    evaluate_config(
-                        validate_schema(
-                            _json_compatible_config(unified_config)
-                        ), default_variables
-                    ), schema_name='job-config-evaluated-v1'
-                )
-            )
-        )
+        with metrics.timed('config.total'):
+            with metrics.timed('config.load'):
+                levels = provider.load_levels(config_names, *paths,
+                                              commit=kwargs.get('commit'))
+            with metrics.timed('config.merge'):
+                configs = [config for name in config_names
+                           for config in levels[name]]
+                raw_config = _json_compatible_config(
+                    dict_merge_shared(*configs))
+            if not use_cache:
+                return _evaluate_raw_config(raw_config, default_variables)
+
+            cache_key = _config_cache_key(raw_config, default_variables)
+            evaluated_config = _config_cache.get(cache_key)
+            if evaluated_config is None:
+                evaluated_config = _evaluate_raw_config(raw_config,
+                                                        default_variables)
+                _config_cache.put(cache_key, evaluated_config)
+            else:
+                metrics.increment('config.cache-hits')
+            # Callers are free to modify the returned config
+            return copy.deepcopy(evaluated_config)
 
     except (MarkedYAMLError, ParserError, SchemaError) as error:
         raise ConfigParseError(str(error), paths)
 
 
+def explain_config(*paths, **kwargs):
+    """
+    Loads config for given path (without using evaluated config cache) and
+    reports the time taken by every stage of the config pipeline along with
+    the counters (like no. of templates rendered).
+
+    :param paths: Tuple consisting of nested level path
+    :type paths: tuple
+    :param kwargs: Keyword arguments for load_config
+    :return: Report with keys 'stages' and 'counters'
+    :rtype: dict
+    """
+    kwargs['use_cache'] = False
+    with metrics.explain() as report:
+        load_config(*paths, **kwargs)
+    return report
+
+
 def write_config(name, config, *paths, **kwargs):
     """
     Writes config for given path
@@ -223,26 +401,53 @@ def write_config(name, config, *paths, **kwargs):
         provider.write(name, config, *paths)
 
 
+# Strings not containing any of these markers are not evaluated using jinja
+TEMPLATE_MARKERS = ('{{', '{%', '#')
+
+
 def _get_jinja_environment():
     """
     Creates Jinja env for evaluating config
 
     :return: Jinja Environment
     """
-    env = get_spontaneous_environment()
-    env.line_statement_prefix = '#'
-
+    env = Environment(line_statement_prefix='#')
     return filters.apply_filters(conditions.apply_conditions(env))
 
 
+_jinja_env = _get_jinja_environment()
+_template_cache = repoze.lru.LRUCache(CONFIG_CACHE['templates-max-size'])
+
+
+def _get_template(source):
+    """
+    Gets the compiled template for given source using the shared jinja
+    environment.
+
+    :param source: Template source
+    :type source: str
+    :return: Compiled template
+    :rtype: jinja2.Template
+    """
+    template = _template_cache.get(source)
+    if template is None:
+        template = _jinja_env.from_string(source)
+        _template_cache.put(source, template)
+    return template
+
+
 def evaluate_template(template_value, variables={}):
-    env = _get_jinja_environment()
-    return env.from_string(str(template_value)).render(**variables).strip()
+    template_value = str(template_value)
+    if not any(marker in template_value for marker in TEMPLATE_MARKERS):
+        # Literal value: Nothing to render
+        return template_value.strip()
+    metrics.increment('config.templates-rendered')
+    return _get_template(template_value).render(**variables).strip()
 
 
 def evaluate_variables(variables, default_variables={}):
 
-    merged_vars = dict_merge({}, default_variables)
+    merged_vars = dict_merge_shared({}, default_variables)
 
     def get_sort_key(item):
         return item[1]['priority']
@@ -282,7 +487,8 @@ def evaluate_variables(variables, default_variables={}):
 
 def evaluate_value(value, variables={}, location='/'):
     """
-    Renders tokenized values (using nested strategy)
+    Renders tokenized values (using nested strategy). Each templated value is
+    rendered exactly once and the input value is never modified.
 
     :param value: Value that needs to be evaluated (str , list, dict, int etc)
     :param variables: Variables to be used for Jinja2 templates
@@ -290,13 +496,13 @@ def evaluate_value(value, variables={}, location='/'):
         values that begin with identifier are evaluated.
     :return: Evaluated object.
     """
-    value = copy.deepcopy(value)
     if hasattr(value, 'items'):
         if 'variables' in value:
             variables = evaluate_variables(value['variables'], variables)
-            del(value['variables'])
 
         if 'value' in value:
+            value = copy.deepcopy(value)
+            value.pop('variables', None)
             value.setdefault('encrypted', False)
             value.setdefault('template', True)
             if value['template']:
@@ -312,20 +518,16 @@ def evaluate_value(value, variables={}, location='/'):
             return value
 
         else:
-            if '__defaults__' in value:
-                defaults = value.get('__defaults__')
-                del(value['__defaults__'])
-            else:
-                defaults = None
+            defaults = value.get('__defaults__')
+            evaluated = {}
             for each_k, each_v in value.items():
+                if each_k in ('variables', '__defaults__'):
+                    continue
                 if defaults and hasattr(each_v, 'items'):
-                    each_v = dict_merge(each_v, defaults)
-                value[each_k] = evaluate_value(each_v, variables,
-                                               '%s%s/' % (location, each_k))
-            return {
-                each_k: evaluate_value(each_v, variables)
-                for each_k, each_v in value.items()
-            }
+                    each_v = dict_merge_shared(each_v, defaults)
+                evaluated[each_k] = evaluate_value(
+                    each_v, variables, '%s%s/' % (location, each_k))
+            return evaluated
 
     elif isinstance(value, (list, tuple, set, types.GeneratorType)):
         return [evaluate_value(each_v, variables, '%s[]/' % (location, ))
@@ -393,8 +595,10 @@ def evaluate_config(config, default_variables={}, var_key='variables'):
         updated_config['deployers'][deployer_name]['variables']\
             .setdefault('deployer', deployer_name)
 
-    updated_config = transform_string_values(
-        evaluate_value(updated_config, default_variables))
+    with metrics.timed('config.evaluate'):
+        updated_config = evaluate_value(updated_config, default_variables)
+    with metrics.timed('config.transform'):
+        updated_config = transform_string_values(updated_config)
 
     # Remove all disabled deployers
     for deployer_name, deployer in \
@@ -0,0 +1,56 @@
+"""
+HTTP client for cluster deployer APIs. Uses pooled keep-alive sessions (See
+:mod:`orchestrator.services.http_client`) with explicit connect and read
+timeouts.
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+
+from conf.appconfig import DEPLOYER_HTTP
+from orchestrator.services import http_client
+
+__author__ = 'sukrit'
+
+
+def request(method, url, **kwargs):
+    """
+    Sends the request to the deployer using the pooled session. Default
+    connect and read timeouts (See DEPLOYER_HTTP) are applied if no timeout
+    is specified. Latency and connection reuse is recorded per deployer.
+
+    :param method: HTTP method
+    :type method: str
+    :param url: Deployer url
+    :type url: str
+    :param kwargs: Keyword arguments for :meth:`requests.Session.request`
+    :return: Response with additional attribute connection_reused
+    :rtype: requests.Response
+    :raises requests.exceptions.ConnectTimeout: If connection to deployer
+        could not be established in time (Subclass of ConnectionError)
+    :raises requests.exceptions.ReadTimeout: If deployer did not respond in
+        time
+    """
+    kwargs.setdefault('timeout', (DEPLOYER_HTTP['connect-timeout'],
+                                  DEPLOYER_HTTP['read-timeout']))
+    return http_client.request(
+        method, url, metric_prefix='deployer',
+        pool_maxsize=DEPLOYER_HTTP['pool-max-size'], **kwargs)
+
+
+def post(url, **kwargs):
+    """
+    Sends POST request to the deployer (See :func:`request`).
+    """
+    return request('POST', url, **kwargs)
+
+
+def delete(url, **kwargs):
+    """
+    Sends DELETE request to the deployer (See :func:`request`).
+    """
+    return request('DELETE', url, **kwargs)
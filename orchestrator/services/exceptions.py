@@ -1,5 +1,5 @@
 import json
-from orchestrator.exceptions import BusinessRuleViolation
+from orchestrator.exceptions import BusinessRuleViolation, OrchestratorError
 
 
 class ConfigValueError(BusinessRuleViolation):
@@ -48,3 +48,47 @@ class ConfigParseError(BusinessRuleViolation):
         }
         super(ConfigParseError, self).__init__(message, code=code,
                                                details=details)
+
+
+class JobNotFound(OrchestratorError):
+
+    def __init__(self, job_id, version=None):
+        self.job_id = job_id
+        self.version = version
+        message = 'Job: %s with version: %s was not found' % (job_id, version)
+        details = {
+            'job-id': job_id,
+            'version': version
+        }
+        super(JobNotFound, self).__init__(
+            message, code='JOB_NOT_FOUND', details=details)
+
+
+class JobConflict(OrchestratorError):
+
+    def __init__(self, job_id, revision=None):
+        self.job_id = job_id
+        self.revision = revision
+        message = 'Job: %s was modified concurrently (revision: %s)' % \
+                  (job_id, revision)
+        details = {
+            'job-id': job_id,
+            'revision': revision
+        }
+        super(JobConflict, self).__init__(
+            message, code='JOB_CONFLICT', details=details)
+
+
+class ConfigSnapshotNotFound(OrchestratorError):
+
+    def __init__(self, job_id, digest):
+        self.job_id = job_id
+        self.digest = digest
+        message = 'Config snapshot: %s for job: %s was not found' % \
+                  (digest, job_id)
+        details = {
+            'job-id': job_id,
+            'digest': digest
+        }
+        super(ConfigSnapshotNotFound, self).__init__(
+            message, code='CONFIG_SNAPSHOT_NOT_FOUND', details=details)
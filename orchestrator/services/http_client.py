@@ -0,0 +1,113 @@
+"""
+Pooled HTTP client for external APIs (cluster deployers, notification
+webhooks). Requests for a host are sent using a session (with connection
+pool) that is shared by all the tasks in the worker process, so that
+connections are kept alive and reused across tasks.
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+import os
+import threading
+import time
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+from future.moves.urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+from orchestrator.services import metrics
+
+__author__ = 'sukrit'
+
+DEFAULT_POOL_MAX_SIZE = 10
+
+# Sessions keyed by (pid, base url). Pid is part of the key so that forked
+# worker processes do not share pooled connections.
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _base_url(url):
+    parts = urlsplit(url)
+    return '{}://{}'.format(parts.scheme, parts.netloc)
+
+
+def get_session(url, pool_maxsize=DEFAULT_POOL_MAX_SIZE):
+    """
+    Gets the pooled session for the host serving given url. Session is
+    created if it does not exist for the current process.
+
+    :param url: Request url
+    :type url: str
+    :keyword pool_maxsize: Max no. of pooled connections for the host (used
+        only when the session gets created)
+    :type pool_maxsize: int
+    :return: Session for the host
+    :rtype: requests.Session
+    """
+    key = (os.getpid(), _base_url(url))
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1,
+                                  pool_maxsize=pool_maxsize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[key] = session
+        return session
+
+
+def _connection_pool(session, url):
+    return session.get_adapter(url).poolmanager.connection_from_url(url)
+
+
+def request(method, url, metric_prefix='http',
+            pool_maxsize=DEFAULT_POOL_MAX_SIZE, **kwargs):
+    """
+    Sends the request using the pooled session. Latency and connection reuse
+    is recorded per host (<metric_prefix>.<host>.latency and
+    <metric_prefix>.<host>.connections.{new,reused}).
+
+    :param method: HTTP method
+    :type method: str
+    :param url: Request url
+    :type url: str
+    :keyword metric_prefix: Prefix for the recorded metrics
+    :type metric_prefix: str
+    :keyword pool_maxsize: Max no. of pooled connections for the host
+    :type pool_maxsize: int
+    :param kwargs: Keyword arguments for :meth:`requests.Session.request`
+    :return: Response with additional attribute connection_reused
+    :rtype: requests.Response
+    """
+    host = urlsplit(url).netloc
+    session = get_session(url, pool_maxsize=pool_maxsize)
+    pool = _connection_pool(session, url)
+    connections = pool.num_connections
+    start = time.time()
+    try:
+        response = session.request(method, url, **kwargs)
+    finally:
+        metrics.observe('{}.{}.latency'.format(metric_prefix, host),
+                        time.time() - start)
+    response.connection_reused = pool.num_connections == connections
+    metrics.increment('{}.{}.connections.{}'.format(
+        metric_prefix, host,
+        'reused' if response.connection_reused else 'new'))
+    return response
+
+
+def close_sessions():
+    """
+    Closes all the pooled sessions.
+
+    :return: None
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -5,8 +5,11 @@ All services defined here are synchronous in nature
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 import copy
+import hashlib
+import json
 import uuid
 import etcd
+import repoze.lru
 from future.builtins import (  # noqa
     bytes, dict, int, list, object, range, str,
     ascii, chr, hex, input, next, oct, open,
@@ -14,16 +17,28 @@ from future.builtins import (  # noqa
     filter, map, zip)
 from conf.appconfig import TOTEM_ENV, BOOLEAN_TRUE_VALUES, \
     JOB_STATE_SCHEDULED, JOB_STATE_NEW, CLUSTER_NAME, HOOK_STATUS_PENDING, \
-    HOOK_STATUS_SUCCESS
+    HOOK_STATUS_SUCCESS, TASK_PAYLOAD
 from orchestrator.etcd import using_etcd
+from orchestrator.services.exceptions import JobNotFound, JobConflict
 from orchestrator.services.storage.base import EVENT_NEW_JOB
 from orchestrator.services.storage.factory import get_store
-from orchestrator.util import dict_merge
+from orchestrator.util import dict_merge, dict_merge_shared
 
 __author__ = 'sukrit'
 
 DEFAULT_FREEZE_TTL_SECONDS = 86400
 
+# Job fields that are not part of job version
+VERSION_EXCLUDED_FIELDS = ('modified', '_expiry', 'revision')
+
+# Max attempts for updating a job that is modified concurrently
+MAX_UPDATE_ATTEMPTS = 3
+
+# Jobs keyed by version (for resolving job references)
+_jobs = repoze.lru.LRUCache(TASK_PAYLOAD['cache-max-size'])
+# Versions for which job snapshot was added to the store
+_snapshots = repoze.lru.LRUCache(TASK_PAYLOAD['cache-max-size'])
+
 
 def _app_jobs_base(owner, repo, ref, etcd_base):
     """
@@ -113,6 +128,48 @@ def as_job_meta(owner, repo, ref, commit=None, job_id=None):
     }
 
 
+def _update_job_fields(job, apply_changes):
+    """
+    Applies the changes to the job and persists only the changed fields (See
+    :meth:`AbstractStore.update_job_fields`). If the job was modified
+    concurrently (revision mismatch), the changes are re-applied to the latest
+    job from the store.
+
+    :param job: Job
+    :type job: dict
+    :param apply_changes: Function that applies the changes to the given job
+        (copy) and returns tuple of (updated job, fields to be set, fields to
+        be pushed) or None if the job does not need to be updated.
+    :type apply_changes: function
+    :return: Updated job
+    :rtype: dict
+    :raises JobNotFound: If the job no longer exists in the store
+    :raises JobConflict: If the job could not be updated in
+        MAX_UPDATE_ATTEMPTS
+    """
+    store = get_store()
+    job_id = job['meta-info']['job-id']
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        changes = apply_changes(copy.deepcopy(job))
+        if changes is None:
+            return job
+        job, set_fields, push_fields = changes
+        revision = job.get('revision')
+        if store.update_job_fields(job_id, set_fields=set_fields,
+                                   push_fields=push_fields,
+                                   revision=revision):
+            job['revision'] = (revision or 0) + 1
+            return job
+        job = store.get_job(job_id)
+        if not job:
+            raise JobNotFound(job_id)
+    raise JobConflict(job_id, job.get('revision'))
+
+
+def _hook_field(hook_type, hook_name):
+    return 'hooks.{}.{}'.format(hook_type, hook_name)
+
+
 def reset_hook_status(job):
     job = copy.deepcopy(job)
     job_config = job['config']
@@ -163,19 +220,34 @@ def create_job(job_config, owner, repo, ref, commit=None, force_deploy=False,
     """
     job_id = str(uuid.uuid4())
     store = get_store()
-    existing_jobs = store.filter_jobs(
-        owner=owner, repo=repo, ref=ref,
-        state_in=[JOB_STATE_NEW, JOB_STATE_SCHEDULED])
-    if existing_jobs:
-        job = existing_jobs[0]
-        if commit and commit not in job['meta-info']['git']['commit-set']:
-            job['meta-info']['git']['commit-set'].append(commit)
-            job['meta-info']['git']['commit'] = commit
-            job = reset_hook_status(job)
-            job['config'] = job_config
-        else:
-            # Skip modification to existing job
-            return job
+    job = store.find_active_job(
+        owner, repo, ref, [JOB_STATE_NEW, JOB_STATE_SCHEDULED])
+    if job:
+        def add_commit(existing_job):
+            git_meta = existing_job['meta-info']['git']
+            if not commit or commit in git_meta['commit-set']:
+                # Skip modification to existing job
+                return None
+            git_meta['commit-set'].append(commit)
+            git_meta['commit'] = commit
+            existing_job = reset_hook_status(existing_job)
+            set_fields = {
+                _hook_field(hook_type, hook_name):
+                    existing_job['hooks'][hook_type][hook_name]
+                for hook_type, hooks in
+                existing_job['config']['hooks'].items()
+                for hook_name, hook in hooks.items()
+                if hook.get('enabled', False)
+            }
+            existing_job['config'] = job_config
+            set_fields.update({
+                'meta-info.git.commit': commit,
+                'config': job_config
+            })
+            return existing_job, set_fields, {
+                'meta-info.git.commit-set': commit
+            }
+        return _update_job_fields(job, add_commit)
 
     else:
         job = as_job(job_config, job_id, owner, repo, ref, commit=commit,
@@ -187,11 +259,14 @@ def create_job(job_config, owner, repo, ref, commit=None, force_deploy=False,
         }, search_params)
         store.add_event(EVENT_NEW_JOB,
                         details={
-                            'orchestrator-job': job
+                            # Config is referenced by digest (if config
+                            # snapshots are enabled)
+                            'orchestrator-job': store.compact_job(job)
                         },
                         search_params=search_params)
-    store.update_job(job)
-    return job
+    if not store.update_job(job):
+        raise JobConflict(job['meta-info']['job-id'], job.get('revision'))
+    return dict(job, revision=1)
 
 
 def create_search_parameters(job, defaults=None):
@@ -204,7 +279,7 @@ def create_search_parameters(job, defaults=None):
     :rtype: dict
     """
 
-    job = dict_merge(job or {}, defaults or {}, {
+    job = dict_merge_shared(job or {}, defaults or {}, {
         'meta-info': {
             'job-id': None
         }
@@ -319,10 +394,10 @@ def prepare_job(job, hook_type, hook_name, hook_status=HOOK_STATUS_SUCCESS,
     :return: Updated job
     :rtype: dict
     """
-    job = copy.deepcopy(job)
-    store = get_store()
-
-    if hook_type in job['hooks'] and hook_name in job['hooks'][hook_type]:
+    def apply_hook(job):
+        if hook_type not in job['hooks'] or \
+                hook_name not in job['hooks'][hook_type]:
+            return None
         job['state'] = JOB_STATE_SCHEDULED
 
         # Update hook status if we were expecting this hook
@@ -331,6 +406,12 @@ def prepare_job(job, hook_type, hook_name, hook_status=HOOK_STATUS_SUCCESS,
         }
 
         job['force-deploy'] = force_deploy or False
+        set_fields = {
+            'state': job['state'],
+            _hook_field(hook_type, hook_name):
+                job['hooks'][hook_type][hook_name],
+            'force-deploy': job['force-deploy']
+        }
 
         # Check if image is associated with this hook
         image = get_build_image(hook_name, hook_type, hook_status,
@@ -340,10 +421,14 @@ def prepare_job(job, hook_type, hook_name, hook_status=HOOK_STATUS_SUCCESS,
         if image:
             for deployer in job['config']['deployers'].values():
                 deployer['templates']['app']['args']['image'] = image
+            # Config is set as a whole, as it may be stored as immutable
+            # snapshot (See AbstractStore.compact_job)
+            set_fields['config'] = job['config']
+        return job, set_fields, None
 
-        # Update the job
-        store.update_job(job)
-    return job
+    # Only the changed fields are updated so that concurrent hooks do not
+    # overwrite each other's status
+    return _update_job_fields(copy.deepcopy(job), apply_hook)
 
 
 def get_build_image(hook_name, hook_type, hook_status, hook_result):
@@ -394,3 +479,78 @@ def check_ready(job):
         'failed': failed_hooks,
         'pending': pending_hooks
     }
+
+
+def job_version(job):
+    """
+    Gets the version stamp for the job (digest of the job content excluding
+    modified timestamps).
+
+    :param job: Job
+    :type job: dict
+    :return: Job version (hex digest)
+    :rtype: str
+    """
+    content = {key: value for key, value in job.items()
+               if key not in VERSION_EXCLUDED_FIELDS}
+    return hashlib.sha1(json.dumps(
+        content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def as_job_ref(job):
+    """
+    Creates reference (job-id and version) for the job. Snapshot of the job
+    is added to the store (once per version) so that the reference can be
+    resolved by other workers.
+
+    :param job: Job
+    :type job: dict
+    :return: Job reference
+    :rtype: dict
+    """
+    version = job_version(job)
+    _jobs.put(version, job)
+    if _snapshots.get(version) is None:
+        get_store().add_job_snapshot(version, job)
+        _snapshots.put(version, True)
+    return {
+        'job-id': job['meta-info']['job-id'],
+        'version': version
+    }
+
+
+def get_job_for_ref(job_ref):
+    """
+    Resolves the job reference created using as_job_ref. Job is looked up in
+    worker local cache, followed by job snapshot and the job in the store
+    (if it matches the version).
+
+    :param job_ref: Job reference (or the job itself)
+    :type job_ref: dict
+    :return: Job
+    :rtype: dict
+    """
+    if 'config' in job_ref:
+        # Job was passed in place of reference
+        return job_ref
+    version = job_ref['version']
+    job = _jobs.get(version)
+    if job is None:
+        store = get_store()
+        job = store.get_job_snapshot(version)
+        if job is None:
+            job = store.get_job(job_ref['job-id'])
+            if job is None or job_version(job) != version:
+                raise JobNotFound(job_ref['job-id'], version)
+        _jobs.put(version, job)
+    return copy.deepcopy(job)
+
+
+def clear_cache():
+    """
+    Clears the worker local cache for job references.
+
+    :return: None
+    """
+    _jobs.clear()
+    _snapshots.clear()
@@ -0,0 +1,329 @@
+"""
+In process metrics for orchestrator services. Timings are recorded as
+histograms (per process). Timings and counters can also be collected for a
+single operation using explain.
+
+Metrics of every process (API and celery workers) are published periodically
+to the store (See :class:`MetricsPublisher`), so that these can be aggregated
+across processes (See :func:`merge`).
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from contextlib import contextmanager
+import logging
+import os
+import socket
+import threading
+import time
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+
+__author__ = 'sukrit'
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds (in seconds)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+
+# Bucket upper bounds (in bytes)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+_counters = {}
+_counters_lock = threading.Lock()
+
+# Explain report for current thread (if any)
+_local = threading.local()
+
+
+class Histogram(object):
+    """
+    Thread safe histogram with fixed buckets.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        :keyword buckets: Upper bounds for the buckets
+        :type buckets: tuple
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Records the value in the histogram.
+
+        :param value: Value to be recorded
+        :type value: float
+        :return: None
+        """
+        idx = len(self.buckets)
+        for bucket_idx, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                idx = bucket_idx
+                break
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def to_dict(self):
+        """
+        Gets dictionary representation of the histogram. Bucket counts are
+        cumulative.
+
+        :rtype: dict
+        """
+        with self._lock:
+            counts = list(self.counts)
+            count, total, max_value = self.count, self.sum, self.max
+        cumulative = 0
+        buckets = []
+        for bucket, bucket_count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            buckets.append({'le': bucket, 'count': cumulative})
+        return {
+            'count': count,
+            'sum': total,
+            'max': max_value,
+            'mean': total / count if count else 0.0,
+            'buckets': buckets
+        }
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS):
+    """
+    Records the value in histogram with given name.
+
+    :param name: Name of the histogram
+    :type name: str
+    :param value: Value to be recorded
+    :type value: float
+    :keyword buckets: Buckets used when the histogram gets created.
+    :type buckets: tuple
+    :return: None
+    """
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, Histogram(buckets))
+    histogram.observe(value)
+
+
+def get_histograms():
+    """
+    Gets all histograms recorded in current process.
+
+    :return: Dictionary of histograms (dictionary representation) keyed by
+        name
+    :rtype: dict
+    """
+    with _histograms_lock:
+        histograms = dict(_histograms)
+    return {name: histogram.to_dict()
+            for name, histogram in histograms.items()}
+
+
+def get_counters():
+    """
+    Gets all counters recorded in current process.
+
+    :return: Dictionary of counter values keyed by name
+    :rtype: dict
+    """
+    with _counters_lock:
+        return dict(_counters)
+
+
+def reset():
+    """
+    Removes all recorded histograms and counters.
+
+    :return: None
+    """
+    with _histograms_lock:
+        _histograms.clear()
+    with _counters_lock:
+        _counters.clear()
+
+
+@contextmanager
+def timed(name):
+    """
+    Context manager that records the time taken by the block in histogram
+    with given name (and in explain report if one is active).
+
+    :param name: Name of the stage
+    :type name: str
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        elapsed = time.time() - start
+        observe(name, elapsed)
+        report = getattr(_local, 'report', None)
+        if report is not None:
+            report['stages'].append({'name': name, 'seconds': elapsed})
+
+
+def increment(name, value=1):
+    """
+    Increments the counter with given name (and in active explain report if
+    one is active).
+
+    :param name: Name of the counter
+    :type name: str
+    :keyword value: Increment value
+    :type value: int
+    :return: None
+    """
+    with _counters_lock:
+        _counters[name] = _counters.get(name, 0) + value
+    report = getattr(_local, 'report', None)
+    if report is not None:
+        report['counters'][name] = report['counters'].get(name, 0) + value
+
+
+def snapshot():
+    """
+    Gets the snapshot of histograms and counters recorded in current process.
+
+    :return: Dictionary with keys 'histograms' and 'counters'
+    :rtype: dict
+    """
+    return {
+        'histograms': get_histograms(),
+        'counters': get_counters()
+    }
+
+
+def _merge_histogram(merged, histogram):
+    if merged is None:
+        merged = dict(histogram, buckets=[dict(bucket) for bucket in
+                                          histogram['buckets']])
+    else:
+        merged['count'] += histogram['count']
+        merged['sum'] += histogram['sum']
+        merged['max'] = max(merged['max'], histogram['max'])
+        for bucket, other in zip(merged['buckets'], histogram['buckets']):
+            bucket['count'] += other['count']
+    merged['mean'] = merged['sum'] / merged['count'] if merged['count'] \
+        else 0.0
+    return merged
+
+
+def merge(snapshots):
+    """
+    Aggregates the metric snapshots of multiple processes.
+
+    :param snapshots: List of snapshots (See :func:`snapshot`)
+    :type snapshots: list
+    :return: Aggregated snapshot
+    :rtype: dict
+    """
+    histograms, counters = {}, {}
+    for each_snapshot in snapshots:
+        for name, histogram in each_snapshot['histograms'].items():
+            histograms[name] = _merge_histogram(histograms.get(name),
+                                                histogram)
+        for name, value in each_snapshot['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+    return {
+        'histograms': histograms,
+        'counters': counters
+    }
+
+
+def process_id():
+    """
+    Gets the identifier for current process (used for publishing metrics).
+
+    :rtype: str
+    """
+    return '{}-{}'.format(socket.gethostname(), os.getpid())
+
+
+class MetricsPublisher(object):
+    """
+    Publishes the metrics snapshot of current process periodically (using a
+    daemon thread per process).
+    """
+
+    def __init__(self, publish, interval):
+        """
+        :param publish: Function used for publishing the snapshot (process
+            id, snapshot)
+        :keyword interval: Interval (in seconds) for publishing metrics
+        :type interval: float
+        """
+        self._publish = publish
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """
+        Starts publishing (once per process).
+
+        :return: None
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            publisher = threading.Thread(target=self._publish_periodically,
+                                         name='metrics-publisher')
+            publisher.daemon = True
+            publisher.start()
+
+    def _publish_periodically(self):
+        while True:
+            time.sleep(self.interval)
+            self.publish()
+
+    def publish(self):
+        """
+        Publishes the metrics snapshot of current process.
+
+        :return: None
+        """
+        try:
+            self._publish(process_id(), snapshot())
+        except Exception:
+            logger.exception('Failed to publish metrics')
+
+
+@contextmanager
+def explain():
+    """
+    Context manager that collects stage timings and counters recorded by the
+    current thread inside the block.
+
+    :return: Report with keys 'stages' (list of stage timings in the order of
+        completion) and 'counters'.
+    :rtype: dict
+    """
+    report = {
+        'stages': [],
+        'counters': {}
+    }
+    previous = getattr(_local, 'report', None)
+    _local.report = report
+    try:
+        yield report
+    finally:
+        _local.report = previous
@@ -1,15 +1,110 @@
+import copy
 from functools import wraps
+import hashlib
+import json
 import logging
+import threading
+import repoze.lru
 from encryption.security import decrypt_obj
 from encryption.store.s3 import S3Provider
-from conf.appconfig import ENCRYPTION
+from conf.appconfig import ENCRYPTION, DECRYPT_CACHE
+from orchestrator.services import metrics
 
 logger = logging.getLogger(__name__)
 
+# Decrypted configs (keyed by digest of encrypted config, profile and
+# passphrase). Decrypted values are only held in process memory.
+_decrypted_configs = repoze.lru.ExpiringLRUCache(
+    DECRYPT_CACHE['max-size'], default_timeout=DECRYPT_CACHE['ttl'])
+
+# Key stores keyed by (bucket, base)
+_stores = {}
+_stores_lock = threading.Lock()
+
+_MISSING = object()
+
+
+class CachedKeyStore(object):
+    """
+    Wraps the encryption store and caches the keys loaded from the store (See
+    :meth:`load_key`), so that keys for a security profile are not fetched
+    (e.g. from S3) for every decryption. Cached keys expire after
+    DECRYPT_CACHE['ttl'] seconds. Other store operations are delegated to the
+    store as is.
+    """
+
+    def __init__(self, store, max_size=DECRYPT_CACHE['max-size'],
+                 ttl=DECRYPT_CACHE['ttl']):
+        """
+        :param store: Encryption store (e.g. S3Provider)
+        :keyword max_size: Max no. of cached keys
+        :type max_size: int
+        :keyword ttl: Time to live (in seconds) for cached keys
+        :type ttl: int
+        """
+        self.store = store
+        # Keys loaded for the profile (keyed by load arguments), keyed by
+        # profile
+        self._keys = repoze.lru.ExpiringLRUCache(max_size,
+                                                 default_timeout=ttl)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def load_key(self, profile, *args, **kwargs):
+        """
+        Loads the key for given security profile (using cached key if
+        available).
+
+        :param profile: Security profile
+        :type profile: str
+        :return: Key
+        """
+        profile_keys = self._keys.get(profile)
+        if profile_keys is None:
+            profile_keys = {}
+            self._keys.put(profile, profile_keys)
+        load_args = (args, tuple(sorted(kwargs.items())))
+        key = profile_keys.get(load_args, _MISSING)
+        if key is _MISSING:
+            key = self.store.load_key(profile, *args, **kwargs)
+            profile_keys[load_args] = key
+        return key
+
+    def invalidate(self, profile):
+        """
+        Removes the cached keys for given security profile.
+
+        :param profile: Security profile
+        :type profile: str
+        :return: True if keys were cached for the profile, False otherwise
+        :rtype: bool
+        """
+        if self._keys.get(profile) is None:
+            return False
+        self._keys.invalidate(profile)
+        return True
+
+    def clear(self):
+        """
+        Clears the cached keys.
+
+        :return: None
+        """
+        self._keys.clear()
+
 
 def get_s3_store():
-    return S3Provider(ENCRYPTION['s3']['bucket'],
-                      keys_base=ENCRYPTION['s3']['base'])
+    if not DECRYPT_CACHE['enabled']:
+        return S3Provider(ENCRYPTION['s3']['bucket'],
+                          keys_base=ENCRYPTION['s3']['base'])
+    key = (ENCRYPTION['s3']['bucket'], ENCRYPTION['s3']['base'])
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = CachedKeyStore(S3Provider(
+                ENCRYPTION['s3']['bucket'],
+                keys_base=ENCRYPTION['s3']['base']))
+        return _stores[key]
 
 
 def using_encryption_store(fun):
@@ -27,7 +122,49 @@ def using_encryption_store(fun):
     return outer
 
 
+def _config_digest(config, profile, passphrase):
+    content = json.dumps([config, profile, passphrase], sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _decrypt(config, profile, store, passphrase):
+    try:
+        return decrypt_obj(config, profile=profile, store=store,
+                           passphrase=passphrase)
+    except (KeyError, ValueError):
+        # Raised if the key is missing or does not match the encrypted value.
+        # Cached keys for the profile may have been rotated, hence retry once
+        # using keys from the store.
+        if not isinstance(store, CachedKeyStore) or \
+                not store.invalidate(profile):
+            raise
+        return decrypt_obj(config, profile=profile, store=store,
+                           passphrase=passphrase)
+
+
 @using_encryption_store
 def decrypt_config(config, profile='default', store=None, passphrase=None):
-    return decrypt_obj(config, profile=profile, store=store,
-                       passphrase=passphrase)
+    if not DECRYPT_CACHE['enabled']:
+        return _decrypt(config, profile, store, passphrase)
+    cache_key = _config_digest(config, profile, passphrase)
+    decrypted = _decrypted_configs.get(cache_key)
+    if decrypted is None:
+        metrics.increment('security.decrypt-cache.misses')
+        decrypted = _decrypt(config, profile, store, passphrase)
+        _decrypted_configs.put(cache_key, decrypted)
+    else:
+        metrics.increment('security.decrypt-cache.hits')
+    return copy.deepcopy(decrypted)
+
+
+def clear_cache():
+    """
+    Clears the cached keys and decrypted configs (e.g. after the keys for a
+    security profile are rotated).
+
+    :return: None
+    """
+    _decrypted_configs.clear()
+    with _stores_lock:
+        for store in _stores.values():
+            store.clear()
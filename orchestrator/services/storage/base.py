@@ -1,7 +1,7 @@
 import copy
 import datetime
 import pytz
-from orchestrator.util import dict_merge
+from orchestrator.util import dict_merge_shared
 
 __author__ = 'sukrit'
 
@@ -27,13 +27,51 @@ EVENT_PENDING_HOOK = 'PENDING_HOOK'
 
 class AbstractStore:
 
+    # Buffer for events (See
+    # orchestrator.services.storage.event_buffer.EventBuffer). Events are
+    # written right away if None.
+    event_buffer = None
+
+    # Snapshots for job configs (See
+    # orchestrator.services.storage.config_snapshots.ConfigSnapshots). Jobs
+    # are stored with embedded config if None.
+    config_snapshots = None
+
     @staticmethod
     def apply_modified_ts(job):
-        return dict_merge(
+        return dict_merge_shared(
             {
                 'modified': datetime.datetime.now(tz=pytz.UTC)
             }, job)
 
+    def compact_job(self, job):
+        """
+        Replaces the config of the job with reference to the config snapshot
+        (if config snapshots are enabled for the store).
+
+        :param job: Job
+        :type job: dict
+        :return: Job as stored
+        :rtype: dict
+        """
+        if self.config_snapshots:
+            return self.config_snapshots.compact(job)
+        return job
+
+    def expand_job(self, job):
+        """
+        Replaces the config reference of the job (See :meth:`compact_job`)
+        with the config snapshot.
+
+        :param job: Job as stored
+        :type job: dict
+        :return: Job
+        :rtype: dict
+        """
+        if self.config_snapshots:
+            return self.config_snapshots.expand(job)
+        return job
+
     def not_supported(self):
         """
         Raises NotImplementedError with a message
@@ -44,11 +82,38 @@ class AbstractStore:
 
     def update_job(self, job):
         """
-        Creates/updates a job
+        Creates/updates a job and increments the job revision. Job without
+        revision is created (if it does not exist). Job with revision is
+        replaced only if it was not modified since given revision.
 
         :param job: Dictionary containing job information
         :type job: dict
-        :return: None
+        :return: True if job was created/updated, False otherwise (job already
+            exists or revision did not match)
+        :rtype: bool
+        """
+        self.not_supported()
+
+    def update_job_fields(self, job_id, set_fields=None, push_fields=None,
+                          revision=None):
+        """
+        Updates the given fields of existing job (without replacing the job)
+        and increments the job revision.
+
+        :param job_id: Job id
+        :type job_id: str
+        :keyword set_fields: Values to be set, keyed by dotted field path
+            (e.g. hooks.ci.travis)
+        :type set_fields: dict
+        :keyword push_fields: Values to be appended to list fields, keyed by
+            dotted field path (e.g. meta-info.git.commit-set)
+        :type push_fields: dict
+        :keyword revision: Expected revision of the job. If specified, job is
+            updated only if it was not modified since given revision.
+        :type revision: int
+        :return: True if job was updated, False otherwise (job not found or
+            revision did not match)
+        :rtype: bool
         """
         self.not_supported()
 
@@ -72,6 +137,26 @@ class AbstractStore:
         """
         self.not_supported()
 
+    def find_active_job(self, owner, repo, ref, state_in):
+        """
+        Finds the least recently modified job for given application (owner,
+        repo, ref) in given states.
+
+        :param owner: Repository Owner
+        :type owner: str
+        :param repo: Repository name
+        :type repo: str
+        :param ref: Branch/Tag name
+        :type ref: str
+        :param state_in: Valid job states
+        :type state_in: list
+        :return: Job (as dict) or None if no job is found
+        :rtype: dict
+        """
+        jobs = self.filter_jobs(owner=owner, repo=repo, ref=ref,
+                                state_in=state_in)
+        return jobs[0] if jobs else None
+
     def get_job(self, job_id):
         """
         Gets job by given id
@@ -82,6 +167,30 @@ class AbstractStore:
         """
         self.not_supported()
 
+    def add_job_snapshot(self, digest, job):
+        """
+        Adds immutable snapshot of the job (content addressed by digest). If
+        the snapshot already exists, it is left as is.
+
+        :param digest: Digest of the job content
+        :type digest: str
+        :param job: Job dictionary
+        :type job: dict
+        :return: None
+        """
+        self.not_supported()
+
+    def get_job_snapshot(self, digest):
+        """
+        Gets the job snapshot by digest
+
+        :param digest: Digest of the job content
+        :type digest: str
+        :return: Job dictionary (None if snapshot does not exist)
+        :rtype: dict
+        """
+        self.not_supported()
+
     def update_state(self, job_id, state):
         """
         Update the state of given job
@@ -93,6 +202,29 @@ class AbstractStore:
         """
         self.not_supported()
 
+    def publish_metrics(self, process_id, snapshot):
+        """
+        Stores the metrics snapshot of the process (replacing the snapshot
+        published earlier by the process).
+
+        :param process_id: Process identifier
+        :type process_id: str
+        :param snapshot: Metrics snapshot (See
+            :func:`orchestrator.services.metrics.snapshot`)
+        :type snapshot: dict
+        :return: None
+        """
+        self.not_supported()
+
+    def get_metrics(self):
+        """
+        Gets the metrics snapshots published by all processes.
+
+        :return: List of metrics snapshots
+        :rtype: list
+        """
+        self.not_supported()
+
     def add_event(self, event_type, details=None, search_params=None):
         """
         Adds event to event store
@@ -111,7 +243,63 @@ class AbstractStore:
             'date': datetime.datetime.utcnow(),
             'component': 'orchestrator'
         })
-        self._add_raw_event(event_upd)
+        if self.event_buffer:
+            self.event_buffer.add([event_upd])
+        else:
+            self._add_raw_event(event_upd)
+
+    def add_events(self, events):
+        """
+        Adds multiple events to event store (using single bulk write if
+        supported by the store)
+        :param events: List of events. Each event is a dictionary containing
+            type, details (optional) and search_params (optional)
+        :type events: list
+        :return: None
+        """
+        now = datetime.datetime.utcnow()
+        raw_events = []
+        for event in events:
+            event_upd = copy.deepcopy(event.get('search_params') or {})
+            event_upd.update({
+                'type': event['type'],
+                'details': event.get('details'),
+                'date': now,
+                'component': 'orchestrator'
+            })
+            raw_events.append(event_upd)
+        if not raw_events:
+            return
+        if self.event_buffer:
+            self.event_buffer.add(raw_events)
+        else:
+            self._add_raw_events(raw_events)
+
+    def flush_events(self):
+        """
+        Writes the buffered events (if any) to the store.
+        :return: None
+        """
+        if self.event_buffer:
+            self.event_buffer.flush()
+
+    def recover_events(self):
+        """
+        Writes the events buffered by crashed processes (if any) to the store.
+        :return: None
+        """
+        if self.event_buffer:
+            self.event_buffer.recover()
+
+    def _add_raw_events(self, events):
+        """
+        Adds raw events to store.
+        :param events: List of event details
+        :type events: list
+        :return: None
+        """
+        for event in events:
+            self._add_raw_event(event)
 
     def _add_raw_event(self, event):
         """
@@ -0,0 +1,105 @@
+"""
+Content addressed snapshots for job configs. Evaluated job config is stored
+once per digest (in its own collection) and jobs (and job events) reference
+the config using its digest (config-ref), in place of embedding the config.
+
+Configs are immutable (for a given digest), hence are cached in process.
+"""
+import copy
+import hashlib
+import json
+import repoze.lru
+
+from conf.appconfig import CONFIG_SNAPSHOTS
+from orchestrator.services.exceptions import ConfigSnapshotNotFound
+
+__author__ = 'sukrit'
+
+# Interval (in seconds) at which snapshots in use are re-added to the store,
+# so that their expiry gets extended.
+REFRESH_SECONDS = 3600
+
+
+def config_digest(config):
+    """
+    Gets the digest for the config content.
+
+    :param config: Job config
+    :type config: dict
+    :return: Digest (hex)
+    :rtype: str
+    """
+    return hashlib.sha1(json.dumps(
+        config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ConfigSnapshots(object):
+    """
+    Replaces job config with reference to config snapshot (and vice versa).
+    """
+
+    def __init__(self, add, get, cache_max_size=CONFIG_SNAPSHOTS[
+            'cache-max-size'], refresh_seconds=REFRESH_SECONDS):
+        """
+        :param add: Function used for adding config snapshot (digest, config)
+            to the store. Add must be idempotent.
+        :param get: Function used for getting the config snapshot for given
+            digest from the store (returns None if snapshot does not exist)
+        :keyword cache_max_size: Max no. of cached configs
+        :type cache_max_size: int
+        :keyword refresh_seconds: Interval (in seconds) at which snapshots in
+            use are re-added to the store
+        :type refresh_seconds: int
+        """
+        self.add = add
+        self.get = get
+        self._configs = repoze.lru.LRUCache(cache_max_size)
+        self._added = repoze.lru.ExpiringLRUCache(
+            cache_max_size, default_timeout=refresh_seconds)
+
+    def compact(self, job):
+        """
+        Replaces the config of the job with reference to the config snapshot.
+        Snapshot is added to the store if it was not added recently.
+
+        :param job: Job (or fields of the job)
+        :type job: dict
+        :return: Compacted job (copy)
+        :rtype: dict
+        """
+        if job.get('config') is None:
+            return job
+        job = dict(job)
+        config = job.pop('config')
+        digest = config_digest(config)
+        if self._added.get(digest) is None:
+            self.add(digest, config)
+            self._added.put(digest, True)
+            self._configs.put(digest, copy.deepcopy(config))
+        job['config-ref'] = digest
+        return job
+
+    def expand(self, job):
+        """
+        Replaces the config reference of the job with the config snapshot.
+
+        :param job: Compacted job
+        :type job: dict
+        :return: Job with config (copy)
+        :rtype: dict
+        :raises ConfigSnapshotNotFound: If the referenced snapshot does not
+            exist in the store
+        """
+        if not job or 'config-ref' not in job:
+            return job
+        job = dict(job)
+        digest = job.pop('config-ref')
+        config = self._configs.get(digest)
+        if config is None:
+            config = self.get(digest)
+            if config is None:
+                raise ConfigSnapshotNotFound(
+                    job.get('meta-info', {}).get('job-id'), digest)
+            self._configs.put(digest, config)
+        job['config'] = copy.deepcopy(config)
+        return job
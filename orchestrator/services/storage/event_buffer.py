@@ -0,0 +1,263 @@
+"""
+In process buffer for store events. Buffered events are written to the store
+in bulk, once the buffer reaches max size or max age (and at task
+boundaries, See orchestrator.celery).
+
+Buffered events are also appended to a spool file (per process) so that the
+events are not lost if the process crashes before the flush. Spool files are
+named using a unique id per process and are owned by the process holding the
+lock (flock) on the lock file for that id. The lock is released by the OS
+when the process dies, hence spool files that are not locked are recovered
+(written to the store) by :meth:`EventBuffer.recover`.
+"""
+import errno
+import fcntl
+import glob
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from bson import ObjectId, json_util
+
+from conf.appconfig import EVENT_BUFFER
+from orchestrator.services import metrics
+
+__author__ = 'sukrit'
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds (no. of events)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+_LOCK_PATTERN = re.compile(r'^events-([0-9a-f]+)\.lock$')
+_BATCH_PATTERN = re.compile(r'-(\d+)\.batch$')
+
+
+def _try_lock(fd):
+    """
+    Applies exclusive lock (non blocking) on given file descriptor.
+
+    :return: True if lock was applied else False (locked by another process)
+    :rtype: bool
+    """
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError as error:
+        if error.errno in (errno.EAGAIN, errno.EACCES):
+            return False
+        raise
+    return True
+
+
+def _spool_files(spool_dir, spool_id):
+    # Batches (in order) followed by the active spool
+    batches = glob.glob(os.path.join(
+        spool_dir, 'events-{}-*.batch'.format(spool_id)))
+    return sorted(batches, key=lambda path: int(
+        _BATCH_PATTERN.search(path).group(1))) + glob.glob(os.path.join(
+            spool_dir, 'events-{}.active'.format(spool_id)))
+
+
+def _read_spool(path):
+    events = []
+    with open(path) as spool:
+        for line in spool:
+            try:
+                events.append(json_util.loads(line))
+            except ValueError:
+                # Partially written event (process died while spooling)
+                logger.warn('Skipping invalid event in spool: %s', path)
+    return events
+
+
+class EventBuffer(object):
+    """
+    Thread safe buffer for store events.
+    """
+
+    def __init__(self, write, max_size=EVENT_BUFFER['max-size'],
+                 max_age=EVENT_BUFFER['max-age'],
+                 spool_dir=EVENT_BUFFER['spool-dir']):
+        """
+        :param write: Function used for writing list of events to the store.
+            Write must be idempotent for events with same _id.
+        :keyword max_size: Max no. of buffered events
+        :type max_size: int
+        :keyword max_age: Max time (in seconds) for which events are buffered
+        :type max_age: float
+        :keyword spool_dir: Directory for spool files. If None, events are not
+            spooled.
+        :type spool_dir: str
+        """
+        self.write = write
+        self.max_size = max_size
+        self.max_age = max_age
+        self.spool_dir = spool_dir
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._owner = None
+        self._reset()
+
+    def _reset(self):
+        # State is per process (buffer is not shared with forked processes)
+        self._pid = os.getpid()
+        self._spool_id = uuid.uuid4().hex
+        if self._owner is not None:
+            # Lock is retained by the parent process
+            self._owner.close()
+            self._owner = None
+        self._events = []
+        self._spool = None
+        # Batches that are yet to be written: List of (spool path, events)
+        self._pending = []
+        self._seq = 0
+        self._timer = None
+
+    def _spool_path(self, suffix):
+        return os.path.join(self.spool_dir, 'events-{}{}'.format(
+            self._spool_id, suffix))
+
+    def _own_spool(self):
+        # Lock is held for the lifetime of the process
+        if self._owner is None:
+            if not os.path.isdir(self.spool_dir):
+                os.makedirs(self.spool_dir)
+            self._owner = open(self._spool_path('.lock'), 'a')
+            fcntl.flock(self._owner, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _spool_event(self, event):
+        if not self.spool_dir:
+            return
+        if self._spool is None:
+            self._own_spool()
+            self._spool = open(self._spool_path('.active'), 'a')
+        self._spool.write(json_util.dumps(event) + '\n')
+        self._spool.flush()
+
+    def _start_timer(self):
+        def _flush_periodically():
+            while True:
+                time.sleep(self.max_age)
+                self.flush()
+        self._timer = threading.Thread(target=_flush_periodically,
+                                       name='event-buffer-flush')
+        self._timer.daemon = True
+        self._timer.start()
+
+    def add(self, events):
+        """
+        Adds the events to the buffer. Buffer gets flushed if it reaches max
+        size.
+
+        :param events: List of raw events
+        :type events: list
+        :return: None
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._timer is None:
+                self._start_timer()
+            for event in events:
+                # Ids are assigned upfront so that retried writes are
+                # idempotent
+                event.setdefault('_id', ObjectId())
+                self._spool_event(event)
+                self._events.append(event)
+            full = len(self._events) >= self.max_size
+        if full:
+            self.flush()
+
+    def _next_batch(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if not self._events:
+                return
+            path = None
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+                self._seq += 1
+                path = self._spool_path('-{}.batch'.format(self._seq))
+                os.rename(self._spool_path('.active'), path)
+            self._pending.append((path, self._events))
+            self._events = []
+
+    def flush(self):
+        """
+        Writes the buffered events (and the batches that failed earlier) to
+        the store.
+
+        :return: No. of events written
+        :rtype: int
+        """
+        written = 0
+        with self._flush_lock:
+            self._next_batch()
+            while self._pending:
+                path, events = self._pending[0]
+                start = time.time()
+                try:
+                    self.write(events)
+                except Exception:
+                    # Batch stays pending (and spooled) for next flush
+                    logger.exception('Failed to write %d events',
+                                     len(events))
+                    metrics.increment('events.flush.failed')
+                    break
+                metrics.observe('events.flush.latency', time.time() - start)
+                metrics.observe('events.flush.size', len(events),
+                                buckets=BATCH_BUCKETS)
+                self._pending.pop(0)
+                if path:
+                    os.remove(path)
+                written += len(events)
+        return written
+
+    def _adopt(self, spool_id):
+        for path in _spool_files(self.spool_dir, spool_id):
+            self._seq += 1
+            adopted = self._spool_path('-{}.batch'.format(self._seq))
+            os.rename(path, adopted)
+            events = _read_spool(adopted)
+            metrics.increment('events.recovered', len(events))
+            self._pending.append((adopted, events))
+
+    def recover(self):
+        """
+        Adopts the spool files of dead processes (spool files that are not
+        locked) and writes the spooled events to the store.
+
+        :return: No. of events written
+        :rtype: int
+        """
+        if not self.spool_dir:
+            return 0
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            for path in sorted(glob.glob(
+                    os.path.join(self.spool_dir, 'events-*.lock'))):
+                match = _LOCK_PATTERN.match(os.path.basename(path))
+                if not match or match.group(1) == self._spool_id:
+                    continue
+                try:
+                    fd = os.open(path, os.O_RDWR)
+                except OSError:
+                    # Adopted by another process
+                    continue
+                try:
+                    if _try_lock(fd):
+                        self._own_spool()
+                        self._adopt(match.group(1))
+                        os.remove(path)
+                except OSError:
+                    # Adopted by another process
+                    continue
+                finally:
+                    os.close(fd)
+        return self.flush()
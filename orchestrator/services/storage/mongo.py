@@ -1,18 +1,28 @@
 import datetime
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import pymongo
 import pytz
 from conf.appconfig import MONGODB_URL, MONGODB_JOB_COLLECTION, \
-    MONGODB_DB, MONGODB_EVENT_COLLECTION, \
-    JOB_EXPIRY_SECONDS, EVENT_EXPIRY_SECONDS
+    MONGODB_DB, MONGODB_EVENT_COLLECTION, MONGODB_JOB_SNAPSHOT_COLLECTION, \
+    MONGODB_CONFIG_SNAPSHOT_COLLECTION, MONGODB_METRICS_COLLECTION, \
+    JOB_EXPIRY_SECONDS, EVENT_EXPIRY_SECONDS, EVENT_BUFFER, CONFIG_SNAPSHOTS, \
+    METRICS, MONGODB_POOL
 from orchestrator.services.storage.base import AbstractStore
+from orchestrator.services.storage.config_snapshots import ConfigSnapshots, \
+    REFRESH_SECONDS
+from orchestrator.services.storage.event_buffer import EventBuffer
 
 __author__ = 'sukrit'
 
 
 def create(url=MONGODB_URL, dbname=MONGODB_DB,
            job_coll=MONGODB_JOB_COLLECTION,
-           event_coll=MONGODB_EVENT_COLLECTION
+           event_coll=MONGODB_EVENT_COLLECTION,
+           job_snapshot_coll=MONGODB_JOB_SNAPSHOT_COLLECTION,
+           config_snapshot_coll=MONGODB_CONFIG_SNAPSHOT_COLLECTION,
+           metrics_coll=MONGODB_METRICS_COLLECTION,
+           pool_settings=MONGODB_POOL
            ):
     """
     Creates Instance of MongoStore
@@ -24,10 +34,61 @@ def create(url=MONGODB_URL, dbname=MONGODB_DB,
     :type job_coll: str
     :keyword event_coll: Totem Event Collection name
     :type event_coll: str
+    :keyword job_snapshot_coll: Orchestrator Job Snapshot Collection name
+    :type job_snapshot_coll: str
+    :keyword config_snapshot_coll: Orchestrator Config Snapshot Collection
+        name
+    :type config_snapshot_coll: str
+    :keyword metrics_coll: Orchestrator Metrics Collection name
+    :type metrics_coll: str
+    :keyword pool_settings: Connection pool settings (See MONGODB_POOL)
+    :type pool_settings: dict
     :return: Instance of MongoStore
     :rtype: MongoStore
     """
-    return MongoStore(url, dbname, job_coll, event_coll)
+    return configure(MongoStore(url, dbname, job_coll, event_coll,
+                                job_snapshot_coll=job_snapshot_coll,
+                                config_snapshot_coll=config_snapshot_coll,
+                                metrics_coll=metrics_coll,
+                                client_options=client_options(pool_settings)))
+
+
+def client_options(pool_settings):
+    """
+    Gets the mongo client options for given connection pool settings.
+    Settings that are not set (None) are not passed, so that pymongo
+    defaults apply.
+
+    :param pool_settings: Connection pool settings (See MONGODB_POOL)
+    :type pool_settings: dict
+    :return: Keyword arguments for MongoClient
+    :rtype: dict
+    """
+    options = {
+        'maxPoolSize': pool_settings['max-pool-size'],
+        'waitQueueTimeoutMS': pool_settings['wait-queue-timeout-ms'],
+        'serverSelectionTimeoutMS':
+            pool_settings['server-selection-timeout-ms'],
+        'connectTimeoutMS': pool_settings['connect-timeout-ms'],
+    }
+    return {option: int(value) for option, value in options.items()
+            if value is not None}
+
+
+def configure(store):
+    """
+    Attaches event buffer and config snapshots (if enabled) to the store.
+    :param store: Instance of MongoStore
+    :type store: MongoStore
+    :return: Configured store
+    :rtype: MongoStore
+    """
+    if EVENT_BUFFER['enabled']:
+        store.event_buffer = EventBuffer(store._add_raw_events)
+    if CONFIG_SNAPSHOTS['enabled']:
+        store.config_snapshots = ConfigSnapshots(
+            store._add_config_snapshot, store._get_config_snapshot)
+    return store
 
 
 class MongoStore(AbstractStore):
@@ -35,11 +96,19 @@ class MongoStore(AbstractStore):
     Mongo based implementation of store.
     """
 
-    def __init__(self, url, dbname, job_coll, event_coll):
-        self.client = MongoClient(url, tz_aware=True)
+    def __init__(self, url, dbname, job_coll, event_coll,
+                 job_snapshot_coll=MONGODB_JOB_SNAPSHOT_COLLECTION,
+                 config_snapshot_coll=MONGODB_CONFIG_SNAPSHOT_COLLECTION,
+                 metrics_coll=MONGODB_METRICS_COLLECTION,
+                 client_options=None):
+        self.client = MongoClient(url, tz_aware=True,
+                                  **(client_options or {}))
         self.dbname = dbname
         self.job_coll = job_coll
         self.event_coll = event_coll
+        self.job_snapshot_coll = job_snapshot_coll
+        self.config_snapshot_coll = config_snapshot_coll
+        self.metrics_coll = metrics_coll
 
     def setup(self):
         """
@@ -71,12 +140,61 @@ class MongoStore(AbstractStore):
 
             ], name='git_idx')
 
+        if 'active_job_idx' not in idxs:
+            self._jobs.create_index([
+                ('meta-info.git.owner', pymongo.ASCENDING),
+                ('meta-info.git.repo', pymongo.ASCENDING),
+                ('meta-info.git.ref', pymongo.ASCENDING),
+                ('state', pymongo.ASCENDING),
+                ('modified', pymongo.ASCENDING),
+            ], name='active_job_idx')
+
         event_idxs = self._events.index_information()
         if 'expiry_idx' not in event_idxs:
             self._events.create_index(
                 [('_expiry', pymongo.DESCENDING)], name='expiry_idx',
                 background=True, expireAfterSeconds=EVENT_EXPIRY_SECONDS)
 
+        snapshot_idxs = self._job_snapshots.index_information()
+        if 'digest_idx' not in snapshot_idxs:
+            self._job_snapshots.create_index(
+                'digest', name='digest_idx', unique=True)
+
+        if 'expiry_idx' not in snapshot_idxs:
+            self._job_snapshots.create_index(
+                [('_expiry', pymongo.DESCENDING)], name='expiry_idx',
+                background=True, expireAfterSeconds=JOB_EXPIRY_SECONDS)
+
+        config_idxs = self._config_snapshots.index_information()
+        if 'digest_idx' not in config_idxs:
+            self._config_snapshots.create_index(
+                'digest', name='digest_idx', unique=True)
+
+        # Configs are referenced by both jobs and events. Expiry of snapshot
+        # is extended at most once per refresh interval (See
+        # ConfigSnapshots.compact), hence snapshot must outlive the
+        # referencing documents by the refresh interval.
+        config_expiry = max(JOB_EXPIRY_SECONDS, EVENT_EXPIRY_SECONDS) + \
+            REFRESH_SECONDS
+        if 'expiry_idx' not in config_idxs:
+            self._config_snapshots.create_index(
+                [('_expiry', pymongo.DESCENDING)], name='expiry_idx',
+                background=True, expireAfterSeconds=config_expiry)
+        elif config_idxs['expiry_idx'].get('expireAfterSeconds') != \
+                config_expiry:
+            self._db.command(
+                'collMod', self.config_snapshot_coll,
+                index={
+                    'keyPattern': {'_expiry': pymongo.DESCENDING},
+                    'expireAfterSeconds': config_expiry
+                })
+
+        metrics_idxs = self._metrics.index_information()
+        if 'expiry_idx' not in metrics_idxs:
+            self._metrics.create_index(
+                [('_expiry', pymongo.DESCENDING)], name='expiry_idx',
+                background=True, expireAfterSeconds=METRICS['ttl'])
+
     @property
     def _db(self):
         return self.client[self.dbname]
@@ -99,12 +217,78 @@ class MongoStore(AbstractStore):
         """
         return self._db[self.event_coll]
 
+    @property
+    def _job_snapshots(self):
+        """
+        Gets the job snapshot collection reference
+        :return: Job snapshot collection reference
+        :rtype: pymongo.collection.Collection
+        """
+        return self._db[self.job_snapshot_coll]
+
+    @property
+    def _config_snapshots(self):
+        """
+        Gets the config snapshot collection reference
+        :return: Config snapshot collection reference
+        :rtype: pymongo.collection.Collection
+        """
+        return self._db[self.config_snapshot_coll]
+
+    @property
+    def _metrics(self):
+        """
+        Gets the metrics collection reference
+        :return: Metrics collection reference
+        :rtype: pymongo.collection.Collection
+        """
+        return self._db[self.metrics_coll]
+
     def update_job(self, job):
-        job = self.apply_modified_ts(job)
+        revision = job.get('revision')
+        job = self.apply_modified_ts(self.compact_job(job))
         job['_expiry'] = datetime.datetime.now(tz=pytz.UTC)
-        self._jobs.replace_one({
-            'meta-info.job-id': job['meta-info']['job-id']
-        }, job, upsert=True)
+        job['revision'] = (revision or 0) + 1
+        query = {
+            'meta-info.job-id': job['meta-info']['job-id'],
+            # Job without revision is either new or was created before
+            # revisions were introduced.
+            'revision': revision if revision is not None else {
+                '$exists': False
+            }
+        }
+        try:
+            result = self._jobs.replace_one(query, job,
+                                            upsert=revision is None)
+        except DuplicateKeyError:
+            # Job was created concurrently
+            return False
+        return result.matched_count > 0 or result.upserted_id is not None
+
+    def update_job_fields(self, job_id, set_fields=None, push_fields=None,
+                          revision=None):
+        query = {
+            'meta-info.job-id': job_id
+        }
+        if revision is not None:
+            query['revision'] = revision
+        now = datetime.datetime.now(tz=pytz.UTC)
+        update = {
+            '$set': dict(set_fields or {}, modified=now, _expiry=now),
+            '$inc': {
+                'revision': 1
+            }
+        }
+        if push_fields:
+            update['$push'] = push_fields
+        if set_fields and 'config' in set_fields:
+            update['$set'] = self.compact_job(update['$set'])
+            # Drop the config (or reference) stored earlier
+            update['$unset'] = {
+                'config' if 'config-ref' in update['$set'] else 'config-ref':
+                    ''
+            }
+        return self._jobs.update_one(query, update).matched_count > 0
 
     def update_state(self, job_id, state):
         self._jobs.update_one(
@@ -116,12 +300,15 @@ class MongoStore(AbstractStore):
                     'state': state,
                     'modified': datetime.datetime.now(tz=pytz.UTC),
                     '_expiry': datetime.datetime.now(tz=pytz.UTC)
+                },
+                '$inc': {
+                    'revision': 1
                 }
             }
         )
 
     def get_job(self, job_id):
-        return self._jobs.find_one(
+        return self.expand_job(self._jobs.find_one(
             {
                 'meta-info.job-id': job_id,
             },
@@ -129,7 +316,105 @@ class MongoStore(AbstractStore):
                 '_id': False,
                 '_expiry': False
             }
+        ))
+
+    def add_job_snapshot(self, digest, job):
+        try:
+            self._job_snapshots.update_one(
+                {
+                    'digest': digest
+                },
+                {
+                    '$setOnInsert': {
+                        'digest': digest,
+                        'job': self.compact_job(job),
+                        '_expiry': datetime.datetime.now(tz=pytz.UTC)
+                    }
+                },
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Snapshot was added concurrently
+            pass
+
+    def get_job_snapshot(self, digest):
+        snapshot = self._job_snapshots.find_one(
+            {
+                'digest': digest
+            },
+            projection={
+                '_id': False,
+                'job': True
+            }
+        )
+        return self.expand_job(snapshot['job']) if snapshot else None
+
+    def _add_config_snapshot(self, digest, config):
+        """
+        Adds config snapshot (if it does not exist) and extends its expiry.
+        :param digest: Digest of the config
+        :param config: Job config
+        :return: None
+        """
+        try:
+            self._config_snapshots.update_one(
+                {
+                    'digest': digest
+                },
+                {
+                    '$setOnInsert': {
+                        'digest': digest,
+                        'config': config
+                    },
+                    '$set': {
+                        '_expiry': datetime.datetime.now(tz=pytz.UTC)
+                    }
+                },
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Snapshot was added concurrently
+            pass
+
+    def _get_config_snapshot(self, digest):
+        """
+        Gets the config snapshot for given digest
+        :param digest: Digest of the config
+        :return: Job config (None if snapshot does not exist)
+        """
+        snapshot = self._config_snapshots.find_one(
+            {
+                'digest': digest
+            },
+            projection={
+                '_id': False,
+                'config': True
+            }
         )
+        return snapshot['config'] if snapshot else None
+
+    def publish_metrics(self, process_id, snapshot):
+        # Metric names contain dots, hence are stored as lists
+        self._metrics.replace_one({'_id': process_id}, {
+            'histograms': [dict(histogram, name=name) for name, histogram
+                           in snapshot['histograms'].items()],
+            'counters': [{'name': name, 'value': value} for name, value
+                         in snapshot['counters'].items()],
+            '_expiry': datetime.datetime.now(tz=pytz.UTC)
+        }, upsert=True)
+
+    def get_metrics(self):
+        snapshots = []
+        for doc in self._metrics.find(projection={'_expiry': False}):
+            histograms = {}
+            for histogram in doc['histograms']:
+                histograms[histogram.pop('name')] = histogram
+            snapshots.append({
+                'histograms': histograms,
+                'counters': {counter['name']: counter['value']
+                             for counter in doc['counters']}
+            })
+        return snapshots
 
     def health(self):
         return {
@@ -149,6 +434,41 @@ class MongoStore(AbstractStore):
         """
         self._events.insert_one(event)
 
+    def _add_raw_events(self, events):
+        """
+        Adds events to event store using single unordered bulk write. Events
+        that already exist (same _id) are skipped, so that retried writes are
+        idempotent.
+        :param events: List of events
+        :return: None
+        """
+        try:
+            self._events.insert_many(events, ordered=False)
+        except BulkWriteError as error:
+            if any(write_error['code'] != 11000 for write_error in
+                   error.details.get('writeErrors', [])) or \
+                    error.details.get('writeConcernErrors'):
+                raise
+
+    def _active_jobs(self, owner, repo, ref, state_in):
+        """
+        Gets the cursor for active jobs of the application (served using
+        active_job_idx, including the sort)
+        :rtype: pymongo.cursor.Cursor
+        """
+        return self._jobs.find({
+            'meta-info.git.owner': owner,
+            'meta-info.git.repo': repo,
+            'meta-info.git.ref': ref,
+            'state': {
+                '$in': state_in
+            }
+        }, projection={'_id': False}).sort('modified').limit(1)
+
+    def find_active_job(self, owner, repo, ref, state_in):
+        return self.expand_job(
+            next(iter(self._active_jobs(owner, repo, ref, state_in)), None))
+
     def filter_jobs(self, owner=None, repo=None, ref=None, commit=None,
                     state_in=None):
         u_filter = {}
@@ -174,7 +494,7 @@ class MongoStore(AbstractStore):
         }
 
         return [
-            job for job in
+            self.expand_job(job) for job in
             self._jobs.find(u_filter, projection=projection)
                 .sort('modified')
         ]
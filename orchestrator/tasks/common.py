@@ -1,10 +1,11 @@
-from celery import Task, group
+from celery import group, signature
+from celery.result import AsyncResult
 from conf.appconfig import TASK_SETTINGS
-from orchestrator.celery import app
+from orchestrator.celery import app, OrchestratorTask
 from orchestrator.tasks.util import simple_result, TaskNotReadyException
 
 
-class ErrorHandlerTask(Task):
+class ErrorHandlerTask(OrchestratorTask):
     abstract = True
 
     def on_failure(self, exc, task_id, args, kwargs, einfo):
@@ -13,13 +14,59 @@ class ErrorHandlerTask(Task):
             group(error_tasks).delay(exc)
 
 
+def continue_with(task, sig, **options):
+    """
+    Continues the current task using given signature. Callbacks (e.g. next
+    task in the chain) and errbacks of the current task are moved to the
+    signature, so that these get invoked when the signature completes rather
+    than when the current task returns. If the callback is async_wait, it is
+    also invoked (with the failed result) when the signature fails, so that
+    async_wait is resolved without polling.
+
+    :param task: Current task (bound)
+    :type task: celery.Task
+    :param sig: Signature to continue with
+    :type sig: celery.canvas.Signature
+    :param options: Options for applying the signature
+    :return: Result for the applied signature
+    :rtype: celery.result.AsyncResult
+    """
+    request = task.request
+    callbacks, errbacks = request.callbacks or [], request.errbacks or []
+    request.callbacks, request.errbacks = None, None
+    for callback in callbacks:
+        callback = signature(callback, app=app)
+        sig.link(callback)
+        if callback.task == async_wait.name:
+            sig.link_error(_notify_failure.s(callback))
+    for errback in errbacks:
+        sig.link_error(errback)
+    return sig.apply_async(**options)
+
+
+@app.task
+def _notify_failure(task_id, callback):
+    """
+    Errback that invokes the callback with the result of the failed task.
+
+    :param task_id: Id of the failed task
+    :type task_id: str
+    :param callback: Callback signature
+    :type callback: dict
+    :return: None
+    """
+    signature(callback, app=app).delay(AsyncResult(task_id, app=app))
+
+
 @app.task(bind=True, base=ErrorHandlerTask)
 def async_wait(self, result,
                default_retry_delay=TASK_SETTINGS['DEFAULT_RETRY_DELAY'],
                max_retries=TASK_SETTINGS['DEFAULT_RETRIES'],
                ret_value=None, error_tasks=None):
     """
-    Performs asynchronous wait for result. It uses retry approach for result
+    Performs asynchronous wait for result. Tasks that continue the work
+    using continue_with invoke async_wait once the work completes. For
+    results that are not ready yet, it uses retry approach for result
     to be available rather calling get() . This way the trask do not directly
     wait for wach other
 
@@ -1,16 +1,19 @@
 import copy
 import json
 import logging
-import requests
 from celery import chain, chord, group
-from requests.exceptions import ConnectionError
+from gevent.pool import Pool
+from requests.exceptions import ConnectionError, ReadTimeout
 from conf.appconfig import TASK_SETTINGS, \
     JOB_STATE_COMPLETE, JOB_STATE_NOOP, \
     DEFAULT_DEPLOYER_URL, CONFIG_PROVIDERS, LEVEL_FAILED, LEVEL_STARTED, \
-    LEVEL_SUCCESS, TOTEM_ENV, JOB_STATE_FAILED, HOOK_STATUS_SUCCESS
+    LEVEL_SUCCESS, TOTEM_ENV, JOB_STATE_FAILED, HOOK_STATUS_SUCCESS, \
+    APP_QUEUE, HOOK_SETTINGS, TASK_PAYLOAD, DEPLOY_FANOUT
 from orchestrator.services import job as job_service
 from orchestrator.celery import app
 from orchestrator.services import config
+from orchestrator.services import deployer_client
+from orchestrator.services.app_queue import AppQueueService, coalesce
 from orchestrator.services.distributed_lock import LockService, \
     ResourceLockedException
 from orchestrator.services.job import as_job_meta, create_job, \
@@ -27,8 +30,9 @@ from orchestrator.services.storage.base import \
     EVENT_PENDING_HOOK, \
     EVENT_SETUP_APPLICATION_COMPLETE, EVENT_UNDEPLOY_REQUESTED, \
     EVENT_COMMIT_IGNORED, EVENT_HOOK_IGNORED
-from orchestrator.tasks.common import async_wait, ErrorHandlerTask
-from orchestrator.util import dict_merge
+from orchestrator.tasks.common import async_wait, ErrorHandlerTask, \
+    continue_with
+from orchestrator.util import dict_merge_shared
 
 __author__ = 'sukrit'
 
@@ -57,7 +61,8 @@ def _load_job_config(owner, repo, ref, notify_ctx, search_params, commit=None):
     template_vars = get_template_variables(owner, repo, ref, commit=commit,)
     try:
         return config.load_config(
-            TOTEM_ENV, owner, repo, ref, default_variables=template_vars)
+            TOTEM_ENV, owner, repo, ref, default_variables=template_vars,
+            commit=commit)
     except BaseException as exc:
         _handle_job_error.si(exc, CONFIG_PROVIDERS['default']['config'],
                              notify_ctx, search_params).delay()
@@ -170,7 +175,7 @@ def _new_job(job_config, owner, repo, ref, hook_type, hook_name,
 @app.task
 def handle_callback_hook(owner, repo, ref, hook_type, hook_name,
                          hook_status='success', hook_result=None, commit=None,
-                         force_deploy=False):
+                         force_deploy=False, debounce=True):
     """
     Task that handles the processing of a callback hook from CI, SCM or builder
 
@@ -193,8 +198,104 @@ def handle_callback_hook(owner, repo, ref, hook_type, hook_name,
     :type commit: str
     :keyword force_deploy: Flag controlling Force deploy
     :type hook_result: bool
+    :keyword debounce: If True and debounce window is configured
+        (HOOK_DEBOUNCE_WINDOW), the hook is buffered and processed along with
+        other hooks received for the ref within the window.
+    :type debounce: bool
     :return: Task result
     """
+    hook = {
+        'hook_type': hook_type,
+        'hook_name': hook_name,
+        'hook_status': hook_status,
+        'hook_result': hook_result,
+        'commit': commit,
+        'force_deploy': force_deploy
+    }
+    if debounce and HOOK_SETTINGS['debounce-window'] > 0:
+        return _debounce_hook(owner, repo, ref, hook)
+    return _process_hooks(owner, repo, ref, [hook])
+
+
+def _debounce_hook(owner, repo, ref, hook):
+    """
+    Buffers the hook for given ref. The first hook in the debounce window
+    schedules the flush for the buffered hooks.
+
+    :return: Task result for the flush (if scheduled by this hook) else None
+    """
+    name = '{}-{}-{}-{}'.format(TOTEM_ENV, owner, repo, ref)
+    window = HOOK_SETTINGS['debounce-window']
+    AppQueueService(queue_base='/orchestrator/queues/hooks').enqueue(
+        name, hook)
+    try:
+        marker = LockService(lock_base='/orchestrator/locks/hooks',
+                             lock_ttl=window + 60).apply_lock(name)
+    except ResourceLockedException:
+        # Flush is already scheduled for the window
+        return None
+    return _flush_hooks.si(owner, repo, ref, marker).apply_async(
+        countdown=window)
+
+
+@app.task
+def _flush_hooks(owner, repo, ref, marker):
+    """
+    Processes the hooks buffered during the debounce window as a single
+    batch.
+
+    :param marker: Lock applied by the hook that scheduled the flush
+    :type marker: dict
+    :return: Task result
+    """
+    name = '{}-{}-{}-{}'.format(TOTEM_ENV, owner, repo, ref)
+    # Hooks received from here on get buffered for the next window
+    LockService(lock_base='/orchestrator/locks/hooks').release(marker)
+    hooks = AppQueueService(queue_base='/orchestrator/queues/hooks').drain(
+        name)
+    if not hooks:
+        return None
+    return _process_hooks(owner, repo, ref, hooks)
+
+
+def _latest_commit(hooks):
+    return next((hook['commit'] for hook in reversed(hooks) if hook['commit']),
+                None)
+
+
+def _latest_hooks(owner, repo, ref, hooks):
+    """
+    Coalesces the hooks to the latest commit (recording superseded commits)
+    and retains only the latest hook for given hook type and name.
+
+    :return: Retained hooks (in order)
+    :rtype: list
+    """
+    hooks, superseded = coalesce(hooks)
+    if superseded:
+        _ignore_superseded_commits(
+            owner, repo, ref, [hook['commit'] for hook in superseded],
+            _latest_commit(hooks))
+    latest = {}
+    for hook in hooks:
+        latest[(hook['hook_type'], hook['hook_name'])] = hook
+    return [hook for hook in hooks
+            if latest[(hook['hook_type'], hook['hook_name'])] is hook]
+
+
+def _process_hooks(owner, repo, ref, hooks):
+    """
+    Processes the callback hooks received for the ref. Job config is loaded
+    once for the latest commit and the jobs are created / updated for the
+    hooks (in order) using a single application lock.
+
+    :param hooks: List of hooks (dictionary with keys hook_type, hook_name,
+        hook_status, hook_result, commit, force_deploy)
+    :type hooks: list
+    :return: Task result
+    """
+    hooks = _latest_hooks(owner, repo, ref, hooks)
+    commit = _latest_commit(hooks)
     notify_ctx = as_notify_ctx(owner, repo, ref, commit=commit,
                                operation='handle_callback_hook')
     # Create default search parameters
@@ -202,10 +303,12 @@ def handle_callback_hook(owner, repo, ref, hook_type, hook_name,
     job_config = _load_job_config(owner, repo, ref, notify_ctx, search_params,
                                   commit=commit)
 
-    # Create a notification for receiving webhook
+    # Create a notification for receiving webhook(s)
     notify.si(
-        {'message': 'Received webhook {0}/{1} with status {2}'.format(
-            hook_type, hook_name, hook_status)},
+        {'message': 'Received webhook {}'.format(', '.join(
+            '{0}/{1} with status {2}'.format(
+                hook['hook_type'], hook['hook_name'], hook['hook_status'])
+            for hook in hooks))},
         ctx=notify_ctx, level=LEVEL_STARTED,
         notifications=job_config.get('notifications'),
         security_profile=job_config['security']['profile']
@@ -217,27 +320,116 @@ def handle_callback_hook(owner, repo, ref, hook_type, hook_name,
     # add_search_event,_using_lock tasks to update job state,
     # send notifications and update job events.
 
-    get_store().add_event(EVENT_CALLBACK_HOOK,
-                          details={
-                              'hook': as_callback_hook(
-                                  hook_name, hook_type, hook_status,
-                                  force_deploy)
-                          },
-                          search_params=search_params)
-
+    store = get_store()
+    for hook in hooks:
+        store.add_event(EVENT_CALLBACK_HOOK,
+                        details={
+                            'hook': as_callback_hook(
+                                hook['hook_name'], hook['hook_type'],
+                                hook['hook_status'], hook['force_deploy'])
+                        },
+                        search_params=as_job_meta(
+                            owner, repo, ref, commit=hook['commit']))
+
+    if APP_QUEUE['enabled']:
+        # Job config is loaded again by the task draining the queue (for the
+        # latest queued commit)
+        queue = AppQueueService()
+        for hook in hooks:
+            queue.enqueue(lock_name, dict(hook, owner=owner, repo=repo,
+                                          ref=ref))
+        return _drain_app_queue.si(lock_name).delay()
+
+    new_jobs = [
+        _new_job.si(job_config, owner, repo, ref, **hook) for hook in hooks
+    ]
     return (
         _using_lock.si(
             name=lock_name,
-            do_task=(
-                _new_job.si(
-                    job_config, owner, repo, ref, hook_type, hook_name,
-                    hook_status=hook_status, hook_result=hook_result,
-                    commit=commit, force_deploy=force_deploy)
-            ),
+            do_task=new_jobs[0] if len(new_jobs) == 1 else chain(new_jobs),
         )
     ).delay()
 
 
+@app.task
+def _drain_app_queue(name):
+    """
+    Processes the hooks queued for the application (in order) while holding
+    the application lock. Hooks for commits other than the latest queued
+    commit are ignored and the job config is loaded once for the latest
+    commit. If the lock is held by another task, the queue gets drained once
+    that lock is released.
+
+    :param name: Name of the application lock / queue
+    :type name: str
+    :return: No. of hooks processed
+    :rtype: int
+    """
+    try:
+        lock = LockService().apply_lock(name)
+    except ResourceLockedException:
+        return 0
+
+    processed = 0
+    queue = AppQueueService()
+    try:
+        while True:
+            hooks, superseded = coalesce(queue.drain(name))
+            if not hooks:
+                break
+            owner, repo, ref = [hooks[-1][key]
+                                for key in ('owner', 'repo', 'ref')]
+            commit = _latest_commit(hooks)
+            if superseded:
+                _ignore_superseded_commits(
+                    owner, repo, ref, [hook['commit'] for hook in superseded],
+                    commit)
+            try:
+                job_config = _load_job_config(
+                    owner, repo, ref,
+                    as_notify_ctx(owner, repo, ref, commit=commit,
+                                  operation='handle_callback_hook'),
+                    as_job_meta(owner, repo, ref, commit=commit),
+                    commit=commit)
+            except BaseException:
+                # Error is already handled by _load_job_config
+                logger.exception('Failed to load job config for queued hooks '
+                                 'of %s', name)
+                continue
+            for hook in hooks:
+                try:
+                    _new_job(job_config, **hook)
+                except BaseException:
+                    # Error is already handled by _new_job
+                    logger.exception('Failed to process queued hook for %s',
+                                     name)
+                processed += 1
+    finally:
+        _release_lock(lock)
+    return processed
+
+
+def _ignore_superseded_commits(owner, repo, ref, commits, latest_commit):
+    """
+    Records a single COMMIT_IGNORED event for the commits superseded by the
+    latest commit.
+    """
+    commits = [commit for idx, commit in enumerate(commits)
+               if commit not in commits[:idx]]
+    get_store().add_event(
+        EVENT_COMMIT_IGNORED,
+        details={
+            'message': '{}: {} {} superseded by {}'.format(
+                'Commit' if len(commits) == 1 else 'Commits',
+                ', '.join(commits), 'was' if len(commits) == 1 else 'were',
+                latest_commit),
+            'commit': commits[-1],
+            'commits': commits
+        },
+        search_params=as_job_meta(owner, repo, ref)
+    )
+
+
 @app.task
 def undeploy(owner, repo, ref):
     """
@@ -330,11 +522,16 @@ def _release_lock(lock):
     :return: True: If lock was released.
             False: Otherwise
     """
-    return LockService().release(lock)
+    released = LockService().release(lock)
+    if APP_QUEUE['enabled'] and lock and \
+            not AppQueueService().is_empty(lock['name']):
+        # Hooks were queued while the lock was held
+        _drain_app_queue.si(lock['name']).delay()
+    return released
 
 
-@app.task(base=ErrorHandlerTask)
-def _handle_hook(job, hook_type, hook_name, hook_status, hook_result,
+@app.task(bind=True, base=ErrorHandlerTask)
+def _handle_hook(self, job, hook_type, hook_name, hook_status, hook_result,
                  error_tasks=None, force_deploy=None):
     job_config = job['config']
     git_meta = job['meta-info']['git']
@@ -360,7 +557,7 @@ def _handle_hook(job, hook_type, hook_name, hook_status, hook_result,
 
     job = prepare_job(job, hook_type, hook_name, hook_status, hook_result,
                       force_deploy=force_deploy)
-    return _check_and_fire_deploy.si(job).delay()
+    return continue_with(self, _check_and_fire_deploy.si(job))
 
 
 def _handle_noop(job):
@@ -386,8 +583,8 @@ def _handle_noop(job):
     return job
 
 
-@app.task
-def _check_and_fire_deploy(job):
+@app.task(bind=True)
+def _check_and_fire_deploy(self, job):
     """
     Validates pre-conditions for deploy (hook status returned successfully)
     and triggers deploy for enabled deployers.
@@ -415,19 +612,31 @@ def _check_and_fire_deploy(job):
     else:
         job_config = job['config']
         deployers = job_config.get('deployers', {})
-        return chord(
-            group(
-                _deploy.si(job, deployer_name)
-                for deployer_name, deployer in deployers.items()
+        # Deploy tasks resolve the job using job reference (if enabled)
+        job_ref = job_service.as_job_ref(job) if TASK_PAYLOAD['job-refs'] \
+            else job
+        if DEPLOY_FANOUT['enabled']:
+            return continue_with(self, _deploy_all.si(job_ref, [
+                deployer_name for deployer_name, deployer in
+                sorted(deployers.items())
                 if deployer.get('enabled') and deployer.get('url')
+            ]))
+        return continue_with(
+            self,
+            chord(
+                group(
+                    _deploy.si(job_ref, deployer_name)
+                    for deployer_name, deployer in deployers.items()
+                    if deployer.get('enabled') and deployer.get('url')
+                ),
+                _job_complete.si(job_ref),
             ),
-            _job_complete.si(job),
-        ).apply_async(interval=TASK_SETTINGS['DEPLOY_WAIT_RETRY_DELAY'])
+            interval=TASK_SETTINGS['DEPLOY_WAIT_RETRY_DELAY'])
 
 
 @app.task
 def _job_complete(job):
-    job = copy.deepcopy(job)
+    job = copy.deepcopy(job_service.get_job_for_ref(job))
     job_id = job['meta-info']['job-id']
     job['state'] = JOB_STATE_COMPLETE
     store = get_store()
@@ -437,10 +646,19 @@ def _job_complete(job):
     return job
 
 
-@app.task(bind=True,
-          default_retry_delay=TASK_SETTINGS['DEPLOY_WAIT_RETRY_DELAY'],
-          max_retries=TASK_SETTINGS['DEPLOY_WAIT_RETRIES'])
-def _deploy(self, job, deployer_name):
+def _deploy_request(job, deployer_name):
+    """
+    Sends the deploy request for the job to the deployer.
+
+    :param job: Dictionary containing job parameters
+    :type job: dict
+    :param deployer_name: Name of the deployer
+    :type deployer_name: str
+    :return: Deploy response (details for DEPLOY_REQUESTED event)
+    :rtype: dict
+    :raises ConnectionError: If deployer could not be reached
+    :raises ReadTimeout: If deployer did not respond in time
+    """
     job_config = job['config']
     deployer = job_config['deployers'][deployer_name]
     deployer_url = deployer.get('url', DEFAULT_DEPLOYER_URL)
@@ -449,7 +667,7 @@ def _deploy(self, job, deployer_name):
         'content-type': 'application/vnd.deployer.app.version.create.v1+json',
         'accept': 'application/vnd.deployer.task.v1+json'
     }
-    meta_info = dict_merge(job['meta-info'], {
+    meta_info = dict_merge_shared(job['meta-info'], {
         'deployer': {
             'name': deployer_name,
             'url': deployer_url
@@ -459,35 +677,27 @@ def _deploy(self, job, deployer_name):
         'meta-info': meta_info,
         'proxy': deployer['proxy'],
         'templates': deployer['templates'],
-        'deployment': dict_merge(deployer['deployment']),
+        'deployment': dict_merge_shared(deployer['deployment']),
         'security': job_config.get('security', {}),
         'notifications': job_config.get('notifications', {}),
         'environment': job_config.get('environment', {}),
         'schedule': job_config.get('schedule', ''),
     }
-    try:
-        response = requests.post(apps_url, data=json.dumps(data),
-                                 headers=headers)
-    except ConnectionError as error:
-        raise self.retry(exc=error)
-
-    search_params = create_search_parameters(job)
-    deploy_response = {
+    response = deployer_client.post(apps_url, data=json.dumps(data),
+                                    headers=headers)
+    return {
         'name': deployer_name,
         'url': apps_url,
         'request': data,
         'response': {'raw': response.text},
-        'status': response.status_code
+        'status': response.status_code,
+        'elapsed': response.elapsed.total_seconds(),
+        'connection-reused': response.connection_reused
     }
-    store = get_store()
-    store.add_event(EVENT_DEPLOY_REQUESTED, details=deploy_response,
-                    search_params=search_params)
-    if response.status_code in (502, 503):
-        raise self.retry(exc=DeploymentFailed(deploy_response))
 
-    if deploy_response['status'] >= 400:
-        raise DeploymentFailed(deploy_response)
 
+def _notify_deploy_requested(job, deploy_response):
+    job_config = job['config']
     git = job['meta-info']['git']
     notify_ctx = as_notify_ctx(git['owner'], git['repo'], git['ref'],
                                commit=git['commit'],
@@ -495,15 +705,121 @@ def _deploy(self, job, deployer_name):
                                operation='deploy')
     notify.si(
         {'message': 'Deployment for {0} requested successfully using url: {1}'
-            .format(deployer_name, apps_url)},
+            .format(deploy_response['name'], deploy_response['url'])},
         ctx=notify_ctx, level=LEVEL_SUCCESS,
         notifications=job_config.get('notifications'),
         security_profile=job_config['security']['profile']
     ).delay()
 
+
+@app.task(bind=True,
+          default_retry_delay=TASK_SETTINGS['DEPLOY_WAIT_RETRY_DELAY'],
+          max_retries=TASK_SETTINGS['DEPLOY_WAIT_RETRIES'])
+def _deploy(self, job, deployer_name):
+    job = job_service.get_job_for_ref(job)
+    try:
+        deploy_response = _deploy_request(job, deployer_name)
+    except ConnectionError as error:
+        # Includes connect timeout. Read timeout is not retried as deployer
+        # may have already accepted the deployment.
+        raise self.retry(exc=error)
+
+    search_params = create_search_parameters(job)
+    store = get_store()
+    store.add_event(EVENT_DEPLOY_REQUESTED, details=deploy_response,
+                    search_params=search_params)
+    if deploy_response['status'] in (502, 503):
+        raise self.retry(exc=DeploymentFailed(deploy_response))
+
+    if deploy_response['status'] >= 400:
+        raise DeploymentFailed(deploy_response)
+
+    _notify_deploy_requested(job, deploy_response)
     return deploy_response
 
 
+def _try_deploy(job, deployer_name):
+    """
+    Sends the deploy request to the deployer.
+
+    :return: Tuple of (deploy response or None if deployer could not be
+        reached, error if deploy request failed else None)
+    :rtype: tuple
+    """
+    try:
+        deploy_response = _deploy_request(job, deployer_name)
+    except (ConnectionError, ReadTimeout) as error:
+        return None, error
+    return deploy_response, DeploymentFailed(deploy_response) \
+        if deploy_response['status'] >= 400 else None
+
+
+def _can_retry_deploy(deploy_response, error):
+    # ReadTimeout is not retried as deployer may have already accepted the
+    # deployment
+    if deploy_response is None:
+        return isinstance(error, ConnectionError)
+    return deploy_response['status'] in (502, 503)
+
+
+@app.task(bind=True)
+def _deploy_all(self, job, deployer_names, errors=None):
+    """
+    Sends the deploy requests to all the deployers concurrently (using
+    gevent pool) and completes the job. This avoids the broker round trips
+    and chord unlock polling for the deploy chord.
+
+    Deployers that could not be reached or are unavailable (502, 503) are
+    retried by retrying the task with backoff (countdown), so that the worker
+    is not held while waiting.
+
+    :param job: Dictionary containing job parameters (or job reference)
+    :param deployer_names: Names of enabled deployers
+    :type deployer_names: list
+    :keyword errors: Errors for the deployers that failed in earlier attempts
+    :type errors: list
+    :return: job
+    """
+    job_ref = job
+    job = job_service.get_job_for_ref(job)
+    results = []
+    if deployer_names:
+        pool = Pool(min(len(deployer_names), DEPLOY_FANOUT['max-workers']))
+        results = pool.map(
+            lambda deployer_name: _try_deploy(job, deployer_name),
+            deployer_names)
+
+    search_params = create_search_parameters(job)
+    get_store().add_events([
+        {
+            'type': EVENT_DEPLOY_REQUESTED,
+            'details': deploy_response,
+            'search_params': search_params
+        } for deploy_response, _ in results if deploy_response is not None
+    ])
+    attempt = self.request.retries or 0
+    errors = list(errors or [])
+    retry_deployers = []
+    for deployer_name, (deploy_response, error) in zip(deployer_names,
+                                                       results):
+        if attempt < DEPLOY_FANOUT['retries'] and \
+                _can_retry_deploy(deploy_response, error):
+            retry_deployers.append(deployer_name)
+        elif error:
+            errors.append(error)
+        else:
+            _notify_deploy_requested(job, deploy_response)
+    if retry_deployers:
+        raise self.retry(
+            args=(job_ref, retry_deployers), kwargs={'errors': errors},
+            countdown=DEPLOY_FANOUT['retry-delay'] *
+            DEPLOY_FANOUT['retry-backoff'] ** attempt,
+            max_retries=DEPLOY_FANOUT['retries'])
+    if errors:
+        raise errors[0]
+    return _job_complete(job_ref)
+
+
 @app.task
 def _undeploy_requested(job_config, owner, repo, ref, search_params,
                         notify_ctx):
@@ -518,21 +834,23 @@ def _undeploy_requested(job_config, owner, repo, ref, search_params,
     ).delay()
 
 
-@app.task(default_retry_delay=TASK_SETTINGS['DEFAULT_RETRY_DELAY'],
+@app.task(bind=True, default_retry_delay=TASK_SETTINGS['DEFAULT_RETRY_DELAY'],
           max_retries=TASK_SETTINGS['DEFAULT_RETRIES'])
-def _undeploy_all(job_config, owner, repo, ref, notify_ctx,
+def _undeploy_all(self, job_config, owner, repo, ref, notify_ctx,
                   search_params=None):
     deployers = job_config.get('deployers', {})
 
-    return chord(
-        group(
-            _undeploy.si(job_config, owner, repo, ref, deployer_name)
-            for deployer_name, deployer in deployers.items()
-            if deployer.get('enabled') and deployer.get('url')
-        ),
-        _undeploy_requested.si(job_config, owner, repo, ref, search_params,
-                               notify_ctx)
-    ).delay()
+    return continue_with(
+        self,
+        chord(
+            group(
+                _undeploy.si(job_config, owner, repo, ref, deployer_name)
+                for deployer_name, deployer in deployers.items()
+                if deployer.get('enabled') and deployer.get('url')
+            ),
+            _undeploy_requested.si(job_config, owner, repo, ref,
+                                   search_params, notify_ctx)
+        ))
 
 
 @app.task(bind=True, default_retry_delay=TASK_SETTINGS['DEFAULT_RETRY_DELAY'],
@@ -543,6 +861,6 @@ def _undeploy(self, job_config, owner, repo, ref, deployer_name):
     app_url = '%s/apps/%s' % (
         deployer.get('url', DEFAULT_DEPLOYER_URL), app_name)
     try:
-        requests.delete(app_url)
-    except ConnectionError as error:
+        deployer_client.delete(app_url)
+    except (ConnectionError, ReadTimeout) as error:
         raise self.retry(exc=error)
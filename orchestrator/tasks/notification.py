@@ -1,6 +1,7 @@
 """
 Tasks for notification
 """
+import hashlib
 import json
 
 import time
@@ -8,17 +9,43 @@ from future.builtins import (  # noqa
     bytes, dict, int, list, object, range, str,
     ascii, chr, hex, input, next, oct, open,
     pow, round, filter, map, zip)
-
-import requests
+from requests.exceptions import RequestException
 
 from conf.appconfig import CONFIG_PROVIDERS, \
     DEFAULT_HIPCHAT_TOKEN, LEVEL_FAILED, DEFAULT_GITHUB_TOKEN, \
-    LEVEL_FAILED_WARN, LEVEL_STARTED, LEVEL_SUCCESS, LEVEL_PENDING
+    LEVEL_FAILED_WARN, LEVEL_STARTED, LEVEL_SUCCESS, LEVEL_PENDING, \
+    NOTIFICATION_SETTINGS, TASK_SETTINGS
 from orchestrator import templatefactory
 from orchestrator.celery import app
+from orchestrator.services import http_client
+from orchestrator.services.app_queue import AppQueueService
+from orchestrator.services.distributed_lock import LockService, \
+    ResourceLockedException
 from orchestrator.services.security import decrypt_config
 from orchestrator.tasks import util
 
+NOTIFICATION_QUEUE_BASE = '/orchestrator/queues/notifications'
+NOTIFICATION_LOCK_BASE = '/orchestrator/locks/notifications'
+
+
+def _post(url, **kwargs):
+    """
+    Posts the notification using pooled session for the notification host.
+
+    :param url: Notification url
+    :type url: str
+    :param kwargs: Keyword arguments for :meth:`requests.Session.request`
+    :return: Response
+    :rtype: requests.Response
+    :raises requests.exceptions.HTTPError: If notification was not accepted
+    """
+    kwargs.setdefault('timeout', (NOTIFICATION_SETTINGS['connect-timeout'],
+                                  NOTIFICATION_SETTINGS['read-timeout']))
+    response = http_client.request('POST', url, metric_prefix='notification',
+                                   **kwargs)
+    response.raise_for_status()
+    return response
+
 
 @app.task
 def notify(obj, ctx=None, level=LEVEL_FAILED,
@@ -38,19 +65,91 @@ def notify(obj, ctx=None, level=LEVEL_FAILED,
         globals().get('notify_%s' % name)
     }
     for name, notification in enabled_notifications.items():
-        globals().get('notify_%s' % name).si(
-            obj, ctx, level, notification, security_profile).delay()
+        if NOTIFICATION_SETTINGS['batch-window'] and name in _DIGESTS:
+            _buffer_notification(name, obj, ctx, level, notification,
+                                 security_profile)
+        else:
+            globals().get('notify_%s' % name).si(
+                obj, ctx, level, notification, security_profile).delay()
 
 
-@app.task
-def notify_hipchat(obj, ctx, level, config, security_profile):
-    config = decrypt_config(config, profile=security_profile)
-    ctx.setdefault('github', True)
+def _notification_target(name, config, security_profile):
+    """
+    Gets the identifier for the target (e.g. Slack webhook) of the given
+    notification config.
+    """
+    digest = hashlib.sha1(json.dumps(
+        [config, security_profile], sort_keys=True).encode('utf-8'))
+    return '{}-{}'.format(name, digest.hexdigest())
+
+
+def _buffer_notification(name, obj, ctx, level, config, security_profile):
+    """
+    Buffers the notification for the target. The first notification in the
+    batch window schedules the flush. Buffered notifications are flushed
+    right away once the batch reaches max size.
+
+    :return: Task result for the flush (if scheduled by this notification)
+        else None
+    """
+    target = _notification_target(name, config, security_profile)
+    window = NOTIFICATION_SETTINGS['batch-window']
+    queue = AppQueueService(queue_base=NOTIFICATION_QUEUE_BASE)
+    queue.enqueue(target, {
+        'obj': util.as_dict(obj),
+        'ctx': ctx or {},
+        'level': level,
+        'date': int(time.time())
+    })
+    if queue.size(target) >= NOTIFICATION_SETTINGS['batch-max-size']:
+        return _flush_notifications.si(
+            name, target, config, security_profile).delay()
+    try:
+        marker = LockService(lock_base=NOTIFICATION_LOCK_BASE,
+                             lock_ttl=window + 60).apply_lock(target)
+    except ResourceLockedException:
+        # Flush is already scheduled for the window
+        return None
+    return _flush_notifications.si(
+        name, target, config, security_profile, marker=marker).apply_async(
+        countdown=window)
+
+
+@app.task(bind=True, default_retry_delay=TASK_SETTINGS['DEFAULT_RETRY_DELAY'],
+          max_retries=TASK_SETTINGS['DEFAULT_RETRIES'])
+def _flush_notifications(self, name, target, config, security_profile,
+                         marker=None, items=None):
+    """
+    Sends the notifications buffered for the target as a single digest. If
+    the digest could not be sent, the task is retried with the drained
+    notifications.
+
+    :param marker: Lock applied by the notification that scheduled the flush
+    :type marker: dict
+    :keyword items: Notifications drained by the earlier attempt (on retry)
+    :type items: list
+    :return: No. of notifications sent
+    :rtype: int
+    """
+    if marker:
+        # Notifications received from here on get buffered for next window
+        LockService(lock_base=NOTIFICATION_LOCK_BASE).release(marker)
+    if items is None:
+        items = AppQueueService(queue_base=NOTIFICATION_QUEUE_BASE).drain(
+            target)
+    if items:
+        try:
+            _DIGESTS[name](items, config, security_profile)
+        except RequestException as error:
+            # Drained notifications are no longer queued
+            raise self.retry(exc=error, kwargs={'items': items})
+    return len(items)
+
+
+def _send_hipchat(config, msg, level):
     base_url = config.get('url') or 'https://api.hipchat.com'
     room_url = '{0}/v2/room/{1}/notification'.format(
         base_url, config.get('room'))
-    msg = templatefactory.render_template(
-        'hipchat.html', notification=util.as_dict(obj), ctx=ctx, level=level)
     headers = {
         'content-type': 'application/json',
         'Authorization': 'Bearer {0}'.format(
@@ -58,31 +157,88 @@ def notify_hipchat(obj, ctx, level, config, security_profile):
     }
     data = {
         'message_format': 'html',
-        'message': msg[:5000],
+        'message': msg,
         'color': config.get('colors', {}).get(str(level), 'gray'),
         'notify': level <= LEVEL_FAILED_WARN
     }
-    requests.post(room_url, data=json.dumps(data),
-                  headers=headers).raise_for_status()
+    _post(room_url, data=json.dumps(data), headers=headers)
 
 
 @app.task
-def notify_slack(obj, ctx, level, config, security_profile):
+def notify_hipchat(obj, ctx, level, config, security_profile):
     config = decrypt_config(config, profile=security_profile)
     ctx.setdefault('github', True)
-    url = config.get('url')
+    msg = templatefactory.render_template(
+        'hipchat.html', notification=util.as_dict(obj), ctx=ctx, level=level)
+    _send_hipchat(config, msg[:5000], level)
+
+
+def _notify_hipchat_digest(items, config, security_profile):
+    """
+    Sends the buffered notifications as single hipchat message. Color is
+    based on the most severe level in the digest.
+    """
+    config = decrypt_config(config, profile=security_profile)
+    msgs = []
+    for item in items:
+        ctx = dict(item['ctx'])
+        ctx.setdefault('github', True)
+        msgs.append(templatefactory.render_template(
+            'hipchat.html', notification=item['obj'], ctx=ctx,
+            level=item['level']))
+    # Max 10000 characters allowed for message
+    _send_hipchat(config, '<br/>'.join(msgs)[:10000],
+                  min(item['level'] for item in items))
+
+
+def _slack_message(obj, ctx, level, config, date):
+    ctx.setdefault('github', True)
     notification = util.as_dict(obj)
     notification['channel'] = config.get('channel')
-    notification['date'] = int(time.time())
-    msg = templatefactory.render_template(
-        'slack.json.jinja', notification=notification, ctx=ctx,
-        level=level)
+    notification['date'] = date
+    return templatefactory.build_slack_message(notification, ctx, level)
+
+
+@app.task
+def notify_slack(obj, ctx, level, config, security_profile):
+    config = decrypt_config(config, profile=security_profile)
+    url = config.get('url')
+    msg = _slack_message(obj, ctx, level, config, int(time.time()))
     headers = {
         'content-type': 'application/json',
     }
     if url:
-        requests.post(url, data=msg, headers=headers)\
-            .raise_for_status()
+        _post(url, data=json.dumps(msg), headers=headers)
+
+
+def _notify_slack_digest(items, config, security_profile):
+    """
+    Sends the buffered notifications as single slack message (one
+    attachment per notification).
+    """
+    config = decrypt_config(config, profile=security_profile)
+    url = config.get('url')
+    if not url:
+        return
+    msg = None
+    for item in items:
+        item_msg = _slack_message(dict(item['obj']), dict(item['ctx']),
+                                  item['level'], config, item['date'])
+        if msg is None:
+            msg = item_msg
+        else:
+            msg['attachments'].extend(item_msg['attachments'])
+    headers = {
+        'content-type': 'application/json',
+    }
+    _post(url, data=json.dumps(msg), headers=headers)
+
+
+# Channels that support sending batched notifications as digest
+_DIGESTS = {
+    'hipchat': _notify_hipchat_digest,
+    'slack': _notify_slack_digest
+}
 
 
 @app.task
@@ -114,8 +270,7 @@ def notify_github(obj, ctx, level, config, security_profile):
             'description': use_desc,
             'context': ctx.get('env', 'local') + '::Orchestrator'
         }
-        requests.post(status_url, data=json.dumps(data),
-                      headers=headers).raise_for_status()
+        _post(status_url, data=json.dumps(data), headers=headers)
     else:
         # Github notification is not sent
         pass
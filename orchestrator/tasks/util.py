@@ -17,6 +17,8 @@ def check_or_raise_task_exception(result):
             raise result.result
         elif isinstance(result.result, ChordError):
             check_or_raise_task_exception(result.parent)
+            # Parent is not known (e.g. result restored using task id)
+            raise TaskExecutionException(result.result, result.traceback)
         else:
             raise TaskExecutionException(result.result, result.traceback)
 
@@ -1,7 +1,124 @@
-from jinja2 import Environment, PackageLoader
+"""
+Rendering for notification messages. Text (html) messages are rendered
+using Jinja templates (compiled templates are cached on disk using bytecode
+cache). Messages for JSON channels (e.g. Slack) are built as dicts, to be
+serialized directly.
+"""
+from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader
+from jinja2.filters import do_truncate
 
-env = Environment(loader=PackageLoader('orchestrator', 'templates'))
+from conf.appconfig import TEMPLATE_SETTINGS, LEVEL_FAILED, \
+    LEVEL_FAILED_WARN, LEVEL_SUCCESS
+from orchestrator.services import metrics
+
+SCHEMA_URL = 'https://github.com/totem/cluster-orchestrator/blob/master/' \
+             'schemas/job-config-v1.json'
+
+SLACK_COLORS = {
+    LEVEL_FAILED: 'danger',
+    LEVEL_FAILED_WARN: 'warning',
+    LEVEL_SUCCESS: 'good'
+}
+
+
+def _bytecode_cache():
+    if not TEMPLATE_SETTINGS['bytecode-cache-enabled']:
+        return None
+    # Defaults to user specific folder in system temp directory
+    return FileSystemBytecodeCache(
+        directory=TEMPLATE_SETTINGS['bytecode-cache-dir'] or None)
+
+
+env = Environment(loader=PackageLoader('orchestrator', 'templates'),
+                  bytecode_cache=_bytecode_cache())
 
 
 def render_template(template, *args, **kwargs):
     return env.get_template(template).render(*args, **kwargs)
+
+
+def precompile():
+    """
+    Compiles all the templates (eagerly), so that the first notification
+    sent by the worker does not pay for template compilation.
+
+    :return: Names of compiled templates
+    :rtype: list
+    """
+    templates = env.list_templates()
+    with metrics.timed('templates.precompile'):
+        for template in templates:
+            env.get_template(template)
+    return templates
+
+
+def _truncate(value, length, killwords=False):
+    # Same as Jinja truncate filter (used by the former slack template), i.e.
+    # cuts at word boundary unless killwords is set and the ellipsis is not
+    # counted in the length.
+    return do_truncate(value or '', length, killwords=killwords)
+
+
+def _slack_footer(ctx):
+    owner, repo, ref = ctx.get('owner'), ctx.get('repo'), ctx.get('ref')
+    ref_name = _truncate(ref, 30, killwords=True) or 'NA'
+    if ctx.get('github'):
+        commit = (ctx.get('commit') or ref or 'NA')[0:7]
+        repo_url = 'https://github.com/{}/{}'.format(owner, repo)
+        return '<https://github.com/{0}|{1}> / <{2}|{3}> / ' \
+               '<{2}/tree/{4}|{5}> / <{2}/commit/{6}|{6}>\n'.format(
+                   owner, owner or 'NA', repo_url, repo or 'NA', ref,
+                   ref_name, commit)
+    return '{}/{}/{}/{}'.format(owner or 'NA', repo or 'NA', ref_name,
+                                (ctx.get('commit') or 'NA')[0:7])
+
+
+def slack_attachment(notification, ctx, level):
+    """
+    Builds the slack message attachment for the notification.
+
+    :param notification: Notification (with message, code and date)
+    :type notification: dict
+    :param ctx: Notification context (git and job meta-info)
+    :type ctx: dict
+    :param level: Notification level
+    :type level: int
+    :return: Slack message attachment
+    :rtype: dict
+    """
+    code = notification.get('code')
+    # Spacing matches the former slack template
+    text = '{}{} {} {}'.format(
+        '{}: '.format(code) if code else '',
+        _truncate(notification.get('message'), 1000),
+        '<{} | Click here to view the job-config-v1 schema.>'.format(
+            SCHEMA_URL) if code == 'CONFIG_VALIDATION_ERROR' else '',
+        '(job-id: {})'.format(ctx['job-id']) if ctx.get('job-id') else '')
+    return {
+        'text': text,
+        'color': SLACK_COLORS.get(level, '#439FE0'),
+        'footer': _slack_footer(ctx),
+        'ts': str(notification.get('date', ''))
+    }
+
+
+def build_slack_message(notification, ctx, level):
+    """
+    Builds the slack message (for slack webhook) for the notification.
+
+    :param notification: Notification (with channel, message, code and date)
+    :type notification: dict
+    :param ctx: Notification context (git and job meta-info)
+    :type ctx: dict
+    :param level: Notification level
+    :type level: int
+    :return: Slack message
+    :rtype: dict
+    """
+    return {
+        'username': 'Orchestrator ({}-{})'.format(
+            ctx.get('env', ''), ctx.get('operation', '')),
+        'channel': notification.get('channel') or '#totem',
+        'text': ' ',
+        'attachments': [slack_attachment(notification, ctx, level)]
+    }
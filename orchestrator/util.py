@@ -49,6 +49,101 @@ def dict_merge(*dictionaries):
     return merged_dict
 
 
+class FrozenDict(dict):
+    """
+    Immutable dictionary. Any attempt to modify the dictionary raises
+    TypeError. Use copy.deepcopy to get a mutable copy.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('{} does not support modification'.format(
+            self.__class__.__name__))
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = \
+        update = _immutable
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+
+def freeze(value):
+    """
+    Creates immutable representation for a given value. Dictionaries are
+    converted to FrozenDict and lists to tuples (recursively). Values that
+    are already frozen are shared.
+
+    :param value: Value to be frozen
+    :return: Frozen value
+    """
+    if isinstance(value, FrozenDict):
+        return value
+    elif isinstance(value, dict):
+        return FrozenDict(
+            (each_k, freeze(each_v)) for each_k, each_v in value.items())
+    elif isinstance(value, (list, tuple)):
+        return tuple(freeze(each_v) for each_v in value)
+    return value
+
+
+def thaw(value):
+    """
+    Creates mutable deep copy for a given (frozen) value.
+
+    :param value: Value to be copied
+    :return: Mutable copy of the value
+    """
+    if isinstance(value, dict):
+        return {each_k: thaw(each_v) for each_k, each_v in value.items()}
+    elif isinstance(value, tuple):
+        return [thaw(each_v) for each_v in value]
+    return copy.deepcopy(value)
+
+
+def dict_merge_shared(*dictionaries, **kwargs):
+    """
+    Performs nested merge of multiple dictionaries (similar to
+    :func:`dict_merge`) without copying the inputs. Only the dictionaries
+    along the paths that change are copied and untouched sub trees are
+    shared with the inputs. Hence the result must not be modified unless
+    frozen is set.
+
+    :param dictionaries: List of dictionaries that needs to be merged.
+    :keyword frozen: If True, result is returned as FrozenDict so that it can
+        not be modified by callers. Defaults to False
+    :type frozen: bool
+    :return: merged dictionary
+    :rtype: dict
+    """
+
+    def merge(source, defaults):
+        # Nested merge requires both source and defaults to be dictionary
+        if not isinstance(source, dict) or not isinstance(defaults, dict):
+            return source
+        merged = None
+        for key, value in defaults.items():
+            if key in source:
+                value = merge(source[key], value)
+                if value is source[key]:
+                    continue
+            if merged is None:
+                # Copy on first change
+                merged = dict(source)
+            merged[key] = value
+        return source if merged is None else merged
+
+    merged_dict = {}
+    for merge_with in dictionaries:
+        merged_dict = merge(merged_dict, merge_with or {})
+
+    return freeze(merged_dict) if kwargs.get('frozen') else merged_dict
+
+
 class TimeoutError(Exception):
     """
     Error corresponding to timeout of a function use with @timeout annotation.
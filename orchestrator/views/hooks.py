@@ -94,7 +94,9 @@ class GenericInternalPostHookApi(MethodView):
             request_data['name'], commit=git.get('commit'),
             hook_status=request_data['status'],
             hook_result=request_data['result'],
-            force_deploy=request_data.get('force-deploy', False))
+            force_deploy=request_data.get('force-deploy', False),
+            # Job is returned synchronously for MIME_JOB_V1
+            debounce=accept_mimetype != MIME_JOB_V1)
         if accept_mimetype == MIME_JOB_V1:
             result = task_client.ready(result.id, wait=True, raise_error=True)
             job = result['output']
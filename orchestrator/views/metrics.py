@@ -0,0 +1,75 @@
+from __future__ import (absolute_import, division,
+                        print_function)
+from flask import request
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+
+from flask.views import MethodView
+from conf.appconfig import TOTEM_ENV
+from orchestrator.services import config
+from orchestrator.services.job import get_template_variables
+from orchestrator.services import metrics
+from orchestrator.services.storage.factory import get_store
+from orchestrator.views.util import build_response
+
+
+class MetricsApi(MethodView):
+    """
+    Metrics API
+    """
+
+    def get(self, **kwargs):
+        """
+        Gets the histograms and counters aggregated across API and worker
+        processes (as published periodically to the store, See
+        METRICS_PUBLISH_INTERVAL). Use query parameter scope=process to get
+        the metrics of the API process serving the request.
+
+        :return: Flask Json Response containing histograms and counters keyed
+            by name.
+        """
+        if request.args.get('scope') == 'process':
+            return build_response(metrics.snapshot())
+        snapshots = get_store().get_metrics()
+        return build_response(dict(metrics.merge(snapshots),
+                                   processes=len(snapshots)))
+
+
+class ConfigExplainApi(MethodView):
+    """
+    API for explaining the config evaluation for a given owner, repo and ref.
+    """
+
+    def get(self, owner, repo, ref):
+        """
+        Loads the job config for given owner, repo and ref and reports the
+        time taken by every stage along with the no. of templates rendered.
+
+        :return: Flask Json Response containing explain report.
+        """
+        commit = request.args.get('commit')
+        template_vars = get_template_variables(owner, repo, ref,
+                                               commit=commit)
+        report = config.explain_config(
+            TOTEM_ENV, owner, repo, ref, default_variables=template_vars,
+            commit=commit)
+        return build_response(report)
+
+
+def register(app, **kwargs):
+    """
+    Registers MetricsApi ('/metrics') and ConfigExplainApi
+    ('/metrics/config/<owner>/<repo>/<ref>').
+    Only GET operation is available.
+
+    :param app: Flask application
+    :return: None
+    """
+    app.add_url_rule('/metrics', view_func=MetricsApi.as_view('metrics'),
+                     methods=['GET'])
+    app.add_url_rule('/metrics/config/<owner>/<repo>/<path:ref>',
+                     view_func=ConfigExplainApi.as_view('config-explain'),
+                     methods=['GET'])
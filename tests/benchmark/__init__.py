@@ -0,0 +1,32 @@
+"""
+Micro benchmarks for orchestrator. Benchmarks are tagged with attribute
+benchmark and are excluded from the default test run. To run benchmarks, use
+command:
+
+    nosetests -s -w tests/benchmark
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+import timeit
+
+__author__ = 'sukrit'
+
+
+def measure(name, func, number=100, repeat=3):
+    """
+    Measures the time taken by given function and prints the best time per
+    call.
+
+    :param name: Name of the benchmark
+    :type name: str
+    :param func: Function to be measured (no args)
+    :param number: No. of calls per measurement
+    :type number: int
+    :param repeat: No. of measurements
+    :type repeat: int
+    :return: Best time per call (in seconds)
+    :rtype: float
+    """
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    print('{0:<60} {1:>12.2f} us/call'.format(name, best * 1e6))
+    return best
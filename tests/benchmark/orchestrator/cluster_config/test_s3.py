@@ -0,0 +1,95 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+import boto
+from boto.s3.key import Key
+from nose.plugins.attrib import attr
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_
+import yaml
+from conf.appconfig import CONFIG_NAMES
+from orchestrator.cluster_config import s3
+from orchestrator.cluster_config.s3 import S3ConfigProvider
+from tests.benchmark import measure
+from tests.benchmark.orchestrator.test_util import _cluster_def, _totem_yml
+
+__author__ = 'sukrit'
+
+"""
+Benchmarks for :mod: `orchestrator.cluster_config.s3` using moto as local
+S3 stand-in (install moto to run these benchmarks).
+"""
+
+BUCKET = 'totem-benchmark'
+CONFIG_BASE = 'totem/config'
+PATHS = ('local', 'totem', 'cluster-orchestrator', 'develop')
+
+
+class UncachedS3ConfigProvider(S3ConfigProvider):
+    """
+    S3ConfigProvider without connection reuse, bucket validation skip and
+    config cache (behavior prior to connection reuse).
+    """
+
+    @staticmethod
+    def _s3_connection():
+        return boto.connect_s3()
+
+    def _s3_bucket(self):
+        return self._s3_connection().get_bucket(self.bucket)
+
+    def _load_key(self, key):
+        return yaml.load(key.get_contents_as_string())
+
+
+@attr(benchmark='true')
+class TestS3ConfigProviderBenchmark:
+    """
+    Compares config load for S3ConfigProvider with and without connection
+    reuse and ETag validated caching.
+    """
+
+    def setup(self):
+        try:
+            from moto import mock_s3_deprecated
+        except ImportError:
+            raise SkipTest('moto is not installed')
+        self.mock = mock_s3_deprecated()
+        self.mock.start()
+        s3._connections.clear()
+        s3.clear_cache()
+        bucket = boto.connect_s3().create_bucket(BUCKET)
+        for paths, name, config in [
+            ((), 'cluster-def.yml', _cluster_def()),
+            (PATHS[:1], 'cluster-def.yml', _cluster_def(16)),
+            (PATHS, 'totem.yml', _totem_yml()),
+        ]:
+            key = Key(bucket)
+            key.key = '/'.join((CONFIG_BASE,) + paths + (name,))
+            key.set_contents_from_string(yaml.dump(config))
+
+    def teardown(self):
+        self.mock.stop()
+        s3._connections.clear()
+
+    def test_load_levels(self):
+        provider = S3ConfigProvider(BUCKET, config_base=CONFIG_BASE)
+        uncached = UncachedS3ConfigProvider(BUCKET, config_base=CONFIG_BASE)
+        eq_(provider.load_levels(CONFIG_NAMES, *PATHS),
+            uncached.load_levels(CONFIG_NAMES, *PATHS))
+        measure('s3 load_levels: uncached',
+                lambda: uncached.load_levels(CONFIG_NAMES, *PATHS), number=20)
+        measure('s3 load_levels: cached',
+                lambda: provider.load_levels(CONFIG_NAMES, *PATHS), number=20)
+
+    def test_load(self):
+        provider = S3ConfigProvider(BUCKET, config_base=CONFIG_BASE)
+        uncached = UncachedS3ConfigProvider(BUCKET, config_base=CONFIG_BASE)
+        measure('s3 load: uncached',
+                lambda: uncached.load('totem.yml', *PATHS), number=20)
+        measure('s3 load: cached',
+                lambda: provider.load('totem.yml', *PATHS), number=20)
@@ -0,0 +1,211 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+import heapq
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from celery import chord, group
+from celery.backends.cache import CacheBackend, DummyClient
+from celery.concurrency.solo import TaskPool
+from celery.signals import task_success
+from celery.utils.timeutils import maybe_make_aware
+from celery.worker.job import Request
+from mock import patch
+from nose.plugins.attrib import attr
+from nose.tools import eq_, ok_
+from conf.appconfig import TASK_SETTINGS
+from orchestrator.celery import app
+from orchestrator.tasks.common import async_wait, continue_with
+
+__author__ = 'sukrit'
+
+"""
+Benchmarks for waiting on job completion (async_wait) using polling vs
+continue_with. Tasks are published to an in-memory broker (memory://
+transport) and executed in process by a single solo pool worker (holding
+the tasks with countdown until due), so that the messages counted are the
+messages actually published to the broker.
+
+Delays are scaled down (See TIME_SCALE) from the task settings. Chords are
+unlocked using celery.chord_unlock (polling) as done for mongodb result
+backend.
+"""
+
+JOBS = 20
+DEPLOYERS = 2
+TIME_SCALE = 0.005
+# Deployer API response time (in seconds, before scaling)
+DEPLOY_TIME = (1, 10)
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Result backend using in-memory cache shared by all backend instances
+    (results restored from the backend create new backend instance).
+    Chord unlock uses polling like mongodb result backend.
+    """
+    implements_incr = False
+    supports_native_join = False
+    client = DummyClient()
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('backend', 'memory')
+        super(MemoryBackend, self).__init__(*args, **kwargs)
+
+
+class MemoryWorker(object):
+    """
+    Executes the tasks published to the in-memory broker using solo pool.
+    Tasks with ETA (countdown) are held till due (like the celery worker).
+    """
+
+    def __init__(self):
+        self.messages = Counter()
+        self.pool = TaskPool()
+        self._scheduled = []
+        self._seq = 0
+
+    def _receive(self, message):
+        request = Request(message.decode(), app=app, message=message)
+        self.messages[request.name.rsplit('.', 1)[-1]] += 1
+        if request.eta:
+            self._seq += 1
+            delay = maybe_make_aware(request.eta) - \
+                maybe_make_aware(app.now())
+            heapq.heappush(self._scheduled, (
+                time.time() + delay.total_seconds(), self._seq, request))
+        else:
+            request.execute_using_pool(self.pool)
+
+    def run(self):
+        """
+        Runs till there are no queued or scheduled tasks.
+        """
+        self.pool.start()
+        with app.connection() as connection:
+            queue = app.amqp.queues[app.conf.CELERY_DEFAULT_QUEUE](
+                connection.default_channel)
+            while True:
+                if self._scheduled and self._scheduled[0][0] <= time.time():
+                    heapq.heappop(self._scheduled)[2].execute_using_pool(
+                        self.pool)
+                    continue
+                message = queue.get(
+                    no_ack=True, accept=app.conf.CELERY_ACCEPT_CONTENT)
+                if message is not None:
+                    self._receive(message)
+                elif self._scheduled:
+                    time.sleep(max(self._scheduled[0][0] - time.time(), 0))
+                else:
+                    break
+        self.pool.stop()
+
+
+@contextmanager
+def _memory_broker():
+    broker_url = app.conf.BROKER_URL
+    app.conf.BROKER_URL = 'memory://'
+    app._maybe_close_pool()
+    try:
+        with patch.object(app, 'backend', MemoryBackend(app=app)), \
+                patch('orchestrator.celery.metrics_publisher'):
+            yield
+    finally:
+        app.conf.BROKER_URL = broker_url
+        app._maybe_close_pool()
+
+
+@app.task(bind=True)
+def _handle_hook(self, job, event_driven):
+    """
+    Stand-in for orchestrator.tasks.job._handle_hook
+    """
+    if event_driven:
+        return continue_with(self, _check_and_fire_deploy.si(job, True))
+    return _check_and_fire_deploy.si(job, False).delay()
+
+
+@app.task(bind=True)
+def _check_and_fire_deploy(self, job, event_driven):
+    """
+    Stand-in for orchestrator.tasks.job._check_and_fire_deploy
+    """
+    deploy = chord(
+        group(_deploy.si(job, deploy_time) for deploy_time in job['deploys']),
+        _job_complete.si(job))
+    interval = TASK_SETTINGS['DEPLOY_WAIT_RETRY_DELAY'] * TIME_SCALE
+    if event_driven:
+        return continue_with(self, deploy, interval=interval)
+    return deploy.apply_async(interval=interval)
+
+
+@app.task
+def _deploy(job, deploy_time):
+    time.sleep(deploy_time)
+    return job['id']
+
+
+@app.task
+def _job_complete(job):
+    return job
+
+
+def _run_jobs(event_driven, seed=0):
+    """
+    Runs JOBS concurrent jobs (_handle_hook -> _check_and_fire_deploy ->
+    deploy chord -> _job_complete) followed by async_wait.
+
+    :return: Tuple of (broker messages per job, mean latency (unscaled),
+        no. of waits that gave up before the job completed, broker messages
+        per task)
+    """
+    rand = random.Random(seed)
+    worker = MemoryWorker()
+    latencies = []
+
+    def _resolved(**kwargs):
+        latencies.append(time.time() - started)
+
+    task_success.connect(_resolved, sender=async_wait)
+    try:
+        with _memory_broker():
+            started = time.time()
+            results = [
+                (_handle_hook.si({
+                    'id': job_id,
+                    'deploys': [rand.uniform(*DEPLOY_TIME) * TIME_SCALE
+                                for _ in range(DEPLOYERS)]
+                }, event_driven) | async_wait.s(
+                    default_retry_delay=TASK_SETTINGS['JOB_WAIT_RETRY_DELAY'] *
+                    TIME_SCALE,
+                    max_retries=TASK_SETTINGS['JOB_WAIT_RETRIES'])).delay()
+                for job_id in range(JOBS)
+            ]
+            worker.run()
+            gave_up = len([result for result in results
+                           if not result.successful()])
+    finally:
+        task_success.disconnect(_resolved, sender=async_wait)
+    return (sum(worker.messages.values()) / JOBS,
+            sum(latencies) / len(latencies) / TIME_SCALE,
+            gave_up,
+            worker.messages)
+
+
+@attr(benchmark='true')
+def test_async_wait_polling_vs_event_driven():
+    polling = _run_jobs(False)
+    event_driven = _run_jobs(True)
+    for name, stats in (('polling', polling), ('event driven', event_driven)):
+        print('{0:<20} {1:>8.2f} msgs/job {2:>8.2f}s mean latency '
+              '{3:>4} gave up {4}'.format(name, *stats))
+    ok_(event_driven[0] < polling[0])
+    eq_(event_driven[2], 0)
+    # async_wait is invoked once per job (no polling)
+    eq_(event_driven[3]['async_wait'], JOBS)
@@ -0,0 +1,114 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+import random
+import time
+import gevent
+from mock import patch
+from nose.plugins.attrib import attr
+from nose.tools import eq_, ok_
+from conf.appconfig import JOB_STATE_COMPLETE
+from orchestrator.tasks import job as job_tasks
+from tests.benchmark.orchestrator.tasks.test_common import MemoryWorker, \
+    DEPLOY_TIME, TIME_SCALE, _memory_broker
+
+__author__ = 'sukrit'
+
+"""
+Benchmarks for deploying to all deployers using deploy chord vs single
+fan-out task (DEPLOY_FANOUT). Uses the in-memory broker and worker (See
+test_common) to run _check_and_fire_deploy with the deploy requests, store
+and notifications mocked.
+"""
+
+JOBS = 20
+
+
+def _run_jobs(deployers, fanout, seed=0):
+    """
+    Runs JOBS concurrent jobs deploying to given no. of deployers.
+
+    :return: Tuple of (broker messages per job, mean latency (unscaled),
+        broker messages per task)
+    """
+    rand = random.Random(seed)
+    worker = MemoryWorker()
+    latencies = []
+    deploy_times = {}
+
+    def _deploy_request(job, deployer_name):
+        # Deploy requests are sent using gevent (monkey patched sockets)
+        gevent.sleep(deploy_times[(job['meta-info']['job-id'],
+                                   deployer_name)])
+        return {
+            'name': deployer_name,
+            'url': job['config']['deployers'][deployer_name]['url'],
+            'status': 202
+        }
+
+    def _job(job_id):
+        for deployer in range(deployers):
+            deploy_times[(job_id, 'deployer{}'.format(deployer))] = \
+                rand.uniform(*DEPLOY_TIME) * TIME_SCALE
+        return {
+            'meta-info': {
+                'job-id': job_id,
+                'git': {
+                    'owner': 'bench-owner',
+                    'repo': 'bench-repo',
+                    'ref': 'bench-ref',
+                    'commit': 'bench-commit'
+                }
+            },
+            'force-deploy': True,
+            'config': {
+                'deployers': {
+                    'deployer{}'.format(deployer): {
+                        'enabled': True,
+                        'url': 'http://deployer{}'.format(deployer)
+                    } for deployer in range(deployers)
+                },
+                'notifications': {},
+                'security': {
+                    'profile': 'default'
+                }
+            }
+        }
+
+    def _update_state(job_id, state):
+        eq_(state, JOB_STATE_COMPLETE)
+        latencies.append(time.time() - started)
+
+    with _memory_broker(), \
+            patch.dict(job_tasks.DEPLOY_FANOUT, {'enabled': fanout}), \
+            patch('orchestrator.tasks.job._deploy_request',
+                  side_effect=_deploy_request), \
+            patch('orchestrator.tasks.job.job_service') as m_job_service, \
+            patch('orchestrator.tasks.job.get_store') as m_get_store, \
+            patch('orchestrator.tasks.job.notify'):
+        m_job_service.get_job_for_ref.side_effect = lambda job: job
+        m_job_service.as_job_ref.side_effect = lambda job: job
+        m_get_store.return_value.update_state.side_effect = _update_state
+        started = time.time()
+        for job_id in range(JOBS):
+            job_tasks._check_and_fire_deploy.si(_job(job_id)).delay()
+        worker.run()
+    eq_(len(latencies), JOBS)
+    return (sum(worker.messages.values()) / JOBS,
+            sum(latencies) / len(latencies) / TIME_SCALE,
+            worker.messages)
+
+
+@attr(benchmark='true')
+def test_deploy_chord_vs_fanout():
+    for deployers in (1, 2, 3):
+        chord = _run_jobs(deployers, False)
+        fanout = _run_jobs(deployers, True)
+        for name, stats in (('chord', chord), ('fan-out', fanout)):
+            print('{0:<10} {1} deployers {2:>8.2f} msgs/job {3:>8.2f}s mean '
+                  'latency {4}'.format(name, deployers, *stats))
+        ok_(fanout[0] < chord[0])
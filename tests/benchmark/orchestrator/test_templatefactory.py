@@ -0,0 +1,121 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+import json
+import shutil
+import tempfile
+import time
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader
+from nose.plugins.attrib import attr
+from nose.tools import eq_, ok_
+from conf.appconfig import LEVEL_FAILED
+from orchestrator import templatefactory
+from tests.benchmark import measure
+
+__author__ = 'sukrit'
+
+"""
+Benchmarks for :mod: `orchestrator.templatefactory`
+"""
+
+CTX = {
+    'env': 'local',
+    'operation': 'deploy',
+    'owner': 'mock-owner',
+    'repo': 'mock-repo',
+    'ref': 'mock-ref',
+    'commit': 'mock-commit',
+    'job-id': 'mock-job-id',
+    'github': True
+}
+
+NOTIFICATION = {
+    'message': 'Deployment for default requested successfully using url: '
+               'http://mock-deployer/apps',
+    'channel': '#mock',
+    'date': int(time.time())
+}
+
+# Slack message template (used for rendering slack messages before the
+# structured message builder)
+SLACK_TEMPLATE = '''{
+  "username": "Orchestrator ({{ctx.env}}-{{ctx.operation}})",
+  "channel": "{{ notification.channel or '#totem' }}",
+  "text": " ",
+  "attachments": [
+      {
+          "text": "{% if notification.code %}{{ notification.code}}: \
+{% endif %}{{ notification.message | truncate(1000) }} \
+{% if ctx['job-id'] -%}(job-id: {{ ctx['job-id'] }}){%- endif -%}",
+          "color": {% if level == 1 %}"danger"{% elif level == 2 %}"warning"\
+{% elif level == 3 %}"good"{% else %}"#439FE0"{% endif %},
+          "footer": "<https://github.com/{{ctx.owner}}|{{ctx.owner}}> / \
+<https://github.com/{{ctx.owner}}/{{ctx.repo}}|{{ctx.repo}}> / \
+<https://github.com/{{ctx.owner}}/{{ctx.repo}}/tree/{{ctx.ref}}|\
+{{ctx.ref | truncate(30, True)}}> / \
+<https://github.com/{{ctx.owner}}/{{ctx.repo}}/commit/{{ctx.commit[0:7]}}|\
+{{ctx.commit[0:7]}}>\\n",
+          "ts": "{{ notification.date }}"
+      }
+  ]
+}'''
+
+
+def _compile_all(bytecode_cache=None):
+    env = Environment(loader=PackageLoader('orchestrator', 'templates'),
+                      bytecode_cache=bytecode_cache)
+    for template in env.list_templates():
+        env.get_template(template)
+
+
+@attr(benchmark='true')
+class TestTemplateFactory:
+    """
+    Benchmarks for notification rendering
+    """
+
+    def setup(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_compile_on_worker_boot(self):
+        cache = FileSystemBytecodeCache(directory=self.cache_dir)
+        # Warm up the bytecode cache
+        _compile_all(cache)
+        cold = measure('compile templates: no bytecode cache',
+                       _compile_all, number=20)
+        warm = measure('compile templates: bytecode cache',
+                       lambda: _compile_all(cache), number=20)
+        ok_(warm < cold)
+
+    def test_render_slack_message(self):
+        template = Environment().from_string(SLACK_TEMPLATE)
+
+        def _template():
+            return json.dumps(json.loads(template.render(
+                notification=NOTIFICATION, ctx=CTX, level=LEVEL_FAILED)))
+
+        def _builder():
+            return json.dumps(templatefactory.build_slack_message(
+                NOTIFICATION, CTX, LEVEL_FAILED))
+
+        eq_(json.loads(_template())['attachments'][0]['text'],
+            json.loads(_builder())['attachments'][0]['text'])
+        templated = measure('slack message: template', _template,
+                            number=1000)
+        built = measure('slack message: builder', _builder, number=1000)
+        ok_(built < templated)
+
+    def test_render_hipchat_message(self):
+        templatefactory.precompile()
+        measure('hipchat message: precompiled template',
+                lambda: templatefactory.render_template(
+                    'hipchat.html', notification=NOTIFICATION, ctx=CTX,
+                    level=LEVEL_FAILED),
+                number=1000)
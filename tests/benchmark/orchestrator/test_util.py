@@ -0,0 +1,160 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+import copy
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+from nose.plugins.attrib import attr
+from nose.tools import eq_
+from conf.appconfig import CONFIG_PROVIDERS
+from orchestrator.util import dict_merge, dict_merge_shared
+from tests.benchmark import measure
+
+__author__ = 'sukrit'
+
+"""
+Benchmarks for :mod: `orchestrator.util`
+"""
+
+
+def _cluster_def(deployers=4):
+    """
+    Creates cluster-def.yml shaped config for the cluster level.
+    """
+    return {
+        'variables': {
+            'cluster_domain': 'cluster.example.com',
+            'deployer_base': {
+                'value': 'http://deployer.{{ cluster_domain }}',
+                'priority': 2
+            }
+        },
+        'deployers': {
+            'deployer-%d' % idx: {
+                'url': {
+                    'value': '{{ deployer_base }}/%d' % idx
+                },
+                'enabled': True,
+                'proxy': {
+                    'hosts': {
+                        'public': {
+                            'hostname': {
+                                'value': '{{ repo }}-{{ ref }}.%d.{{ '
+                                         'cluster_domain }}' % idx
+                            },
+                            'locations': {
+                                '_': {
+                                    'port': 8080,
+                                    'path': '/'
+                                }
+                            }
+                        }
+                    },
+                    'listeners': {
+                        'http': {
+                            'upstream-port': 80
+                        }
+                    }
+                },
+                'templates': {
+                    'app': {
+                        'args': {
+                            'environment': {
+                                'DISCOVER_PORTS': '8080',
+                                'DISCOVER_MODE': 'http',
+                            }
+                        }
+                    }
+                },
+                'deployment': {
+                    'nodes': 2,
+                    'min-nodes': 1,
+                    'check': {
+                        'port': 8080,
+                        'attempts': 10
+                    }
+                }
+            } for idx in range(deployers)
+        },
+        'notifications': {
+            'slack': {
+                'enabled': True,
+                'channel': '#deployments'
+            }
+        }
+    }
+
+
+def _totem_yml():
+    """
+    Creates totem.yml shaped config for the repository level.
+    """
+    return {
+        'enabled': True,
+        'environment': {
+            'ENV_%d' % idx: 'value-%d' % idx for idx in range(20)
+        },
+        'deployers': {
+            'deployer-0': {
+                'deployment': {
+                    'nodes': 4
+                }
+            }
+        },
+        'hooks': {
+            'ci': {
+                'travis': {
+                    'enabled': True
+                }
+            }
+        }
+    }
+
+
+@attr(benchmark='true')
+class TestDictMergeBenchmark:
+    """
+    Compares dict_merge (copying) against dict_merge_shared (structural
+    sharing) for configs loaded at every level of the cluster config.
+    """
+
+    def setup(self):
+        self.levels = [
+            _totem_yml(),
+            {},
+            _cluster_def(),
+            CONFIG_PROVIDERS['default']['config']
+        ]
+
+    def _compare(self, name, *dictionaries):
+        eq_(dict_merge_shared(*dictionaries), dict_merge(*dictionaries))
+        copying = measure('dict_merge: %s' % name,
+                          lambda: dict_merge(*dictionaries))
+        sharing = measure('dict_merge_shared: %s' % name,
+                          lambda: dict_merge_shared(*dictionaries))
+        frozen = measure('dict_merge_shared (frozen): %s' % name,
+                         lambda: dict_merge_shared(*dictionaries,
+                                                   frozen=True))
+        return copying, sharing, frozen
+
+    def test_merge_all_levels(self):
+        self._compare('all levels', *self.levels)
+
+    def test_merge_with_large_cluster_def(self):
+        self._compare('16 deployers', _totem_yml(), _cluster_def(16),
+                      CONFIG_PROVIDERS['default']['config'])
+
+    def test_merge_incrementally(self):
+        # MergedConfigProvider style: merge one level at a time
+        def merge_incrementally(merge):
+            merged = {}
+            for level in self.levels:
+                merged = merge(merged, copy.deepcopy(level))
+            return merged
+
+        measure('dict_merge: incremental',
+                lambda: merge_incrementally(dict_merge), number=20)
+        measure('dict_merge_shared: incremental',
+                lambda: merge_incrementally(dict_merge_shared), number=20)
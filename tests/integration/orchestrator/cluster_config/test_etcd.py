@@ -127,3 +127,21 @@ class TestEtcdConfigProvider:
 
         # Then: Config gets deleted
         eq_(ret_value, {})
+
+    def test_load_levels(self):
+        """
+        should load existing configs for all levels
+        """
+
+        # Given: Existing configuration
+        self.etcd_cl.write(
+            '/totem-integration/config/cluster1/test_load_levels/totem.yml',
+            MOCK_SERIALIZED_CONFIG)
+
+        # When: I load configs for all levels using provider
+        ret_value = self.provider.load_levels(
+            ['totem.yml'], 'cluster1', 'test_load_levels')
+
+        # Then: Configs get loaded
+        eq_(len(ret_value['totem.yml']), 3)
+        dict_compare(ret_value['totem.yml'][0], MOCK_CONFIG)
@@ -1,10 +1,14 @@
 import copy
 import datetime
+from bson import ObjectId
 from freezegun import freeze_time
 import pymongo
 import pytz
 from conf.appconfig import JOB_STATE_NEW, JOB_STATE_COMPLETE, \
-    JOB_STATE_FAILED, JOB_STATE_SCHEDULED
+    JOB_STATE_FAILED, JOB_STATE_SCHEDULED, JOB_EXPIRY_SECONDS, \
+    EVENT_EXPIRY_SECONDS
+from orchestrator.services.storage.config_snapshots import ConfigSnapshots, \
+    REFRESH_SECONDS
 from orchestrator.services.storage.mongo import create
 from nose.tools import ok_, eq_
 from orchestrator.util import dict_merge
@@ -80,16 +84,33 @@ EXISTING_JOBS = {
 }
 
 
+def _plan_stages(plan):
+    """
+    Flattens the stages of the query plan (returned by explain)
+    """
+    stages = [plan]
+    for child in plan.get('inputStages', []) + [plan.get('inputStage')]:
+        if child:
+            stages += _plan_stages(child)
+    return stages
+
+
 class TestMongoStore():
 
     @classmethod
     def setup(cls):
         cls.store = create(
             job_coll='orch-jobs-integration-store',
-            event_coll='orch-events-integration-store'
+            event_coll='orch-events-integration-store',
+            job_snapshot_coll='orch-job-snapshots-integration-store',
+            config_snapshot_coll='orch-config-snapshots-integration-store',
+            metrics_coll='orch-metrics-integration-store'
         )
         cls.store._jobs.drop()
         cls.store._events.drop()
+        cls.store._job_snapshots.drop()
+        cls.store._config_snapshots.drop()
+        cls.store._metrics.drop()
         cls.store.setup()
         requests = [pymongo.InsertOne(copy.deepcopy(deployment)) for deployment
                     in EXISTING_JOBS.values()]
@@ -113,6 +134,22 @@ class TestMongoStore():
                     'expiry_idx'):
             ok_(idx in indexes, '{} was not created'.format(idx))
 
+    def test_store_setup_for_config_snapshots(self):
+        # Given: Config snapshots expiring along with the referencing jobs
+        self.store._config_snapshots.drop_index('expiry_idx')
+        self.store._config_snapshots.create_index(
+            [('_expiry', pymongo.DESCENDING)], name='expiry_idx',
+            expireAfterSeconds=JOB_EXPIRY_SECONDS)
+
+        # When: I setup the store
+        self.store.setup()
+
+        # Then: Snapshots outlive the referencing documents by refresh
+        # interval
+        eq_(self.store._config_snapshots.index_information()['expiry_idx'][
+            'expireAfterSeconds'],
+            max(JOB_EXPIRY_SECONDS, EVENT_EXPIRY_SECONDS) + REFRESH_SECONDS)
+
     @freeze_time(NOW)
     def test_update_existing_job(self):
         # When:  I execute find or create for existing job
@@ -126,6 +163,7 @@ class TestMongoStore():
             'state': JOB_STATE_SCHEDULED,
             '_expiry': NOW,
             'modified': NOW,
+            'revision': 1
         }, EXISTING_JOBS['job-1'])
         dict_compare(updated_job, expected_job)
 
@@ -153,10 +191,41 @@ class TestMongoStore():
             'find-create-job-id')
         expected_job = dict_merge({
             'modified': NOW,
-            '_expiry': NOW
+            '_expiry': NOW,
+            'revision': 1
         }, job)
         dict_compare(created_job, expected_job)
 
+    def test_create_existing_job(self):
+        # Given: Job with revision
+        self.store.update_job(EXISTING_JOBS['job-1'])
+
+        # When: I create the job (without revision) again
+        created = self.store.update_job(EXISTING_JOBS['job-1'])
+
+        # Then: Job is not replaced
+        eq_(created, False)
+        eq_(self.store.get_job('job-1')['revision'], 1)
+
+    def test_update_job_with_revision(self):
+        # Given: Job that was modified concurrently
+        self.store.update_job(EXISTING_JOBS['job-1'])
+        job = self.store.get_job('job-1')
+        self.store.update_state('job-1', JOB_STATE_SCHEDULED)
+
+        # When: I update the job with stale revision
+        updated = self.store.update_job(dict(job, state=JOB_STATE_FAILED))
+
+        # Then: Job is not updated
+        eq_(updated, False)
+        eq_(self.store.get_job('job-1')['state'], JOB_STATE_SCHEDULED)
+
+        # And: Job gets updated with latest revision
+        updated = self.store.update_job(dict(self.store.get_job('job-1'),
+                                             state=JOB_STATE_FAILED))
+        eq_(updated, True)
+        eq_(self.store.get_job('job-1')['revision'], 3)
+
     def test_get_job(self):
 
         # When I get existing job
@@ -179,10 +248,163 @@ class TestMongoStore():
         expected_job = dict_merge({
             '_expiry': NOW,
             'modified': NOW,
-            'state': JOB_STATE_FAILED
+            'state': JOB_STATE_FAILED,
+            'revision': 1
+        }, EXISTING_JOBS['job-1'])
+        dict_compare(job, expected_job)
+
+    @freeze_time(NOW)
+    def test_update_job_fields(self):
+
+        # When: I update hook status and add commit for existing job
+        updated = self.store.update_job_fields(
+            'job-1',
+            set_fields={
+                'hooks.ci.test2': {'status': 'success'},
+                'meta-info.git.commit': 'commit2'
+            },
+            push_fields={
+                'meta-info.git.commit-set': 'commit2'
+            })
+
+        # Then: Only given fields are updated
+        ok_(updated)
+        job = self._get_raw_document_without_internal_id('job-1')
+        expected_job = dict_merge({
+            '_expiry': NOW,
+            'modified': NOW,
+            'revision': 1,
+            'hooks': {
+                'ci': {
+                    'test2': {
+                        'status': 'success'
+                    }
+                }
+            },
+            'meta-info': {
+                'git': {
+                    'commit': 'commit2',
+                    'commit-set': ['commit1', 'commit2']
+                }
+            }
         }, EXISTING_JOBS['job-1'])
         dict_compare(job, expected_job)
 
+    def test_update_job_fields_with_revision(self):
+
+        # Given: Job that was updated (revision: 1)
+        self.store.update_state('job-1', JOB_STATE_SCHEDULED)
+
+        # When: I update the job using stale and current revision
+        stale = self.store.update_job_fields(
+            'job-1', set_fields={'hooks.ci.test1.status': 'failed'},
+            revision=0)
+        current = self.store.update_job_fields(
+            'job-1', set_fields={'hooks.ci.test2.status': 'success'},
+            revision=1)
+
+        # Then: Only the update with current revision is applied
+        eq_((stale, current), (False, True))
+        job = self.store.get_job('job-1')
+        eq_(job['revision'], 2)
+        eq_(job['hooks']['ci'], {
+            'test1': {'status': 'success'},
+            'test2': {'status': 'success'}
+        })
+
+    def test_add_and_get_job_snapshot(self):
+        # When: I add job snapshot (twice)
+        self.store.add_job_snapshot('digest-1', EXISTING_JOBS['job-2'])
+        self.store.add_job_snapshot('digest-1', EXISTING_JOBS['job-1'])
+
+        # Then: First snapshot is retained
+        dict_compare(self.store.get_job_snapshot('digest-1'),
+                     EXISTING_JOBS['job-2'])
+        eq_(self.store._job_snapshots.count(), 1)
+
+    def _enable_config_snapshots(self):
+        self.store.config_snapshots = ConfigSnapshots(
+            self.store._add_config_snapshot, self.store._get_config_snapshot)
+
+    @freeze_time(NOW)
+    def test_update_job_with_config_snapshots(self):
+        # Given: Store with config snapshots
+        self._enable_config_snapshots()
+
+        # And: Jobs with same config
+        config = {'deployers': {}, 'enabled': True}
+        jobs = [dict_merge({
+            'config': config
+        }, EXISTING_JOBS[job_id]) for job_id in ('job-1', 'job-2')]
+
+        # When: I update the jobs
+        for job in jobs:
+            self.store.update_job(job)
+
+        # Then: Config is stored once
+        eq_(self.store._config_snapshots.count(), 1)
+
+        # And: Jobs reference the config
+        raw_job = self._get_raw_document_without_internal_id('job-1')
+        ok_('config' not in raw_job)
+        ok_(raw_job['config-ref'])
+
+        # And: Jobs are returned with the config
+        eq_(self.store.get_job('job-2')['config'], config)
+
+    def test_update_job_fields_with_config_snapshots(self):
+        # Given: Store with config snapshots
+        self._enable_config_snapshots()
+
+        # When: I update the config for job with embedded config
+        self.store.update_job_fields('job-1', set_fields={
+            'config': {'enabled': False}
+        })
+
+        # Then: Embedded config is replaced by the reference
+        raw_job = self._get_raw_document_without_internal_id('job-1')
+        ok_('config' not in raw_job)
+        eq_(self.store.get_job('job-1')['config'], {'enabled': False})
+
+    def test_get_non_existing_job_snapshot(self):
+        # When: I get non existing job snapshot
+        job = self.store.get_job_snapshot('non-existing')
+
+        # Then: None is returned
+        eq_(job, None)
+
+    def test_publish_and_get_metrics(self):
+        # Given: Metrics published by two processes
+        self.store.publish_metrics('host-1', {
+            'histograms': {'config.total': {'count': 1, 'buckets': []}},
+            'counters': {'config.cache-hits': 1}
+        })
+        self.store.publish_metrics('host-2', {
+            'histograms': {},
+            'counters': {'config.cache-hits': 2}
+        })
+
+        # When: Process re-publishes its metrics
+        self.store.publish_metrics('host-1', {
+            'histograms': {'config.total': {'count': 2, 'buckets': []}},
+            'counters': {'config.cache-hits': 3}
+        })
+
+        # Then: Latest metrics of every process are returned
+        metrics = sorted(self.store.get_metrics(),
+                         key=lambda snapshot: snapshot['counters'][
+                             'config.cache-hits'])
+        eq_(metrics, [
+            {
+                'histograms': {},
+                'counters': {'config.cache-hits': 2}
+            },
+            {
+                'histograms': {'config.total': {'count': 2, 'buckets': []}},
+                'counters': {'config.cache-hits': 3}
+            }
+        ])
+
     def test_health(self):
 
         # When: I fetch the health state of the store
@@ -220,6 +442,82 @@ class TestMongoStore():
             }
         })
 
+    @freeze_time(NOW)
+    def test_add_events(self):
+
+        # When: I add multiple events to mongo store
+        self.store.add_events([
+            {
+                'type': 'MOCK_BULK_EVENT',
+                'details': {'mock': 'details1'}
+            },
+            {
+                'type': 'MOCK_BULK_EVENT',
+                'details': {'mock': 'details2'}
+            }
+        ])
+
+        # Then: Events get added as expected
+        events = list(self.store._events.find(
+            {'type': 'MOCK_BULK_EVENT'}, projection={'_id': False}))
+        eq_(events, [
+            {
+                'component': 'orchestrator',
+                'type': 'MOCK_BULK_EVENT',
+                'date': NOW,
+                'details': {'mock': 'details1'}
+            },
+            {
+                'component': 'orchestrator',
+                'type': 'MOCK_BULK_EVENT',
+                'date': NOW,
+                'details': {'mock': 'details2'}
+            }
+        ])
+
+    def test_add_raw_events_for_existing_events(self):
+
+        # Given: Existing event
+        events = [{'_id': ObjectId(), 'type': 'MOCK_RETRIED_EVENT'}]
+        self.store._add_raw_events(copy.deepcopy(events))
+
+        # When: I add the events again (retried write)
+        events.append({'_id': ObjectId(), 'type': 'MOCK_RETRIED_EVENT'})
+        self.store._add_raw_events(events)
+
+        # Then: Only new events are added
+        eq_(self.store._events.count({'type': 'MOCK_RETRIED_EVENT'}), 2)
+
+    def test_find_active_job(self):
+        # When: I find active job for the application
+        job = self.store.find_active_job(
+            'owner1', 'repo1', 'ref1', [JOB_STATE_NEW, JOB_STATE_SCHEDULED])
+
+        # Then: Active job is returned
+        dict_compare(job, EXISTING_JOBS['job-1'])
+
+    def test_find_active_job_when_not_found(self):
+        # When: I find active job for application with no active jobs
+        job = self.store.find_active_job(
+            'owner2', 'repo2', 'ref2', [JOB_STATE_NEW, JOB_STATE_SCHEDULED])
+
+        # Then: No job is returned
+        eq_(job, None)
+
+    def test_find_active_job_uses_index(self):
+        # When: I explain the query for active job
+        plan = self.store._active_jobs(
+            'owner1', 'repo1', 'ref1', [JOB_STATE_NEW, JOB_STATE_SCHEDULED]
+        ).explain()['queryPlanner']['winningPlan']
+
+        # Then: Query (including sort) is served using active_job_idx
+        stages = _plan_stages(plan)
+        ok_({'stage': 'IXSCAN', 'indexName': 'active_job_idx'} in [
+            {'stage': stage.get('stage'), 'indexName': stage.get('indexName')}
+            for stage in stages])
+        ok_('SORT' not in [stage.get('stage') for stage in stages])
+        ok_('COLLSCAN' not in [stage.get('stage') for stage in stages])
+
     def test_filter_all_jobs(self):
         # When: I filter jobs from the store
         jobs = self.store.filter_jobs()
@@ -5,17 +5,16 @@ from nose.tools import eq_, ok_
 from orchestrator import templatefactory
 
 """
-Tests for Slack Jinja templates
+Tests for Slack messages
 """
 
 
-def test_slack_template():
+def test_slack_message():
     """
-    should render json output for slack API.
+    should build json output for slack API.
     """
 
-    output = templatefactory.render_template(
-        'slack.json.jinja',
+    output = json.dumps(templatefactory.build_slack_message(
         ctx={
             "env": "local",
             "operation": "test",
@@ -28,7 +27,7 @@ def test_slack_template():
         notification={
             "message": "test message",
             "code": "CONFIG_VALIDATION_ERROR"
-        }, level=1)
+        }, level=1))
     slack_dict = json.loads(output)
 
     eq_(slack_dict.get("username"), "Orchestrator (local-test)")
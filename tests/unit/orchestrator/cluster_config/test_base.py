@@ -1,5 +1,5 @@
 from orchestrator.cluster_config.base import AbstractConfigProvider
-from nose.tools import raises
+from nose.tools import raises, eq_
 
 __author__ = 'sukrit'
 
@@ -44,3 +44,25 @@ class TestAbstractConfigProvider:
         self.provider.delete('path1')
 
         # Then: NotImplementedError is raised
+
+    @raises(NotImplementedError)
+    def test_load_levels(self):
+        """
+        Should raise NotImplementedError
+        """
+
+        # When I load configs for all levels
+        self.provider.load_levels(['totem.yml'], 'path1')
+
+        # Then: NotImplementedError is raised
+
+    def test_level_paths(self):
+        """
+        Should return paths for every level from deepest to root level
+        """
+
+        # When I get paths for all levels
+        level_paths = list(self.provider.level_paths('path1', 'path2'))
+
+        # Then: Paths for all levels are returned
+        eq_(level_paths, [('path1', 'path2'), ('path1', ), ()])
@@ -9,6 +9,7 @@ from future.builtins import (  # noqa
 from tests.helper import dict_compare
 from orchestrator.cluster_config.base import AbstractConfigProvider
 from orchestrator.cluster_config.effective import MergedConfigProvider
+from orchestrator.services import metrics
 from nose.tools import eq_
 
 __author__ = 'sukrit'
@@ -113,3 +114,50 @@ class TestMergedConfigProvider:
             'key3': 'provider1-3.2',
             'key4': 'provider2-4.1',
         })
+
+    def test_load_levels(self):
+        # When: I load configs for all levels
+        levels = self.provider.load_levels(['totem.yml'], 'path1', 'path2')
+
+        # Then: Configs are returned in the order of precedence
+        eq_(levels, {
+            'totem.yml': [
+                {
+                    'key1': 'provider1-1.2',
+                    'key3': 'provider1-3.2'
+                },
+                {},
+                {
+                    'key1': 'provider1-1.1',
+                    'key2': 'provider1-2.1'
+                },
+                {
+                    'key1': 'provider2-1.1',
+                    'key2': 'provider2-2.1',
+                    'key4': 'provider2-4.1',
+                },
+                {
+                    'key1': 'provider1-1.0'
+                },
+                {}
+            ]
+        })
+
+    def test_load_levels_timings(self):
+        # Given: Merged config provider with named providers
+        provider = MergedConfigProvider(
+            self.provider1, self.provider2,
+            provider_names=['etcd-1', 'etcd-2'])
+
+        # When: I load configs for all levels (for different levels)
+        with metrics.explain() as report:
+            provider.load_levels(['totem.yml'], 'path1', 'path2')
+            provider.load_levels(['totem.yml'], 'path1')
+
+        # Then: Timings are recorded per provider name and level
+        eq_([stage['name'] for stage in report['stages']], [
+            'config.load.etcd-1.2',
+            'config.load.etcd-2.2',
+            'config.load.etcd-1.1',
+            'config.load.etcd-2.1'
+        ])
@@ -0,0 +1,312 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+import etcd
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+from mock import MagicMock
+from nose.tools import eq_, ok_, raises
+import yaml
+from orchestrator.cluster_config.etcd import EtcdConfigProvider, \
+    EtcdConfigMirror
+from tests.helper import dict_compare
+
+__author__ = 'sukrit'
+
+
+def _etcd_node(key, value=None, is_dir=False):
+    node = MagicMock(spec=etcd.EtcdResult)
+    node.key = key
+    node.value = value
+    node.dir = is_dir
+    return node
+
+
+def _etcd_event(action, key, value=None, is_dir=False, index=10):
+    return etcd.EtcdResult(action=action, node={
+        'key': key,
+        'value': value,
+        'dir': is_dir,
+        'modifiedIndex': index
+    })
+
+
+class TestEtcdConfigMirror:
+    """
+    Tests EtcdConfigMirror
+    """
+
+    def setup(self):
+        self.etcd_cl = MagicMock(spec=etcd.Client)
+        self.etcd_cl.read.return_value.leaves = [
+            _etcd_node('/mock/config/totem.yml', 'key1: root'),
+            _etcd_node('/mock/config/local/totem.yml', 'key1: local'),
+            _etcd_node('/mock/config/local/empty', is_dir=True),
+        ]
+        self.etcd_cl.read.return_value.etcd_index = 5
+        self.mirror = EtcdConfigMirror(self.etcd_cl, '/mock/config')
+
+    def test_sync(self):
+        """
+        Should load the config tree using single recursive read
+        """
+        # When: I sync the mirror
+        self.mirror.sync()
+
+        # Then: Config tree is mirrored
+        eq_(self.mirror.get('/mock/config/totem.yml'), {'key1': 'root'})
+        eq_(self.mirror.get('/mock/config/local/totem.yml'),
+            {'key1': 'local'})
+        eq_(self.mirror.get('/mock/config/other/totem.yml'), None)
+        eq_(self.mirror.etcd_index, 5)
+        self.etcd_cl.read.assert_called_once_with('/mock/config',
+                                                  recursive=True)
+
+    def test_sync_when_config_base_does_not_exist(self):
+        """
+        Should mirror empty tree when config base does not exist
+        """
+        # Given: Non existing config base
+        self.etcd_cl.read.side_effect = etcd.EtcdKeyNotFound(
+            payload={'index': 7})
+
+        # When: I sync the mirror
+        self.mirror.sync()
+
+        # Then: Empty tree is mirrored
+        ok_('/mock/config/totem.yml' not in self.mirror)
+        eq_(self.mirror.etcd_index, 7)
+
+    def test_apply_set_event(self):
+        """
+        Should update the mirrored config for set event
+        """
+        # Given: Synced mirror
+        self.mirror.sync()
+
+        # When: I apply set event
+        self.mirror.apply(_etcd_event('set', '/mock/config/totem.yml',
+                                      'key1: updated'))
+
+        # Then: Config is updated
+        eq_(self.mirror.get('/mock/config/totem.yml'), {'key1': 'updated'})
+        eq_(self.mirror.etcd_index, 10)
+        ok_(self.mirror.status()['last-event'] is not None)
+
+    def test_apply_delete_event(self):
+        """
+        Should remove the mirrored config for delete event
+        """
+        # Given: Synced mirror
+        self.mirror.sync()
+
+        # When: I apply delete event
+        self.mirror.apply(_etcd_event('delete', '/mock/config/totem.yml'))
+
+        # Then: Config is removed
+        ok_('/mock/config/totem.yml' not in self.mirror)
+        ok_('/mock/config/local/totem.yml' in self.mirror)
+
+    def test_apply_delete_event_for_directory(self):
+        """
+        Should remove all mirrored configs under deleted directory
+        """
+        # Given: Synced mirror
+        self.mirror.sync()
+
+        # When: I apply delete event for directory
+        self.mirror.apply(_etcd_event('delete', '/mock/config/local',
+                                      is_dir=True))
+
+        # Then: Configs under the directory are removed
+        ok_('/mock/config/local/totem.yml' not in self.mirror)
+        ok_('/mock/config/totem.yml' in self.mirror)
+
+    def test_get_returns_copy(self):
+        """
+        Should return a copy of mirrored config
+        """
+        # Given: Synced mirror
+        self.mirror.sync()
+
+        # When: I modify the config returned by the mirror
+        self.mirror.get('/mock/config/totem.yml')['key1'] = 'modified'
+
+        # Then: Mirrored config is not modified
+        eq_(self.mirror.get('/mock/config/totem.yml'), {'key1': 'root'})
+
+    @raises(yaml.YAMLError)
+    def test_get_for_invalid_yaml(self):
+        """
+        Should raise YAMLError when mirrored config is not valid yaml
+        """
+        # Given: Mirror with invalid config
+        self.mirror.sync()
+        self.mirror.apply(_etcd_event('set', '/mock/config/totem.yml',
+                                      'key1: [invalid'))
+
+        # When: I get the invalid config
+        self.mirror.get('/mock/config/totem.yml')
+
+        # Then: YAMLError is raised
+
+    def test_watch_once(self):
+        """
+        Should apply the change to the mirror
+        """
+        # Given: Synced mirror
+        self.mirror.sync()
+
+        # And: Change in the config tree
+        self.etcd_cl.read.return_value = _etcd_event(
+            'set', '/mock/config/totem.yml', 'key1: changed', index=6)
+
+        # When: I watch the config tree
+        self.mirror.watch_once()
+
+        # Then: Change is applied
+        eq_(self.mirror.get('/mock/config/totem.yml'), {'key1': 'changed'})
+        self.etcd_cl.read.assert_called_with(
+            '/mock/config', wait=True, recursive=True, waitIndex=6,
+            timeout=60)
+
+    def test_watch_once_when_watch_times_out(self):
+        """
+        Should keep the mirror as is when no change happens during watch
+        """
+        # Given: Synced mirror
+        self.mirror.sync()
+        self.mirror.watch_timeout = 0
+
+        # And: Watch that times out (reported by python-etcd after urllib3
+        # retries)
+        self.etcd_cl.read.side_effect = etcd.EtcdException(
+            'No more machines in the cluster')
+
+        # When: I watch the config tree
+        self.mirror.watch_once()
+
+        # Then: Mirror is not re-synced
+        eq_(self.etcd_cl.read.call_count, 2)
+        eq_(self.mirror.etcd_index, 5)
+
+    @raises(etcd.EtcdException)
+    def test_watch_once_when_etcd_is_not_reachable(self):
+        """
+        Should raise the error when watch fails before watch timeout
+        """
+        # Given: Synced mirror
+        self.mirror.sync()
+
+        # And: Etcd that is not reachable
+        self.etcd_cl.read.side_effect = etcd.EtcdException(
+            'No more machines in the cluster')
+
+        # When: I watch the config tree
+        self.mirror.watch_once()
+
+        # Then: EtcdException is raised
+
+    def test_watch_once_when_index_is_cleared(self):
+        """
+        Should re-sync the mirror
+        """
+        # Given: Synced mirror
+        self.mirror.sync()
+
+        # And: Watch for index that is no longer available
+        self.etcd_cl.read.side_effect = [etcd.EtcdEventIndexCleared(),
+                                         self.etcd_cl.read.return_value]
+
+        # When: I watch the config tree
+        self.mirror.watch_once()
+
+        # Then: Mirror is re-synced
+        self.etcd_cl.read.assert_called_with('/mock/config', recursive=True)
+
+
+class TestEtcdConfigProvider:
+    """
+    Tests EtcdConfigProvider
+    """
+
+    def setup(self):
+        self.etcd_cl = MagicMock(spec=etcd.Client)
+        self.provider = EtcdConfigProvider(etcd_cl=self.etcd_cl,
+                                           config_base='/mock/config')
+
+    def test_load_levels(self):
+        """
+        Should load configs for all levels using single read per level
+        """
+        # Given: Existing configs in etcd
+        level_nodes = {
+            '/mock/config': [
+                _etcd_node('/mock/config/totem.yml', 'key1: root'),
+                _etcd_node('/mock/config/local', is_dir=True),
+                _etcd_node('/mock/config/other', is_dir=True),
+            ],
+            '/mock/config/local': [
+                _etcd_node('/mock/config/local/totem.yml', 'key1: local'),
+                _etcd_node('/mock/config/local/cluster-def.yml',
+                           'key2: local'),
+                _etcd_node('/mock/config/local/empty', is_dir=True),
+            ]
+        }
+
+        def read(key):
+            if key not in level_nodes:
+                raise etcd.EtcdKeyNotFound()
+            return MagicMock(leaves=level_nodes[key])
+
+        self.etcd_cl.read.side_effect = read
+
+        # When: I load configs for all levels
+        levels = self.provider.load_levels(
+            ['totem.yml', 'cluster-def.yml'], 'local', 'owner')
+
+        # Then: Configs for all levels are returned
+        dict_compare(levels, {
+            'totem.yml': [{}, {'key1': 'local'}, {'key1': 'root'}],
+            'cluster-def.yml': [{}, {'key2': 'local'}, {}]
+        })
+
+        # And: Every level is read once (non recursive)
+        eq_([call[0] for call in self.etcd_cl.read.call_args_list], [
+            ('/mock/config/local/owner',),
+            ('/mock/config/local',),
+            ('/mock/config',)
+        ])
+
+    def test_load_levels_when_config_base_does_not_exist(self):
+        """
+        Should return empty configs when config base does not exist
+        """
+        # Given: Non existing config base
+        self.etcd_cl.read.side_effect = etcd.EtcdKeyNotFound()
+
+        # When: I load configs for all levels
+        levels = self.provider.load_levels(['totem.yml'], 'local')
+
+        # Then: Empty configs are returned
+        eq_(levels, {'totem.yml': [{}, {}]})
+
+    def test_load_using_mirror(self):
+        """
+        Should load configs from the mirror without reading etcd
+        """
+        # Given: Provider using the mirror
+        mirror = MagicMock(spec=EtcdConfigMirror)
+        mirror.get.side_effect = lambda key: {
+            '/mock/config/local/totem.yml': {'key1': 'local'}
+        }.get(key)
+        self.provider.mirror = mirror
+
+        # When: I load configs for all levels
+        levels = self.provider.load_levels(['totem.yml'], 'local')
+
+        # Then: Configs are loaded from the mirror
+        eq_(levels, {'totem.yml': [{'key1': 'local'}, {}]})
+        eq_(self.etcd_cl.read.call_count, 0)
@@ -7,10 +7,11 @@ from future.builtins import (  # noqa
     filter, map, zip)
 from mock import patch
 import nose
+from orchestrator.cluster_config import github
 from orchestrator.cluster_config.github import GithubConfigProvider, \
     GithubFetchException
 from tests.helper import dict_compare
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 __author__ = 'sukrit'
 
@@ -18,6 +19,7 @@ __author__ = 'sukrit'
 class TestGuthubConfigProvider:
 
     def setup(self):
+        github.clear_cache()
         self.provider = GithubConfigProvider()
 
     def test_init_when_no_parameters_passed(self):
@@ -36,7 +38,7 @@ class TestGuthubConfigProvider:
         eq_(provider.config_base, '/f1/')
         eq_(provider.auth, ('MOCK_TOKEN', 'x-oauth-basic'))
 
-    @patch('requests.get')
+    @patch('orchestrator.cluster_config.github.requests.Session.get')
     def test_load_for_partial_path(self, m_get):
         """
         Should return empty config from GithubConfigProvider for partial path
@@ -49,13 +51,14 @@ class TestGuthubConfigProvider:
         # Then: Config gets loaded
         dict_compare(ret_value, {})
 
-    @patch('requests.get')
+    @patch('orchestrator.cluster_config.github.requests.Session.get')
     def test_load_for_full_path(self, m_get):
         """
         Should read config from github
         """
         # Given: Existing config
         m_get.return_value.status_code = 200
+        m_get.return_value.headers = {}
         m_get.return_value.json.return_value = {
             'content': 'dmFyaWFibGVzOiB7fQ=='
         }
@@ -67,7 +70,7 @@ class TestGuthubConfigProvider:
         # Then: Config gets loaded
         dict_compare(ret_value, {'variables': {}})
 
-    @patch('requests.get')
+    @patch('orchestrator.cluster_config.github.requests.Session.get')
     def test_load_for_non_existing_path(self, m_get):
         """
         Should return empty config when config is not found in github
@@ -82,7 +85,7 @@ class TestGuthubConfigProvider:
         # Then: EmptyConfig gets loaded
         dict_compare(ret_value, {})
 
-    @patch('requests.get')
+    @patch('orchestrator.cluster_config.github.requests.Session.get')
     def test_load_when_github_fetch_fails_with_raw_text(self, m_get):
         """
         Should read config from github
@@ -108,6 +111,126 @@ class TestGuthubConfigProvider:
             }
         })
 
+    @patch('orchestrator.cluster_config.github.requests.Session.get')
+    def test_load_for_unmodified_config(self, m_get):
+        """
+        Should use cached config when github reports config as not modified
+        """
+        # Given: Config that was loaded earlier
+        m_get.return_value.status_code = 200
+        m_get.return_value.headers = {'ETag': '"mock-etag"'}
+        m_get.return_value.json.return_value = {
+            'content': 'dmFyaWFibGVzOiB7fQ=='
+        }
+        self.provider.load(
+            'totem.yml', 'local', 'totem', 'cluster-orchestrator', 'develop')
+
+        # And: Config is not modified since then
+        m_get.return_value.status_code = 304
+
+        # When: I load config again
+        ret_value = self.provider.load(
+            'totem.yml', 'local', 'totem', 'cluster-orchestrator', 'develop')
+
+        # Then: Cached config is returned
+        dict_compare(ret_value, {'variables': {}})
+
+        # And: Conditional request was made using the ETag
+        eq_(m_get.call_args[1]['headers'], {'If-None-Match': '"mock-etag"'})
+
+    @patch('orchestrator.cluster_config.github.requests.Session.get')
+    def test_load_for_commit(self, m_get):
+        """
+        Should fetch config for a commit only once
+        """
+        # Given: Existing config
+        m_get.return_value.status_code = 200
+        m_get.return_value.headers = {}
+        m_get.return_value.json.return_value = {
+            'content': 'dmFyaWFibGVzOiB7fQ=='
+        }
+
+        # When: I load config for a commit twice
+        for _ in range(2):
+            ret_value = self.provider.load(
+                'totem.yml', 'local', 'totem', 'cluster-orchestrator',
+                'develop', commit='mock-commit')
+
+        # Then: Config gets loaded
+        dict_compare(ret_value, {'variables': {}})
+
+        # And: Config was fetched once using the commit
+        eq_(m_get.call_count, 1)
+        eq_(m_get.call_args[1]['params'], {'ref': 'mock-commit'})
+
+        # And: Request was made using the timeout
+        eq_(m_get.call_args[1]['timeout'], github.DEFAULT_TIMEOUT)
+
+    @patch('orchestrator.cluster_config.github.requests.Session.get')
+    def test_load_for_commit_with_empty_config(self, m_get):
+        """
+        Should fetch empty config for a commit only once
+        """
+        # Given: Existing config with no content (only comments)
+        m_get.return_value.status_code = 200
+        m_get.return_value.headers = {}
+        m_get.return_value.json.return_value = {
+            'content': 'IyBtb2NrCg=='
+        }
+
+        # When: I load config for a commit twice
+        for _ in range(2):
+            ret_value = self.provider.load(
+                'totem.yml', 'local', 'totem', 'cluster-orchestrator',
+                'develop', commit='mock-commit')
+
+        # Then: Empty config gets loaded
+        eq_(ret_value, None)
+
+        # And: Config was fetched once
+        eq_(m_get.call_count, 1)
+
+    @patch('orchestrator.cluster_config.github.os.getpid')
+    def test_get_session_per_process(self, m_getpid):
+        """
+        Should create session per process
+        """
+        # Given: Session created for current process
+        m_getpid.return_value = 1
+        session = github._get_session()
+
+        # When: I get the session in the same and in forked process
+        same = github._get_session()
+        m_getpid.return_value = 2
+        forked = github._get_session()
+
+        # Then: Session is reused only within the process
+        ok_(same is session)
+        ok_(forked is not session)
+
+    @patch('orchestrator.cluster_config.github.requests.Session.get')
+    def test_load_levels(self, m_get):
+        """
+        Should fetch config only for the deepest level
+        """
+        # Given: Existing config
+        m_get.return_value.status_code = 200
+        m_get.return_value.headers = {}
+        m_get.return_value.json.return_value = {
+            'content': 'dmFyaWFibGVzOiB7fQ=='
+        }
+
+        # When: I load configs for all levels
+        levels = self.provider.load_levels(
+            ['totem.yml'], 'local', 'totem', 'cluster-orchestrator',
+            'develop', commit='mock-commit')
+
+        # Then: Configs for all levels are returned
+        dict_compare(levels, {
+            'totem.yml': [{'variables': {}}, {}, {}, {}, {}]
+        })
+        eq_(m_get.call_count, 1)
+
 
 class TestGithubFetchException():
 
@@ -0,0 +1,123 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+from mock import MagicMock, patch
+from nose.tools import eq_, ok_
+from orchestrator.cluster_config import s3
+from orchestrator.cluster_config.s3 import S3ConfigProvider
+from tests.helper import dict_compare
+
+__author__ = 'sukrit'
+
+
+def _s3_key(name, raw, etag='"mock-etag"'):
+    key = MagicMock()
+    key.name = name
+    key.etag = etag
+    key.get_contents_as_string.return_value = raw
+    return key
+
+
+class TestS3ConfigProvider:
+    """
+    Tests S3ConfigProvider
+    """
+
+    def setup(self):
+        s3.clear_cache()
+        self.provider = S3ConfigProvider('mockbucket',
+                                         config_base='mock/config')
+        self.keys = [
+            _s3_key('mock/config/totem.yml', 'key1: root'),
+            _s3_key('mock/config/local/totem.yml', 'key1: local'),
+            _s3_key('mock/config/local/cluster-def.yml', 'key2: local'),
+        ]
+        self.bucket = MagicMock()
+        self.bucket.list.side_effect = lambda prefix, delimiter: [
+            key for key in self.keys
+            if key.name.rsplit('/', 1)[0] + '/' == prefix]
+        self.provider._s3_bucket = MagicMock(return_value=self.bucket)
+
+    @patch('boto.connect_s3')
+    def test_s3_bucket(self, m_connect_s3):
+        """
+        Should reuse connection and get bucket without validation
+        """
+        # Given: Provider using real bucket lookup
+        provider = S3ConfigProvider('mockbucket')
+        s3._connections.clear()
+
+        # When: I get the bucket twice
+        for _ in range(2):
+            bucket = provider._s3_bucket()
+
+        # Then: Bucket is returned without validation
+        eq_(bucket, m_connect_s3.return_value.get_bucket.return_value)
+        m_connect_s3.return_value.get_bucket.assert_called_with(
+            'mockbucket', validate=False)
+
+        # And: Connection is created only once
+        eq_(m_connect_s3.call_count, 1)
+        s3._connections.clear()
+
+    def test_load_levels(self):
+        """
+        Should load configs for all names and levels
+        """
+        # When: I load configs for all levels
+        levels = self.provider.load_levels(
+            ['totem.yml', 'cluster-def.yml'], 'local', 'owner')
+
+        # Then: Configs for all levels are returned
+        dict_compare(levels, {
+            'totem.yml': [{}, {'key1': 'local'}, {'key1': 'root'}],
+            'cluster-def.yml': [{}, {'key2': 'local'}, {}]
+        })
+
+        # And: Every level is listed once (without nested levels)
+        eq_(sorted(call[1]['prefix']
+                   for call in self.bucket.list.call_args_list),
+            ['mock/config/', 'mock/config/local/', 'mock/config/local/owner/'])
+        ok_(all(call[1]['delimiter'] == '/'
+                for call in self.bucket.list.call_args_list))
+
+    def test_load_levels_for_unmodified_configs(self):
+        """
+        Should not fetch configs whose ETag did not change
+        """
+        # Given: Configs loaded earlier
+        self.provider.load_levels(['totem.yml'], 'local')
+
+        # And: Modified root level config
+        self.keys[0].etag = '"mock-etag-modified"'
+        self.keys[0].get_contents_as_string.return_value = 'key1: modified'
+
+        # When: I load configs again
+        levels = self.provider.load_levels(['totem.yml'], 'local')
+
+        # Then: Updated configs are returned
+        dict_compare(levels, {
+            'totem.yml': [{'key1': 'local'}, {'key1': 'modified'}]
+        })
+
+        # And: Only modified config is fetched again
+        eq_(self.keys[0].get_contents_as_string.call_count, 2)
+        eq_(self.keys[1].get_contents_as_string.call_count, 1)
+
+    def test_load_returns_copy(self):
+        """
+        Should return a copy of cached config
+        """
+        # Given: Existing config
+        self.bucket.get_key.return_value = self.keys[0]
+
+        # When: I modify the loaded config
+        self.provider.load('totem.yml')['key1'] = 'modified'
+
+        # Then: Cached config is not modified
+        dict_compare(self.provider.load('totem.yml'), {'key1': 'root'})
+        eq_(self.keys[0].get_contents_as_string.call_count, 1)
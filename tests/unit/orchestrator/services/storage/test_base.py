@@ -1,7 +1,7 @@
 import datetime
 from freezegun import freeze_time
 from mock import MagicMock
-from nose.tools import raises
+from nose.tools import eq_, raises
 import pytz
 from conf.appconfig import JOB_STATE_NEW
 from orchestrator.services.storage.base import AbstractStore
@@ -21,14 +21,34 @@ class TestAbstractStore:
     def test_update_job(self):
         self.store.update_job(MagicMock())
 
+    @raises(NotImplementedError)
+    def test_update_job_fields(self):
+        self.store.update_job_fields('fake_id', set_fields={'state': 'NEW'})
+
     @raises(NotImplementedError)
     def test_get_job(self):
         self.store.get_job('fake_id')
 
+    @raises(NotImplementedError)
+    def test_add_job_snapshot(self):
+        self.store.add_job_snapshot('fake_digest', MagicMock())
+
+    @raises(NotImplementedError)
+    def test_get_job_snapshot(self):
+        self.store.get_job_snapshot('fake_digest')
+
     @raises(NotImplementedError)
     def test_update_state(self):
         self.store.update_state('fake_id', 'PROMOTED')
 
+    @raises(NotImplementedError)
+    def test_publish_metrics(self):
+        self.store.publish_metrics('fake_process', MagicMock())
+
+    @raises(NotImplementedError)
+    def test_get_metrics(self):
+        self.store.get_metrics()
+
     @raises(NotImplementedError)
     def test_get_health(self):
         self.store.health()
@@ -50,6 +70,79 @@ class TestAbstractStore:
 
         })
 
+    @freeze_time(NOW_NOTZ)
+    def test_add_events(self):
+        # Given: Mock implementation for adding raw event
+        self.store._add_raw_event = MagicMock()
+
+        # When: I add multiple events to the store
+        self.store.add_events([
+            {'type': 'MOCK_EVENT1'},
+            {'type': 'MOCK_EVENT2', 'details': {'mock': 'details'},
+             'search_params': {'meta-info': {'mock': 'search'}}}
+        ])
+
+        # Then: Events get added to the store
+        eq_(self.store._add_raw_event.call_count, 2)
+        self.store._add_raw_event.assert_called_with({
+            'type': 'MOCK_EVENT2',
+            'component': 'orchestrator',
+            'details': {'mock': 'details'},
+            'meta-info': {'mock': 'search'},
+            'date': NOW_NOTZ
+        })
+
+    def test_add_events_with_no_events(self):
+        # Given: Mock implementation for adding raw events
+        self.store._add_raw_events = MagicMock()
+
+        # When: I add empty list of events
+        self.store.add_events([])
+
+        # Then: No events are added
+        self.store._add_raw_events.assert_not_called()
+
+    def test_add_event_with_event_buffer(self):
+        # Given: Store with event buffer
+        self.store.event_buffer = MagicMock()
+        self.store._add_raw_event = MagicMock()
+
+        # When: I add event to the store
+        self.store.add_event('MOCK_EVENT')
+
+        # Then: Event gets added to the buffer
+        eq_(self.store.event_buffer.add.call_args[0][0][0]['type'],
+            'MOCK_EVENT')
+        self.store._add_raw_event.assert_not_called()
+
+        # And: Buffered events are written on flush
+        self.store.flush_events()
+        self.store.event_buffer.flush.assert_called_once_with()
+
+    def test_compact_and_expand_job(self):
+        # When: I compact and expand job for store without config snapshots
+        job = {'config': {}}
+        compacted = self.store.compact_job(job)
+        expanded = self.store.expand_job(compacted)
+
+        # Then: Job is returned as is
+        eq_(compacted, job)
+        eq_(expanded, job)
+
+    def test_compact_and_expand_job_with_config_snapshots(self):
+        # Given: Store with config snapshots
+        self.store.config_snapshots = MagicMock()
+
+        # When: I compact and expand job
+        compacted = self.store.compact_job({'config': {}})
+        expanded = self.store.expand_job(compacted)
+
+        # Then: Config snapshots are used
+        self.store.config_snapshots.compact.assert_called_once_with(
+            {'config': {}})
+        self.store.config_snapshots.expand.assert_called_once_with(compacted)
+        eq_(expanded, self.store.config_snapshots.expand.return_value)
+
     @raises(NotImplementedError)
     def test_add_raw_event(self):
         self.store.add_event({})
@@ -63,6 +156,34 @@ class TestAbstractStore:
         self.store.filter_jobs(owner='mock-owner', repo='mock-repo',
                                ref='mock-branch', state_in=[JOB_STATE_NEW])
 
+    def test_find_active_job(self):
+        # Given: Mock implementation for filtering jobs
+        self.store.filter_jobs = MagicMock(return_value=[
+            {'meta-info': {'job-id': 'job-1'}},
+            {'meta-info': {'job-id': 'job-2'}}
+        ])
+
+        # When: I find active job
+        job = self.store.find_active_job('mock-owner', 'mock-repo',
+                                         'mock-branch', [JOB_STATE_NEW])
+
+        # Then: First filtered job is returned
+        eq_(job, {'meta-info': {'job-id': 'job-1'}})
+        self.store.filter_jobs.assert_called_once_with(
+            owner='mock-owner', repo='mock-repo', ref='mock-branch',
+            state_in=[JOB_STATE_NEW])
+
+    def test_find_active_job_when_not_found(self):
+        # Given: No matching jobs
+        self.store.filter_jobs = MagicMock(return_value=[])
+
+        # When: I find active job
+        job = self.store.find_active_job('mock-owner', 'mock-repo',
+                                         'mock-branch', [JOB_STATE_NEW])
+
+        # Then: None is returned
+        eq_(job, None)
+
     @freeze_time(NOW)
     def test_apply_modified_ts(self):
 
@@ -0,0 +1,133 @@
+from mock import MagicMock
+from nose.tools import eq_, ok_, raises
+from orchestrator.services.exceptions import ConfigSnapshotNotFound
+from orchestrator.services.storage.config_snapshots import ConfigSnapshots, \
+    config_digest
+
+__author__ = 'sukrit'
+
+"""
+Test for :mod: `orchestrator.services.storage.config_snapshots`
+"""
+
+MOCK_CONFIG = {
+    'enabled': True,
+    'deployers': {}
+}
+
+
+def test_config_digest():
+    """
+    Should return same digest for configs with same content
+    """
+    # When: I get the digest for configs with same content
+    digest1 = config_digest({'a': 1, 'b': [1, 2]})
+    digest2 = config_digest({'b': [1, 2], 'a': 1})
+
+    # Then: Digests are same
+    eq_(digest1, digest2)
+
+    # And: Digest differs for different content
+    ok_(digest1 != config_digest({'a': 2, 'b': [1, 2]}))
+
+
+class TestConfigSnapshots:
+    """
+    Tests for ConfigSnapshots
+    """
+
+    def setup(self):
+        self.add = MagicMock()
+        self.get = MagicMock()
+        self.snapshots = ConfigSnapshots(self.add, self.get)
+
+    def test_compact(self):
+        """
+        Should replace the config with the reference to config snapshot
+        """
+        # Given: Job with config
+        job = {'state': 'NEW', 'config': MOCK_CONFIG}
+
+        # When: I compact the job (twice)
+        compacted = self.snapshots.compact(job)
+        self.snapshots.compact(job)
+
+        # Then: Config is replaced with the reference
+        digest = config_digest(MOCK_CONFIG)
+        eq_(compacted, {'state': 'NEW', 'config-ref': digest})
+
+        # And: Snapshot is added once
+        self.add.assert_called_once_with(digest, MOCK_CONFIG)
+
+        # And: Original job is not modified
+        eq_(job, {'state': 'NEW', 'config': MOCK_CONFIG})
+
+    def test_compact_for_job_without_config(self):
+        """
+        Should return the job as is
+        """
+        # When: I compact job without config
+        compacted = self.snapshots.compact({'state': 'NEW'})
+
+        # Then: Job is returned as is
+        eq_(compacted, {'state': 'NEW'})
+        self.add.assert_not_called()
+
+    def test_expand(self):
+        """
+        Should replace the config reference with the config snapshot
+        """
+        # Given: Existing config snapshot
+        self.get.return_value = MOCK_CONFIG
+
+        # When: I expand the compacted job (twice)
+        job = {'state': 'NEW', 'config-ref': 'mock-digest'}
+        expanded = self.snapshots.expand(job)
+        self.snapshots.expand(job)
+
+        # Then: Config reference is replaced with the config
+        eq_(expanded, {'state': 'NEW', 'config': MOCK_CONFIG})
+
+        # And: Snapshot is fetched from the store once
+        self.get.assert_called_once_with('mock-digest')
+
+    @raises(ConfigSnapshotNotFound)
+    def test_expand_for_missing_snapshot(self):
+        """
+        Should raise ConfigSnapshotNotFound
+        """
+        # Given: Non existing config snapshot
+        self.get.return_value = None
+
+        # When: I expand the compacted job
+        self.snapshots.expand({
+            'meta-info': {'job-id': 'mock-job-id'},
+            'config-ref': 'mock-digest'
+        })
+
+        # Then: ConfigSnapshotNotFound is raised
+
+    def test_expand_for_compacted_job(self):
+        """
+        Should use the cached config
+        """
+        # Given: Compacted job
+        compacted = self.snapshots.compact({'config': MOCK_CONFIG})
+
+        # When: I expand the job
+        expanded = self.snapshots.expand(compacted)
+
+        # Then: Config is restored without fetching it from the store
+        eq_(expanded, {'config': MOCK_CONFIG})
+        self.get.assert_not_called()
+
+    def test_expand_for_job_with_embedded_config(self):
+        """
+        Should return the job as is
+        """
+        # When: I expand job with embedded config
+        expanded = self.snapshots.expand({'config': MOCK_CONFIG})
+
+        # Then: Job is returned as is
+        eq_(expanded, {'config': MOCK_CONFIG})
+        self.get.assert_not_called()
@@ -0,0 +1,182 @@
+import datetime
+import fcntl
+import os
+import shutil
+import tempfile
+from bson import json_util
+from mock import MagicMock
+from nose.tools import eq_, ok_
+from orchestrator.services import metrics
+from orchestrator.services.storage.event_buffer import EventBuffer
+
+__author__ = 'sukrit'
+
+"""
+Test for :mod: `orchestrator.services.storage.event_buffer`
+"""
+
+
+class TestEventBuffer:
+    """
+    Tests for EventBuffer
+    """
+
+    def setup(self):
+        metrics.reset()
+        self.spool_dir = tempfile.mkdtemp()
+        self.write = MagicMock()
+        self.buffer = EventBuffer(self.write, max_size=3, max_age=3600,
+                                  spool_dir=self.spool_dir)
+
+    def teardown(self):
+        shutil.rmtree(self.spool_dir)
+
+    def _spool_files(self):
+        # Excludes the lock files
+        return sorted(name for name in os.listdir(self.spool_dir)
+                      if not name.endswith('.lock'))
+
+    def _spool(self, name, *events):
+        with open(os.path.join(self.spool_dir, name), 'w') as spool:
+            for event in events:
+                spool.write(json_util.dumps(event) + '\n')
+
+    def test_add(self):
+        """
+        Should buffer and spool the events
+        """
+        # When: I add events less than max size
+        self.buffer.add([{'type': 'MOCK_EVENT1'}, {'type': 'MOCK_EVENT2'}])
+
+        # Then: Events are not written to the store
+        self.write.assert_not_called()
+
+        # And: Events are spooled (in spool owned by the buffer)
+        spool_files = self._spool_files()
+        eq_(len(spool_files), 1)
+        ok_(spool_files[0].endswith('.active'))
+        eq_(sorted(os.listdir(self.spool_dir)), sorted([
+            spool_files[0], spool_files[0].replace('.active', '.lock')]))
+
+    def test_add_when_buffer_is_full(self):
+        """
+        Should write the buffered events to the store in single batch
+        """
+        # When: I add events upto max size
+        self.buffer.add([{'type': 'MOCK_EVENT1'}, {'type': 'MOCK_EVENT2'}])
+        self.buffer.add([{'type': 'MOCK_EVENT3'}])
+
+        # Then: Events are written in single batch (with ids assigned)
+        self.write.assert_called_once()
+        events = self.write.call_args[0][0]
+        eq_([event['type'] for event in events],
+            ['MOCK_EVENT1', 'MOCK_EVENT2', 'MOCK_EVENT3'])
+        ok_(all(event.get('_id') for event in events))
+
+        # And: Spooled events are removed
+        eq_(self._spool_files(), [])
+
+        # And: Batch size is recorded
+        eq_(metrics.get_histograms()['events.flush.size']['sum'], 3)
+
+    def test_flush_with_failed_write(self):
+        """
+        Should retain the events for next flush
+        """
+        # Given: Buffered events
+        self.buffer.add([{'type': 'MOCK_EVENT1'}])
+
+        # And: Store that fails to write the events
+        self.write.side_effect = [ValueError('mock'), None]
+
+        # When: I flush the events
+        written = self.buffer.flush()
+
+        # Then: Events are not written
+        eq_(written, 0)
+        eq_(metrics.get_counters()['events.flush.failed'], 1)
+
+        # And: Events stay spooled
+        eq_(len(self._spool_files()), 1)
+
+        # And: Events get written on next flush
+        eq_(self.buffer.flush(), 1)
+        eq_(self.write.call_args_list[0], self.write.call_args_list[1])
+        eq_(self._spool_files(), [])
+
+    def test_flush_with_no_events(self):
+        """
+        Should not write to the store
+        """
+        # When: I flush empty buffer
+        written = self.buffer.flush()
+
+        # Then: Nothing is written
+        eq_(written, 0)
+        self.write.assert_not_called()
+
+    def test_recover(self):
+        """
+        Should write the events spooled by dead processes
+        """
+        # Given: Events spooled by dead process (with partially written
+        # event)
+        event = {'type': 'MOCK_EVENT', 'date': datetime.datetime(2022, 1, 1)}
+        self._spool('events-dead1.lock')
+        self._spool('events-dead1.active', event)
+        with open(os.path.join(self.spool_dir, 'events-dead1.active'), 'a') \
+                as spool:
+            spool.write('{"type": "MOCK_')
+
+        # When: I recover the events
+        written = self.buffer.recover()
+
+        # Then: Spooled events are written
+        eq_(written, 1)
+        eq_(self.write.call_args[0][0][0]['type'], 'MOCK_EVENT')
+
+        # And: Spool files are removed
+        eq_(self._spool_files(), [])
+        ok_('events-dead1.lock' not in os.listdir(self.spool_dir))
+
+    def test_recover_for_multiple_dead_processes(self):
+        """
+        Should write all the batches spooled by dead processes (in order)
+        """
+        # Given: Batches spooled by dead processes (using same sequence)
+        for spool_id in ('dead1', 'dead2'):
+            self._spool('events-{}.lock'.format(spool_id))
+            for seq in (2, 10):
+                self._spool('events-{}-{}.batch'.format(spool_id, seq),
+                            {'type': '{}-{}'.format(spool_id, seq)})
+            self._spool('events-{}.active'.format(spool_id),
+                        {'type': '{}-active'.format(spool_id)})
+
+        # When: I recover the events
+        written = self.buffer.recover()
+
+        # Then: All spooled events are written
+        eq_(written, 6)
+        eq_([call[0][0][0]['type'] for call in self.write.call_args_list], [
+            'dead1-2', 'dead1-10', 'dead1-active',
+            'dead2-2', 'dead2-10', 'dead2-active'
+        ])
+        eq_(self._spool_files(), [])
+
+    def test_recover_for_running_process(self):
+        """
+        Should not recover the events spooled by running processes
+        """
+        # Given: Events spooled by running process (holding the lock)
+        self._spool('events-running1.lock')
+        self._spool('events-running1.active', {'type': 'MOCK_EVENT'})
+        with open(os.path.join(self.spool_dir, 'events-running1.lock')) \
+                as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+            # When: I recover the events
+            written = self.buffer.recover()
+
+        # Then: Nothing is written
+        eq_(written, 0)
+        eq_(self._spool_files(), ['events-running1.active'])
@@ -0,0 +1,43 @@
+from mock import patch
+from nose.tools import ok_
+from orchestrator.services.storage.mongo import create, MongoStore
+
+__author__ = 'sukrit'
+
+"""
+Test for :mod: `orchestrator.services.storage.mongo`
+"""
+
+MOCK_POOL_SETTINGS = {
+    'max-pool-size': '2',
+    'wait-queue-timeout-ms': '1000',
+    'server-selection-timeout-ms': '2000',
+    'connect-timeout-ms': '3000'
+}
+
+
+@patch('orchestrator.services.storage.mongo.MongoClient')
+def test_create(m_client):
+    # When: I create the store
+    store = create(url='mongodb://mock-host', pool_settings=MOCK_POOL_SETTINGS)
+
+    # Then: Store is created with tuned connection pool
+    ok_(isinstance(store, MongoStore))
+    m_client.assert_called_once_with(
+        'mongodb://mock-host', tz_aware=True, maxPoolSize=2,
+        waitQueueTimeoutMS=1000, serverSelectionTimeoutMS=2000,
+        connectTimeoutMS=3000)
+
+
+@patch('orchestrator.services.storage.mongo.MongoClient')
+def test_create_without_pool_settings(m_client):
+    # When: I create the store without pool settings
+    create(url='mongodb://mock-host', pool_settings={
+        'max-pool-size': None,
+        'wait-queue-timeout-ms': None,
+        'server-selection-timeout-ms': None,
+        'connect-timeout-ms': None
+    })
+
+    # Then: Store is created using pymongo defaults
+    m_client.assert_called_once_with('mongodb://mock-host', tz_aware=True)
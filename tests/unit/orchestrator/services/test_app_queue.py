@@ -0,0 +1,213 @@
+import json
+import etcd
+from mock import MagicMock
+from nose.tools import eq_, ok_
+from orchestrator.services.app_queue import AppQueueService, coalesce
+
+__author__ = 'sukrit'
+
+QUEUE_KEY = '/totem/orchestrator/queues/apps/mock-app'
+
+
+def _etcd_queue(*items):
+    queue = etcd.EtcdResult(node={
+        'key': QUEUE_KEY,
+        'dir': True,
+        'nodes': [
+            {
+                'key': '%s/%020d' % (QUEUE_KEY, index),
+                'value': json.dumps(item),
+                'modifiedIndex': index
+            } for index, item in enumerate(items, 1)
+        ]
+    })
+    return queue
+
+
+class TestAppQueueService:
+    """
+    Tests AppQueueService
+    """
+
+    def setup(self):
+        self.etcd_cl = MagicMock(spec=etcd.Client)
+        self.queue = AppQueueService(etcd_cl=self.etcd_cl, etcd_base='/totem',
+                                     queue_ttl=100)
+
+    def test_enqueue(self):
+        """
+        Should append item to the ordered queue for the application
+        """
+        # Given: Item to be queued
+        item = {'commit': 'commit1'}
+
+        # When: I enqueue the item
+        key = self.queue.enqueue('mock-app', item)
+
+        # Then: Item is appended to the queue
+        self.etcd_cl.write.assert_called_once_with(
+            QUEUE_KEY, json.dumps(item), ttl=100, append=True)
+        eq_(key, self.etcd_cl.write.return_value.key)
+
+    def test_drain(self):
+        """
+        Should remove and return the queued items in order
+        """
+        # Given: Queue with items
+        self.etcd_cl.read.return_value = _etcd_queue(
+            {'commit': 'commit1'}, {'commit': 'commit2'})
+
+        # When: I drain the queue
+        items = self.queue.drain('mock-app')
+
+        # Then: Queued items are returned in order
+        eq_(items, [{'commit': 'commit1'}, {'commit': 'commit2'}])
+        self.etcd_cl.read.assert_called_once_with(
+            QUEUE_KEY, recursive=True, sorted=True)
+
+        # And: Items are removed from the queue
+        self.etcd_cl.delete.assert_any_call(
+            '%s/%020d' % (QUEUE_KEY, 1), prevIndex=1)
+        self.etcd_cl.delete.assert_any_call(
+            '%s/%020d' % (QUEUE_KEY, 2), prevIndex=2)
+
+        # And: Empty queue directory is removed
+        eq_(self.etcd_cl.delete.call_count, 3)
+        self.etcd_cl.delete.assert_called_with(QUEUE_KEY, dir=True)
+
+    def test_drain_when_items_are_queued_concurrently(self):
+        """
+        Should retain the queue directory
+        """
+        # Given: Queue with items
+        self.etcd_cl.read.return_value = _etcd_queue({'commit': 'commit1'})
+
+        # And: Item that gets queued while draining (Directory not empty)
+        self.etcd_cl.delete.side_effect = [
+            None, etcd.EtcdException('Unable to decode server response')]
+
+        # When: I drain the queue
+        items = self.queue.drain('mock-app')
+
+        # Then: Removed items are returned
+        eq_(items, [{'commit': 'commit1'}])
+
+    def test_drain_with_expired_item(self):
+        """
+        Should skip the items that expired before removal
+        """
+        # Given: Queue with items
+        self.etcd_cl.read.return_value = _etcd_queue(
+            {'commit': 'commit1'}, {'commit': 'commit2'})
+
+        # And: First item expires before it is removed
+        self.etcd_cl.delete.side_effect = [etcd.EtcdKeyNotFound(), None, None]
+
+        # When: I drain the queue
+        items = self.queue.drain('mock-app')
+
+        # Then: Only the removed item is returned
+        eq_(items, [{'commit': 'commit2'}])
+
+    def test_drain_for_non_existing_queue(self):
+        """
+        Should return empty list
+        """
+        # Given: Non existing queue
+        self.etcd_cl.read.side_effect = etcd.EtcdKeyNotFound()
+
+        # When: I drain the queue
+        items = self.queue.drain('mock-app')
+
+        # Then: Empty list is returned
+        eq_(items, [])
+
+    def test_size(self):
+        """
+        Should return no. of queued items
+        """
+        # Given: Queue with items
+        self.etcd_cl.read.return_value = _etcd_queue(
+            {'commit': 'commit1'}, {'commit': 'commit2'})
+
+        # When: I get the size of the queue
+        ret_value = self.queue.size('mock-app')
+
+        # Then: No. of queued items is returned
+        eq_(ret_value, 2)
+
+    def test_is_empty_for_empty_queue(self):
+        """
+        Should return True
+        """
+        # Given: Empty queue
+        self.etcd_cl.read.return_value = _etcd_queue()
+
+        # When: I check if queue is empty
+        ret_value = self.queue.is_empty('mock-app')
+
+        # Then: Queue is empty
+        ok_(ret_value)
+
+    def test_is_empty_for_non_empty_queue(self):
+        """
+        Should return False
+        """
+        # Given: Queue with items
+        self.etcd_cl.read.return_value = _etcd_queue({'commit': 'commit1'})
+
+        # When: I check if queue is empty
+        ret_value = self.queue.is_empty('mock-app')
+
+        # Then: Queue is not empty
+        ok_(not ret_value)
+
+
+def test_coalesce():
+    """
+    Should retain items only for the latest commit
+    """
+    # Given: Queued items
+    items = [
+        {'commit': 'commit1', 'hook_name': 'travis'},
+        {'commit': 'commit2', 'hook_name': 'travis'},
+        {'commit': 'commit1', 'hook_name': 'image-factory'},
+        {'commit': 'commit2', 'hook_name': 'image-factory'},
+    ]
+
+    # When: I coalesce the items
+    retained, superseded = coalesce(items)
+
+    # Then: Items for latest commit are retained (in order)
+    eq_(retained, [items[1], items[3]])
+    eq_(superseded, [items[0], items[2]])
+
+
+def test_coalesce_for_empty_items():
+    """
+    Should return empty lists
+    """
+    # When: I coalesce empty items
+    retained, superseded = coalesce([])
+
+    # Then: Empty lists are returned
+    eq_(retained, [])
+    eq_(superseded, [])
+
+
+def test_coalesce_with_items_having_no_commit():
+    """
+    Should always retain the items with no commit
+    """
+    # Given: Queued items with branch create hook (no commit)
+    items = [
+        {'commit': 'commit1', 'hook_name': 'github-push'},
+        {'commit': None, 'hook_name': 'github-create'},
+    ]
+
+    # When: I coalesce the items
+    retained, superseded = coalesce(items)
+
+    # Then: All items are retained
+    eq_(retained, items)
+    eq_(superseded, [])
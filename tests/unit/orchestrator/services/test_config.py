@@ -1,6 +1,6 @@
 from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
-import json
+import copy
 
 from parser import ParserError
 from future.builtins import (  # noqa
@@ -114,7 +114,9 @@ def test_get_s3_provider(mock_provider_list):
 @patch.dict('orchestrator.services.config.CONFIG_PROVIDERS', {
     'github': {
         'token': 'mocktoken',
-        'config_base': '/mock'
+        'config_base': '/mock',
+        'connect-timeout': 2.0,
+        'read-timeout': 10.0
     }
 })
 @patch('orchestrator.services.config.CONFIG_PROVIDER_LIST')
@@ -133,6 +135,7 @@ def test_get_github_provider(mock_provider_list):
     eq_(isinstance(provider, GithubConfigProvider), True)
     eq_(provider.auth, ('mocktoken', 'x-oauth-basic'))
     eq_(provider.config_base, '/mock')
+    eq_(provider.timeout, (2.0, 10.0))
 
 
 @patch.dict('orchestrator.services.config.CONFIG_PROVIDERS', {
@@ -248,6 +251,77 @@ def test_evaluate_value_with_nested_variables():
     })
 
 
+def _nested_deployer_config(depth, leaves_per_level=2):
+    """
+    Creates deeply nested deployer config with templated leaves at every
+    level.
+
+    :return: Tuple of config and no. of templated leaves
+    :rtype: tuple
+    """
+    node = {}
+    leaf_count = 0
+    for level in range(depth):
+        node = {
+            'nested-%d' % level: node,
+            'encrypted-%d' % level: {
+                'value': '{{ deployer }}-secret',
+                'encrypted': True
+            }
+        }
+        for leaf in range(leaves_per_level):
+            node['leaf-%d' % leaf] = {
+                'value': '{{ deployer }}-%d-%d' % (level, leaf)
+            }
+        leaf_count += leaves_per_level + 1
+    return {
+        'deployers': {
+            'deployer1': {
+                'variables': {
+                    'deployer': 'deployer1'
+                },
+                'deployment': node
+            }
+        }
+    }, leaf_count
+
+
+@patch('orchestrator.services.config.evaluate_template')
+def test_evaluate_value_renders_each_template_once(m_evaluate_template):
+    """
+    Should render every templated leaf exactly once irrespective of depth
+    """
+    # Given: Template renderer that echoes the template
+    m_evaluate_template.side_effect = lambda template, variables: template
+
+    for depth in (1, 4, 8, 16):
+        m_evaluate_template.reset_mock()
+
+        # And: Deeply nested deployer config
+        obj, leaf_count = _nested_deployer_config(depth)
+
+        # When: I evaluate the config
+        service.evaluate_value(obj, {})
+
+        # Then: No. of renders equals no. of templated leaves
+        eq_(m_evaluate_template.call_count, leaf_count)
+
+
+def test_evaluate_value_does_not_modify_input():
+    """
+    Should not modify the value being evaluated
+    """
+    # Given: Object that needs to be evaluated
+    obj, _ = _nested_deployer_config(3)
+    original = copy.deepcopy(obj)
+
+    # When: I evaluate object
+    service.evaluate_value(obj, {})
+
+    # Then: Original object remains unchanged
+    dict_compare(obj, original)
+
+
 def test_evaluate_variables():
     """
     Should evaluate config variables
@@ -403,24 +477,11 @@ def test_evaluate_config_with_deployers():
     })
 
 
-@patch('orchestrator.services.config.validate')
-@patch('orchestrator.services.config.open')
-@patch('repoze.lru.lru_cache')
-def test_validate_schema_for_successful_validation(m_lru_cache, m_open,
-                                                   m_validate):
+@patch('orchestrator.services.config.get_validator')
+def test_validate_schema_for_successful_validation(m_get_validator):
 
-    # Given: Existing schema
-    m_open.return_value.__enter__().read.return_value = '''{
-    "title": "Schema for Job Config",
-    "id": "#generic-hook-v1",
-    "properties": {
-        "mock": {
-            "$ref": "${base_url}/link/config#/properties/mock"
-        }
-    }
-}'''
-    # And: Validator that succeeds validation
-    m_validate.return_value = None
+    # Given: Validator that succeeds validation
+    m_get_validator.return_value.validate.return_value = None
 
     # And: Config that needs to be validated
     config = {
@@ -432,24 +493,18 @@ def test_validate_schema_for_successful_validation(m_lru_cache, m_open,
 
     # Then: Validation succeeds
     dict_compare(ret_value, config)
-    dict_compare(m_validate.call_args[0][0], config)
+    m_get_validator.assert_called_once_with('job-config-v1')
+    dict_compare(m_get_validator.return_value.validate.call_args[0][0],
+                 config)
 
 
 @raises(ConfigValidationError)
-@patch('orchestrator.services.config.validate')
-@patch('orchestrator.services.config.open')
-def test_validate_schema_for_failed_validation(m_open, m_validate):
-
-        # Given: Existing schema
-        schema = '''{
-        "title": "Schema for Job Config",
-        "id": "#generic-hook-v1"
-}'''
-        m_open().__enter__().read.return_value = schema
+@patch('orchestrator.services.config.get_validator')
+def test_validate_schema_for_failed_validation(m_get_validator):
 
-        # And: Validator that succeeds validation
-        m_validate.side_effect = ValidationError('MockError',
-                                                 schema=json.loads(schema))
+        # Given: Validator that fails validation
+        m_get_validator.return_value.validate.side_effect = ValidationError(
+            'MockError', schema={'id': '#generic-hook-v1'})
 
         # And: Config that needs to be validated
         config = {
@@ -462,6 +517,57 @@ def test_validate_schema_for_failed_validation(m_open, m_validate):
     # Then: ConfigValidationError is raised
 
 
+@patch.dict('orchestrator.services.config._validators', {}, clear=True)
+@patch('orchestrator.services.config._load_job_schema',
+       wraps=service._load_job_schema)
+def test_get_validator(m_load_job_schema):
+    """
+    Should create validators for all schemas only once
+    """
+
+    # When: I get validators for job config schemas (alternately)
+    validators = [service.get_validator(schema_name) for schema_name in (
+        'job-config-v1', 'job-config-evaluated-v1', 'job-config-v1')]
+
+    # Then: Validators are reused
+    eq_(validators[0], validators[2])
+    eq_(validators[0].schema['id'], '#job-config-v1')
+    eq_(validators[1].schema['id'], '#job-config-evaluated-v1')
+
+    # And: Every schema is loaded only once
+    eq_(m_load_job_schema.call_count, len(service._validators))
+
+
+@patch.dict('orchestrator.services.config._validators', {}, clear=True)
+@patch('jsonschema.validators.urlopen')
+def test_validate_schema_for_reference_to_other_schema(m_urlopen):
+    """
+    Should resolve reference to other schema without http request
+    """
+
+    # Given: Config with proxy hostname (references evaluated config schema)
+    config = {
+        'enabled': True,
+        'deployers': {
+            'default': {
+                'proxy': {
+                    'hosts': {
+                        'host1': {
+                            'hostname': 'host1.example.com'
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+    # When: I validate the config
+    service.validate_schema(config)
+
+    # Then: Other schema is not fetched using http
+    eq_(m_urlopen.call_count, 0)
+
+
 def test_transform_string_values():
     """
     Should transform string values inside config as expected.
@@ -569,11 +675,16 @@ def test_load_config(m_validate_schema, m_get_provider):
             'env1': 'val1'
         }
     }
-    m_get_provider.return_value.load.side_effect = [cfg1, cfg2]
+    m_get_provider.return_value.load_levels.return_value = {
+        'totem.yml': [cfg1],
+        'cluster-def.yml': [cfg2]
+    }
     m_validate_schema.side_effect = lambda vcfg, schema_name=None: vcfg
 
     # When: I load the config
-    loaded_config = config.load_config('mockpath1', 'mockpath2')
+    loaded_config = config.load_config(
+        'mockpath1', 'mockpath2',
+        config_names=['totem.yml', 'cluster-def.yml'])
 
     # Then: Config gets loaded as expected
     dict_compare(loaded_config, {
@@ -611,7 +722,7 @@ def test_load_config_when_config_is_invalid(m_validate_schema, m_get_provider):
     :return:
     """
     # Given: Existing valid config
-    m_get_provider.return_value.load.side_effect = ParserError('Mock')
+    m_get_provider.return_value.load_levels.side_effect = ParserError('Mock')
     m_validate_schema.side_effect = lambda vcfg, schema_name=None: vcfg
 
     # When: I load the config
@@ -698,3 +809,175 @@ def test_normalize_config():
         'direct-string': 'value',
         'direct-int': 1
     })
+
+
+@patch('orchestrator.services.config.get_provider')
+@patch('orchestrator.services.config._evaluate_raw_config')
+def test_load_config_with_cache(m_evaluate_raw_config, m_get_provider):
+    """
+    Should evaluate the config only once for same raw config and variables
+    """
+    # Given: Existing raw config
+    service.clear_config_cache()
+    m_get_provider.return_value.load_levels.return_value = {
+        'totem.yml': [{'mockkey': 'mockvalue'}]
+    }
+    m_evaluate_raw_config.return_value = {'mockkey': 'evaluated'}
+
+    # When: I load the config twice using same variables
+    config1 = config.load_config('mockpath1', config_names=['totem.yml'],
+                                 default_variables={'var1': 'value1'},
+                                 use_cache=True)
+    config2 = config.load_config('mockpath1', config_names=['totem.yml'],
+                                 default_variables={'var1': 'value1'},
+                                 use_cache=True)
+
+    # Then: Config is evaluated only once
+    eq_(m_evaluate_raw_config.call_count, 1)
+    dict_compare(config1, {'mockkey': 'evaluated'})
+    dict_compare(config2, {'mockkey': 'evaluated'})
+
+    # And: Cached config is not shared with the caller
+    eq_(config1 is config2, False)
+
+
+@patch('orchestrator.services.config.get_provider')
+@patch('orchestrator.services.config._evaluate_raw_config')
+def test_load_config_with_cache_for_different_variables(
+        m_evaluate_raw_config, m_get_provider):
+    """
+    Should re-evaluate the config when template variables change
+    """
+    # Given: Existing raw config
+    service.clear_config_cache()
+    m_get_provider.return_value.load_levels.return_value = {
+        'totem.yml': [{'mockkey': 'mockvalue'}]
+    }
+    m_evaluate_raw_config.return_value = {'mockkey': 'evaluated'}
+
+    # When: I load the config using different variables
+    for commit in ('commit1', 'commit2'):
+        config.load_config('mockpath1', config_names=['totem.yml'],
+                           default_variables={'commit': commit},
+                           use_cache=True)
+
+    # Then: Config is evaluated for each set of variables
+    eq_(m_evaluate_raw_config.call_count, 2)
+
+
+@patch('orchestrator.services.config.get_provider')
+@patch('orchestrator.services.config._evaluate_raw_config')
+def test_load_config_with_cache_disabled(m_evaluate_raw_config,
+                                         m_get_provider):
+    """
+    Should evaluate the config on every load when cache is disabled
+    """
+    # Given: Existing raw config
+    service.clear_config_cache()
+    m_get_provider.return_value.load_levels.return_value = {
+        'totem.yml': [{'mockkey': 'mockvalue'}]
+    }
+    m_evaluate_raw_config.return_value = {'mockkey': 'evaluated'}
+
+    # When: I load the config twice with cache disabled
+    for _ in range(2):
+        config.load_config('mockpath1', config_names=['totem.yml'],
+                           use_cache=False)
+
+    # Then: Config is evaluated on every load
+    eq_(m_evaluate_raw_config.call_count, 2)
+
+
+@patch('orchestrator.services.config._jinja_env')
+def test_evaluate_template_for_literal_value(m_jinja_env):
+    """
+    Should return stripped literal value without using jinja
+    """
+
+    # When: I evaluate a value that does not contain any template markers
+    result = service.evaluate_template('  literal-value  ', {'var1': 'value1'})
+
+    # Then: Stripped value is returned
+    eq_(result, 'literal-value')
+
+    # And: Template is not compiled
+    eq_(m_jinja_env.from_string.call_count, 0)
+
+
+def test_evaluate_template_uses_compiled_template_cache():
+    """
+    Should compile a given template only once
+    """
+    # Given: Jinja environment that tracks template compilation
+    service._template_cache.clear()
+    with patch.object(service, '_jinja_env',
+                      wraps=service._jinja_env) as m_jinja_env:
+
+        # When: I evaluate same template using different variables
+        result1 = service.evaluate_template('{{ var1 }}-suffix',
+                                            {'var1': 'value1'})
+        result2 = service.evaluate_template('{{ var1 }}-suffix',
+                                            {'var1': 'value2'})
+
+    # Then: Template is evaluated as expected
+    eq_(result1, 'value1-suffix')
+    eq_(result2, 'value2-suffix')
+
+    # And: Template is compiled only once
+    eq_(m_jinja_env.from_string.call_count, 1)
+
+
+def test_evaluate_template_with_line_statements():
+    """
+    Should evaluate template using line statements
+    """
+
+    # When: I evaluate template using line statements
+    result = service.evaluate_template(
+        '# if var1 is starting_with "value"\nmatched\n# endif',
+        {'var1': 'value1'})
+
+    # Then: Template is evaluated as expected
+    eq_(result, 'matched')
+
+
+@patch('orchestrator.services.config.get_provider')
+def test_explain_config(m_get_provider):
+    """
+    Should report stage timings and no. of templates rendered
+    """
+    # Given: Existing config with templates
+    m_get_provider.return_value.load_levels.return_value = {
+        'totem.yml': [{
+            'enabled': True,
+            'variables': {
+                'var1': 'value1'
+            },
+            'environment': {
+                'ENV1': {
+                    'value': '{{ var1 }}'
+                },
+                'ENV2': {
+                    'value': 'literal'
+                }
+            }
+        }]
+    }
+
+    # When: I explain the config load
+    report = config.explain_config('mockpath1', config_names=['totem.yml'])
+
+    # Then: Timings for all stages are reported
+    eq_([stage['name'] for stage in report['stages']], [
+        'config.load',
+        'config.merge',
+        'config.validate.job-config-v1',
+        'config.evaluate',
+        'config.transform',
+        'config.validate.job-config-evaluated-v1',
+        'config.normalize',
+        'config.total'
+    ])
+
+    # And: Only templates are rendered
+    eq_(report['counters'], {'config.templates-rendered': 1})
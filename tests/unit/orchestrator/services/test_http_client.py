@@ -0,0 +1,106 @@
+import threading
+from future.moves.http.server import BaseHTTPRequestHandler, HTTPServer
+from mock import patch
+from nose.tools import eq_, ok_
+from orchestrator.services import deployer_client, http_client, metrics
+
+__author__ = 'sukrit'
+
+"""
+Test for :mod: `orchestrator.services.http_client`
+"""
+
+
+class MockDeployerHandler(BaseHTTPRequestHandler):
+    # Keep-alive
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        body = b'{}'
+        self.send_response(201)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = _respond
+    do_DELETE = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpClient:
+    """
+    Tests for pooled http client
+    """
+
+    def setup(self):
+        metrics.reset()
+        http_client.close_sessions()
+        self.server = HTTPServer(('127.0.0.1', 0), MockDeployerHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.host = '127.0.0.1:{}'.format(self.server.server_port)
+
+    def teardown(self):
+        http_client.close_sessions()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_session(self):
+        """
+        Should return same session for all urls of the host
+        """
+        # When: I get session for urls of same host
+        session1 = http_client.get_session(self.base_url + '/apps')
+        session2 = http_client.get_session(self.base_url + '/apps/app1')
+
+        # Then: Same session is returned
+        ok_(session1 is session2)
+
+        # And: Different session is returned for other host
+        ok_(http_client.get_session('http://mock-deployer/apps') is not
+            session1)
+
+    def test_connection_reuse(self):
+        """
+        Should reuse the pooled connection for subsequent requests
+        """
+        # When: I send requests to the deployer
+        response1 = deployer_client.post(self.base_url + '/apps', data='{}')
+        response2 = deployer_client.delete(self.base_url + '/apps/app1')
+
+        # Then: Requests succeed
+        eq_(response1.status_code, 201)
+        eq_(response2.status_code, 201)
+
+        # And: Connection is reused for second request
+        ok_(not response1.connection_reused)
+        ok_(response2.connection_reused)
+        eq_(metrics.get_counters(), {
+            'deployer.{}.connections.new'.format(self.host): 1,
+            'deployer.{}.connections.reused'.format(self.host): 1
+        })
+
+        # And: Latency is recorded for the deployer
+        eq_(metrics.get_histograms()[
+            'deployer.{}.latency'.format(self.host)]['count'], 2)
+
+    @patch('requests.Session.request')
+    def test_request_with_default_timeout(self, m_request):
+        """
+        Should apply default connect and read timeouts
+        """
+        # When: I send request to the deployer
+        deployer_client.post(self.base_url + '/apps', data='{}')
+
+        # Then: Default timeouts are applied
+        m_request.assert_called_once_with(
+            'POST', self.base_url + '/apps', data='{}',
+            timeout=(deployer_client.DEPLOYER_HTTP['connect-timeout'],
+                     deployer_client.DEPLOYER_HTTP['read-timeout']))
@@ -10,14 +10,16 @@ from future.builtins import (  # noqa
     pow, round, super,
     filter, map, zip)
 from celery.tests.case import patch
-from nose.tools import eq_
+from nose.tools import eq_, raises
 from conf.appconfig import CLUSTER_NAME, TOTEM_ENV, \
     JOB_STATE_SCHEDULED, HOOK_STATUS_SUCCESS, HOOK_STATUS_PENDING, \
     HOOK_TYPE_BUILDER, HOOK_STATUS_FAILED
 from orchestrator.services import job
 from orchestrator.services.job import DEFAULT_FREEZE_TTL_SECONDS, \
     as_notify_ctx, as_callback_hook, create_job, get_template_variables, \
-    create_search_parameters, get_build_image, prepare_job, check_ready
+    create_search_parameters, get_build_image, prepare_job, check_ready, \
+    job_version, as_job_ref, get_job_for_ref
+from orchestrator.services.exceptions import JobNotFound, JobConflict
 from orchestrator.services.storage.base import EVENT_NEW_JOB
 from orchestrator.util import dict_merge
 from tests.helper import dict_compare
@@ -199,7 +201,7 @@ def test_create_job(m_get_store, m_uuid4):
     m_uuid4.return_value = MOCK_JOB_ID
 
     # And: Non existing job
-    m_get_store.return_value.filter_jobs.return_value = []
+    m_get_store.return_value.find_active_job.return_value = None
 
     # And: Mock config
     config = MOCK_EXISTING_JOB['config']
@@ -224,19 +226,43 @@ def test_create_job(m_get_store, m_uuid4):
         },
         'force-deploy': True
     }, MOCK_EXISTING_JOB)
-    dict_compare(job, expected_job)
+    dict_compare(job, dict_merge({'revision': 1}, expected_job))
+
+    # And: Job is created in the store (without revision)
+    m_get_store.return_value.update_job.assert_called_once_with(expected_job)
 
+    # And: New job event is added with compacted job (config reference)
+    m_get_store.return_value.compact_job.assert_called_once_with(expected_job)
     m_get_store.return_value.add_event.assert_called_once_with(
         EVENT_NEW_JOB,
         search_params={u'meta-info': {'job-id': MOCK_JOB_ID}},
-        details={'orchestrator-job': expected_job})
+        details={
+            'orchestrator-job':
+                m_get_store.return_value.compact_job.return_value
+        })
+
+
+@raises(JobConflict)
+@patch('uuid.uuid4')
+@patch('orchestrator.services.job.get_store')
+def test_create_job_when_created_concurrently(m_get_store, m_uuid4):
+    # Given: Job with same id that gets created concurrently
+    m_uuid4.return_value = MOCK_JOB_ID
+    m_get_store.return_value.find_active_job.return_value = None
+    m_get_store.return_value.update_job.return_value = False
+
+    # When: I create new job
+    create_job(MOCK_EXISTING_JOB['config'], MOCK_OWNER, MOCK_REPO, MOCK_REF,
+               commit=MOCK_COMMIT)
+
+    # Then: JobConflict is raised
 
 
 @patch('orchestrator.services.job.get_store')
 def test_create_job_when_exists(m_get_store):
     # Given: Existing job
     existing_job = MOCK_EXISTING_JOB
-    m_get_store.return_value.filter_jobs.return_value = [existing_job]
+    m_get_store.return_value.find_active_job.return_value = existing_job
 
     # When: I create new job
     job = create_job(existing_job['config'], MOCK_OWNER, MOCK_REPO, MOCK_REF,
@@ -246,7 +272,8 @@ def test_create_job_when_exists(m_get_store):
     expected_job = dict_merge({
         'meta-info': {
             'git': {
-                'commit': MOCK_COMMIT_NEW
+                'commit': MOCK_COMMIT_NEW,
+                'commit-set': [MOCK_COMMIT, MOCK_COMMIT_NEW]
             }
         },
         'hooks': {
@@ -260,12 +287,68 @@ def test_create_job_when_exists(m_get_store):
                     'status': HOOK_STATUS_PENDING
                 }
             }
-        }
+        },
+        'revision': 1
     }, existing_job)
     dict_compare(job, expected_job)
 
+    # And: Only the changed fields are updated
     m_get_store.return_value.add_event.assert_not_called()
-    m_get_store.return_value.update_job.assert_called_once_with(expected_job)
+    m_get_store.return_value.update_job.assert_not_called()
+    m_get_store.return_value.update_job_fields.assert_called_once_with(
+        MOCK_JOB_ID,
+        set_fields={
+            'hooks.ci.ci1': {'status': HOOK_STATUS_PENDING},
+            'hooks.builder.image-factory': {'status': HOOK_STATUS_PENDING},
+            'meta-info.git.commit': MOCK_COMMIT_NEW,
+            'config': existing_job['config']
+        },
+        push_fields={
+            'meta-info.git.commit-set': MOCK_COMMIT_NEW
+        },
+        revision=None)
+
+
+@patch('orchestrator.services.job.get_store')
+def test_create_job_when_exists_and_modified_concurrently(m_get_store):
+    # Given: Existing job
+    existing_job = dict_merge({'revision': 2}, MOCK_EXISTING_JOB)
+    m_get_store.return_value.find_active_job.return_value = existing_job
+
+    # And: Job that gets modified concurrently (by another hook)
+    m_get_store.return_value.update_job_fields.side_effect = [False, True]
+    m_get_store.return_value.get_job.return_value = dict_merge({
+        'revision': 3,
+        'state': JOB_STATE_SCHEDULED
+    }, existing_job)
+
+    # When: I create new job
+    job = create_job(existing_job['config'], MOCK_OWNER, MOCK_REPO, MOCK_REF,
+                     commit=MOCK_COMMIT_NEW)
+
+    # Then: Changes are applied to the latest job
+    eq_(job['revision'], 4)
+    eq_(job['state'], JOB_STATE_SCHEDULED)
+    eq_(job['meta-info']['git']['commit-set'],
+        [MOCK_COMMIT, MOCK_COMMIT_NEW])
+    eq_([call[1]['revision'] for call in
+         m_get_store.return_value.update_job_fields.call_args_list], [2, 3])
+
+
+@raises(JobConflict)
+@patch('orchestrator.services.job.get_store')
+def test_create_job_when_exists_and_modified_continuously(m_get_store):
+    # Given: Existing job that gets modified on every update attempt
+    existing_job = dict_merge({'revision': 2}, MOCK_EXISTING_JOB)
+    m_get_store.return_value.find_active_job.return_value = existing_job
+    m_get_store.return_value.update_job_fields.return_value = False
+    m_get_store.return_value.get_job.return_value = existing_job
+
+    # When: I create new job
+    create_job(existing_job['config'], MOCK_OWNER, MOCK_REPO, MOCK_REF,
+               commit=MOCK_COMMIT_NEW)
+
+    # Then: JobConflict is raised
 
 
 @patch('orchestrator.services.job.get_store')
@@ -278,7 +361,7 @@ def test_create_job_when_exists_with_superseded_commit(m_get_store):
             }
         }
     }, MOCK_EXISTING_JOB)
-    m_get_store.return_value.filter_jobs.return_value = [existing_job]
+    m_get_store.return_value.find_active_job.return_value = existing_job
 
     # When: I create new job
     job = create_job(existing_job['config'], MOCK_OWNER, MOCK_REPO, MOCK_REF,
@@ -289,14 +372,14 @@ def test_create_job_when_exists_with_superseded_commit(m_get_store):
     dict_compare(job, expected_job)
 
     m_get_store.return_value.add_event.assert_not_called()
-    m_get_store.return_value.update_job.assert_not_called()
+    m_get_store.return_value.update_job_fields.assert_not_called()
 
 
 @patch('orchestrator.services.job.get_store')
 def test_create_job_when_exists_with_no_commit_info(m_get_store):
     # Given: Existing job
     existing_job = MOCK_EXISTING_JOB
-    m_get_store.return_value.filter_jobs.return_value = [existing_job]
+    m_get_store.return_value.find_active_job.return_value = existing_job
 
     # When: I create new job with empty commit
     job = create_job(existing_job['config'], MOCK_OWNER, MOCK_REPO, MOCK_REF,
@@ -320,7 +403,7 @@ def test_create_job_when_exists_with_no_commit_info(m_get_store):
     dict_compare(job, expected_job)
 
     m_get_store.return_value.add_event.assert_not_called()
-    m_get_store.return_value.update_job.assert_not_called()
+    m_get_store.return_value.update_job_fields.assert_not_called()
 
 
 def test_template_variables():
@@ -477,12 +560,21 @@ def test_prepare_job(m_get_store):
                     }
                 }
             }
-        }
-
+        },
+        'revision': 1
     }, existing_job)
 
     dict_compare(job, expected_job)
-    m_get_store.return_value.update_job.assert_called_once_with(expected_job)
+    m_get_store.return_value.update_job_fields.assert_called_once_with(
+        MOCK_JOB_ID,
+        set_fields={
+            'state': JOB_STATE_SCHEDULED,
+            'hooks.builder.image-factory': {'status': HOOK_STATUS_SUCCESS},
+            'force-deploy': False,
+            'config': expected_job['config']
+        },
+        push_fields=None,
+        revision=None)
 
 
 @patch('orchestrator.services.job.get_store')
@@ -502,7 +594,7 @@ def test_prepare_job_for_non_configured_hook(m_get_store):
     # Then: Job state and hook info gets updated as expected
     expected_job = existing_job
     dict_compare(job, expected_job)
-    m_get_store.return_value.update_job.assert_not_called()
+    m_get_store.return_value.update_job_fields.assert_not_called()
 
 
 def test_check_ready_for_force_deploy():
@@ -573,3 +665,118 @@ def test_check_ready_for_pending_hooks():
         'pending': ['ci1'],
         'failed': ['image-factory']
     })
+
+
+def test_job_version_ignores_modified_timestamp():
+    """
+    Should return same version for jobs differing in modified timestamp
+    """
+    # Given: Jobs differing only by modified timestamp
+    job1 = dict_merge({'modified': 'mock-modified-1'}, MOCK_EXISTING_JOB)
+    job2 = dict_merge({'modified': 'mock-modified-2'}, MOCK_EXISTING_JOB)
+
+    # Then: Version for jobs is same
+    eq_(job_version(job1), job_version(job2))
+
+    # And: Version changes with job content
+    job3 = dict_merge({'state': 'mock-state'}, job1)
+    eq_(job_version(job1) == job_version(job3), False)
+
+
+@patch('orchestrator.services.job.get_store')
+def test_as_job_ref(m_get_store):
+    """
+    Should create job reference and add job snapshot once
+    """
+    # Given: Empty job cache
+    job.clear_cache()
+
+    # When: I create job reference (twice)
+    as_job_ref(MOCK_EXISTING_JOB)
+    job_ref = as_job_ref(MOCK_EXISTING_JOB)
+
+    # Then: Expected reference is returned
+    dict_compare(job_ref, {
+        'job-id': MOCK_JOB_ID,
+        'version': job_version(MOCK_EXISTING_JOB)
+    })
+
+    # And: Job snapshot is added once
+    m_get_store.return_value.add_job_snapshot.assert_called_once_with(
+        job_ref['version'], MOCK_EXISTING_JOB)
+
+
+@patch('orchestrator.services.job.get_store')
+def test_get_job_for_ref_using_cache(m_get_store):
+    """
+    Should resolve the job from worker local cache
+    """
+    # Given: Job reference created in current worker
+    job.clear_cache()
+    job_ref = as_job_ref(MOCK_EXISTING_JOB)
+
+    # When: I resolve the job reference
+    resolved = get_job_for_ref(job_ref)
+
+    # Then: Job is resolved using the cache
+    dict_compare(resolved, MOCK_EXISTING_JOB)
+    eq_(m_get_store.return_value.get_job_snapshot.call_count, 0)
+
+
+@patch('orchestrator.services.job.get_store')
+def test_get_job_for_ref_using_store(m_get_store):
+    """
+    Should resolve the job using job in the store (if version matches)
+    """
+    # Given: Job reference for job not cached in current worker
+    job.clear_cache()
+    job_ref = {
+        'job-id': MOCK_JOB_ID,
+        'version': job_version(MOCK_EXISTING_JOB)
+    }
+
+    # And: Snapshot does not exist but job exists in the store
+    m_get_store.return_value.get_job_snapshot.return_value = None
+    m_get_store.return_value.get_job.return_value = dict_merge(
+        {'modified': 'mock-modified'}, MOCK_EXISTING_JOB)
+
+    # When: I resolve the job reference
+    resolved = get_job_for_ref(job_ref)
+
+    # Then: Job is resolved using the store
+    eq_(resolved['meta-info']['job-id'], MOCK_JOB_ID)
+    m_get_store.return_value.get_job.assert_called_once_with(MOCK_JOB_ID)
+
+
+@patch('orchestrator.services.job.get_store')
+@raises(JobNotFound)
+def test_get_job_for_ref_with_version_mismatch(m_get_store):
+    """
+    Should raise JobNotFound
+    """
+    # Given: Job reference for job not cached in current worker
+    job.clear_cache()
+    job_ref = {
+        'job-id': MOCK_JOB_ID,
+        'version': 'mock-version'
+    }
+
+    # And: Job in the store has different version
+    m_get_store.return_value.get_job_snapshot.return_value = None
+    m_get_store.return_value.get_job.return_value = MOCK_EXISTING_JOB
+
+    # When: I resolve the job reference
+    get_job_for_ref(job_ref)
+
+    # Then: JobNotFound is raised
+
+
+def test_get_job_for_ref_with_job():
+    """
+    Should return the job as is
+    """
+    # When: I resolve job (in place of reference)
+    resolved = get_job_for_ref(MOCK_EXISTING_JOB)
+
+    # Then: Job is returned
+    eq_(resolved, MOCK_EXISTING_JOB)
@@ -0,0 +1,210 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from future.builtins import (  # noqa
+    bytes, dict, int, list, object, range, str,
+    ascii, chr, hex, input, next, oct, open,
+    pow, round, super,
+    filter, map, zip)
+from mock import MagicMock, patch
+from nose.tools import eq_, ok_
+from orchestrator.services import metrics
+from orchestrator.services.metrics import Histogram, MetricsPublisher
+
+__author__ = 'sukrit'
+
+
+class TestHistogram:
+    """
+    Tests Histogram
+    """
+
+    def test_observe(self):
+        """
+        Should record values in matching buckets
+        """
+        # Given: Histogram with buckets
+        histogram = Histogram(buckets=(1, 0.1))
+
+        # When: I record values
+        for value in (0.05, 0.5, 0.7, 2):
+            histogram.observe(value)
+
+        # Then: Values are recorded in cumulative buckets
+        eq_(histogram.to_dict(), {
+            'count': 4,
+            'sum': 3.25,
+            'max': 2,
+            'mean': 0.8125,
+            'buckets': [
+                {'le': 0.1, 'count': 1},
+                {'le': 1, 'count': 3},
+                {'le': '+Inf', 'count': 4}
+            ]
+        })
+
+    def test_to_dict_for_empty_histogram(self):
+        """
+        Should return zero mean for empty histogram
+        """
+        eq_(Histogram().to_dict()['mean'], 0.0)
+
+
+class TestMetrics:
+    """
+    Tests for timed stages and explain report
+    """
+
+    def setup(self):
+        metrics.reset()
+
+    def test_timed(self):
+        """
+        Should record the stage timing in histogram
+        """
+        # When: I time a stage twice
+        for _ in range(2):
+            with metrics.timed('mock-stage'):
+                pass
+
+        # Then: Timings are recorded
+        eq_(metrics.get_histograms()['mock-stage']['count'], 2)
+
+    def test_timed_on_error(self):
+        """
+        Should record the stage timing even if stage fails
+        """
+        # When: I time a failing stage
+        try:
+            with metrics.timed('mock-stage'):
+                raise ValueError('mock error')
+        except ValueError:
+            pass
+
+        # Then: Timing is recorded
+        eq_(metrics.get_histograms()['mock-stage']['count'], 1)
+
+    def test_explain(self):
+        """
+        Should collect stage timings and counters inside explain block
+        """
+        # When: I time stages and increment counters inside explain block
+        with metrics.explain() as report:
+            with metrics.timed('mock-outer'):
+                with metrics.timed('mock-inner'):
+                    metrics.increment('mock-counter')
+                metrics.increment('mock-counter', 2)
+
+        # And: Outside explain block
+        metrics.increment('mock-counter')
+        with metrics.timed('mock-outer'):
+            pass
+
+        # Then: Stages and counters inside the block are reported
+        eq_([stage['name'] for stage in report['stages']],
+            ['mock-inner', 'mock-outer'])
+        ok_(all(stage['seconds'] >= 0 for stage in report['stages']))
+        eq_(report['counters'], {'mock-counter': 3})
+
+        # And: Histograms include all timings
+        eq_(metrics.get_histograms()['mock-outer']['count'], 2)
+
+        # And: Counters include all increments
+        eq_(metrics.get_counters(), {'mock-counter': 4})
+
+
+def test_merge():
+    """
+    Should aggregate histograms and counters of multiple processes
+    """
+    # Given: Snapshots of two processes
+    histogram1 = Histogram(buckets=(1,))
+    histogram1.observe(0.5)
+    histogram2 = Histogram(buckets=(1,))
+    histogram2.observe(1.5)
+    snapshots = [
+        {
+            'histograms': {'config.total': histogram1.to_dict()},
+            'counters': {'config.cache-hits': 1}
+        },
+        {
+            'histograms': {'config.total': histogram2.to_dict()},
+            'counters': {'config.cache-hits': 2, 'deployer.failures': 1}
+        }
+    ]
+
+    # When: I merge the snapshots
+    merged = metrics.merge(snapshots)
+
+    # Then: Histograms and counters are aggregated
+    eq_(merged, {
+        'histograms': {
+            'config.total': {
+                'count': 2,
+                'sum': 2.0,
+                'max': 1.5,
+                'mean': 1.0,
+                'buckets': [
+                    {'le': 1, 'count': 1},
+                    {'le': '+Inf', 'count': 2}
+                ]
+            }
+        },
+        'counters': {'config.cache-hits': 3, 'deployer.failures': 1}
+    })
+
+    # And: Snapshots are not modified
+    eq_(snapshots[0]['histograms']['config.total']['count'], 1)
+
+
+class TestMetricsPublisher:
+    """
+    Tests for MetricsPublisher
+    """
+
+    def setup(self):
+        metrics.reset()
+        self.publish = MagicMock()
+        self.publisher = MetricsPublisher(self.publish, 3600)
+
+    @patch('orchestrator.services.metrics.process_id')
+    def test_publish(self, m_process_id):
+        """
+        Should publish the snapshot of current process
+        """
+        # Given: Recorded counters
+        m_process_id.return_value = 'mock-host-1'
+        metrics.increment('mock-counter')
+
+        # When: I publish the metrics
+        self.publisher.publish()
+
+        # Then: Snapshot is published
+        self.publish.assert_called_once_with('mock-host-1', {
+            'histograms': {},
+            'counters': {'mock-counter': 1}
+        })
+
+    def test_publish_when_store_fails(self):
+        """
+        Should not propagate the publish failure
+        """
+        # Given: Failing store
+        self.publish.side_effect = Exception('mock')
+
+        # When: I publish the metrics
+        self.publisher.publish()
+
+        # Then: Failure is ignored (logged)
+
+    @patch('orchestrator.services.metrics.threading.Thread')
+    def test_ensure_started(self, m_thread):
+        """
+        Should start the publisher once per process
+        """
+        # When: I ensure the publisher is started (twice)
+        self.publisher.ensure_started()
+        self.publisher.ensure_started()
+
+        # Then: Publisher thread is started once
+        eq_(m_thread.call_count, 1)
+        m_thread.return_value.start.assert_called_once_with()
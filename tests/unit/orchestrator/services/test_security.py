@@ -5,10 +5,12 @@ from future.builtins import (  # noqa
     ascii, chr, hex, input, next, oct, open,
     pow, round, super,
     filter, map, zip)
-from nose.tools import eq_, ok_
-from mock import patch
+from nose.tools import eq_, ok_, raises
+from mock import MagicMock, patch
+from encryption.store.s3 import S3Provider
+from orchestrator.services import security
 from orchestrator.services.security import using_encryption_store, \
-    decrypt_config
+    decrypt_config, CachedKeyStore
 
 MOCK_BUCKET = 'mockbucket'
 MOCK_PASSPHRASE = 'mock-passphrase'
@@ -42,6 +44,32 @@ def test_using_encryption_store_with_s3():
     # Then: Function is called with expected args
 
 
+@patch.dict('orchestrator.services.security.DECRYPT_CACHE',
+            {'enabled': False})
+@patch.dict('orchestrator.services.security.ENCRYPTION', {
+    'store': 's3',
+    's3': {
+        'bucket': MOCK_BUCKET,
+        'base': MOCK_BASE,
+    },
+    'passphrase': MOCK_PASSPHRASE
+})
+def test_using_encryption_store_when_cache_is_disabled():
+
+    # Given: Mock function wrapped with  using_encryption_store
+    @using_encryption_store
+    def mock_fn(*args, **kwargs):
+        return kwargs.get('store')
+
+    # When: I invoke mock_fn
+    store = mock_fn('arg1')
+
+    # Then: S3 store is used without caching the keys
+    eq_(type(store), S3Provider)
+    eq_(store.bucket, MOCK_BUCKET)
+    eq_(store.keys_base, MOCK_BASE)
+
+
 @patch.dict('orchestrator.services.security.ENCRYPTION', {})
 def test_using_encryption_store_with_no_provider():
 
@@ -60,6 +88,8 @@ def test_using_encryption_store_with_no_provider():
 @patch.dict('orchestrator.services.security.ENCRYPTION', {})
 @patch('orchestrator.services.security.decrypt_obj')
 def test_decrypt_config(m_decrypt_obj):
+    # Given: Empty cache
+    security.clear_cache()
 
     # When: I invoke decrypt config
     decrypt_config({'mockkey': 'mockvalue'})
@@ -68,3 +98,173 @@ def test_decrypt_config(m_decrypt_obj):
     m_decrypt_obj.assert_called_once_with(
         {'mockkey': 'mockvalue'}, profile='default', store=None,
         passphrase=None)
+
+
+@patch.dict('orchestrator.services.security.ENCRYPTION', {})
+@patch('orchestrator.services.security.decrypt_obj')
+def test_decrypt_config_using_cache(m_decrypt_obj):
+    # Given: Empty cache
+    security.clear_cache()
+    m_decrypt_obj.return_value = {'mockkey': 'decrypted'}
+
+    # When: I decrypt the same config twice
+    decrypted1 = decrypt_config({'mockkey': 'mockvalue'})
+    decrypted2 = decrypt_config({'mockkey': 'mockvalue'})
+
+    # Then: Config is decrypted only once
+    eq_(m_decrypt_obj.call_count, 1)
+    eq_(decrypted2, {'mockkey': 'decrypted'})
+
+    # And: Cached config is not shared with the caller
+    ok_(decrypted1 is not decrypted2)
+
+    # And: Config is decrypted again once the cache is cleared
+    security.clear_cache()
+    decrypt_config({'mockkey': 'mockvalue'})
+    eq_(m_decrypt_obj.call_count, 2)
+
+
+@patch.dict('orchestrator.services.security.ENCRYPTION', {})
+@patch.dict('orchestrator.services.security.DECRYPT_CACHE',
+            {'enabled': False})
+@patch('orchestrator.services.security.decrypt_obj')
+def test_decrypt_config_when_cache_is_disabled(m_decrypt_obj):
+    # Given: Empty cache
+    security.clear_cache()
+
+    # When: I decrypt the same config twice
+    decrypt_config({'mockkey': 'mockvalue'})
+    decrypt_config({'mockkey': 'mockvalue'})
+
+    # Then: Config is decrypted every time
+    eq_(m_decrypt_obj.call_count, 2)
+
+
+class TestCachedKeyStore:
+    """
+    Tests for CachedKeyStore
+    """
+
+    def setup(self):
+        self.store = MagicMock()
+        self.cached_store = CachedKeyStore(self.store, max_size=10, ttl=60)
+
+    def test_load_key(self):
+        """
+        Should load the key from the store only once per profile
+        """
+        # When: I load the keys
+        self.cached_store.load_key('default')
+        self.cached_store.load_key('default')
+        self.cached_store.load_key('other')
+
+        # Then: Keys are loaded from the store once per profile
+        eq_(self.store.load_key.call_count, 2)
+
+    def test_load_key_after_clear(self):
+        """
+        Should load the key from the store
+        """
+        # Given: Cached key
+        self.cached_store.load_key('default')
+
+        # When: I clear the cache and load the key
+        self.cached_store.clear()
+        self.cached_store.load_key('default')
+
+        # Then: Key is loaded again from the store
+        eq_(self.store.load_key.call_count, 2)
+
+    def test_invalidate(self):
+        """
+        Should remove the cached keys only for given profile
+        """
+        # Given: Cached keys for multiple profiles
+        self.cached_store.load_key('default')
+        self.cached_store.load_key('other')
+
+        # When: I invalidate the keys for the profile
+        invalidated = self.cached_store.invalidate('default')
+
+        # Then: Keys for the profile are loaded again from the store
+        ok_(invalidated)
+        self.cached_store.load_key('default')
+        self.cached_store.load_key('other')
+        eq_(self.store.load_key.call_count, 3)
+
+        # And: Profile with no cached keys is not invalidated
+        ok_(not self.cached_store.invalidate('missing'))
+
+    def test_store_operations_are_not_cached(self):
+        """
+        Should delegate other store operations to the store
+        """
+        # When: I invoke other store operation twice
+        self.cached_store.store_key('default', 'mock-key')
+        self.cached_store.store_key('default', 'mock-key')
+
+        # Then: Operation is invoked on the store every time
+        eq_(self.store.store_key.call_count, 2)
+
+    @patch.dict('orchestrator.services.security.DECRYPT_CACHE',
+                {'enabled': False})
+    @patch('orchestrator.services.security.decrypt_obj')
+    def test_decrypt_with_rotated_keys(self, m_decrypt_obj):
+        """
+        Should retry decryption using keys from the store
+        """
+        # Given: Decryption fails using the cached keys
+        self.cached_store.load_key('default')
+        m_decrypt_obj.side_effect = [ValueError('mock'), {'mock': 'value'}]
+
+        # When: I decrypt the config
+        decrypted = decrypt_config({'mock': 'encrypted'},
+                                   store=self.cached_store)
+
+        # Then: Config is decrypted using reloaded keys
+        eq_(decrypted, {'mock': 'value'})
+        self.cached_store.load_key('default')
+        eq_(self.store.load_key.call_count, 2)
+
+    @patch.dict('orchestrator.services.security.DECRYPT_CACHE',
+                {'enabled': False})
+    @patch('orchestrator.services.security.decrypt_obj')
+    @raises(ValueError)
+    def test_decrypt_with_invalid_config(self, m_decrypt_obj):
+        """
+        Should raise the decryption error
+        """
+        # Given: Decryption fails even after reloading the keys
+        self.cached_store.load_key('default')
+        m_decrypt_obj.side_effect = ValueError('mock')
+
+        # When: I decrypt the config
+        decrypt_config({'mock': 'encrypted'}, store=self.cached_store)
+
+        # Then: ValueError is raised
+
+    @patch.dict('orchestrator.services.security.DECRYPT_CACHE',
+                {'enabled': False})
+    @patch('orchestrator.services.security.decrypt_obj')
+    def test_decrypt_with_other_error(self, m_decrypt_obj):
+        """
+        Should raise the error without reloading the keys
+        """
+        # Given: Cached keys
+        self.cached_store.load_key('default')
+
+        # And: Decryption fails with error unrelated to keys
+        m_decrypt_obj.side_effect = TypeError('mock')
+
+        # When: I decrypt the config
+        try:
+            decrypt_config({'mock': 'encrypted'}, store=self.cached_store)
+        except TypeError:
+            pass
+
+        # Then: Decryption is not retried
+        eq_(m_decrypt_obj.call_count, 1)
+
+        # And: Cached keys are retained
+        self.cached_store.load_key('default')
+        eq_(self.store.load_key.call_count, 1)
@@ -1,6 +1,7 @@
 from mock import MagicMock, patch
 from nose.tools import eq_, raises
-from orchestrator.tasks.common import ErrorHandlerTask, ping, async_wait
+from orchestrator.tasks.common import ErrorHandlerTask, ping, async_wait, \
+    continue_with, _notify_failure
 from orchestrator.tasks.util import TaskNotReadyException
 
 
@@ -96,3 +97,75 @@ def test_async_wait_when_task_is_not_ready(m_simple_result):
     async_wait(result)
 
     # Then: TaskNotReadyException is re-raised
+
+
+@patch('orchestrator.tasks.common._notify_failure')
+def test_continue_with(m_notify_failure):
+    """
+    Should move callbacks and errbacks of current task to the signature
+    """
+    # Given: Task with async_wait callback and an errback
+    callback = async_wait.s()
+    errback = ping.si()
+    task = MagicMock()
+    task.request.callbacks = [dict(callback)]
+    task.request.errbacks = [errback]
+
+    # And: Signature to continue with
+    sig = MagicMock()
+
+    # When: I continue the task using the signature
+    ret_value = continue_with(task, sig, interval=5)
+
+    # Then: Callbacks and errbacks are moved to the signature
+    sig.link.assert_called_once_with(callback)
+    eq_(sig.link_error.call_count, 2)
+    sig.link_error.assert_any_call(m_notify_failure.s.return_value)
+    sig.link_error.assert_any_call(errback)
+    m_notify_failure.s.assert_called_once_with(callback)
+    eq_(task.request.callbacks, None)
+    eq_(task.request.errbacks, None)
+
+    # And: Signature is applied
+    sig.apply_async.assert_called_once_with(interval=5)
+    eq_(ret_value, sig.apply_async.return_value)
+
+
+def test_continue_with_no_callbacks():
+    """
+    Should apply the signature without linking any tasks
+    """
+    # Given: Task with no callbacks
+    task = MagicMock()
+    task.request.callbacks = None
+    task.request.errbacks = None
+
+    # And: Signature to continue with
+    sig = MagicMock()
+
+    # When: I continue the task using the signature
+    ret_value = continue_with(task, sig)
+
+    # Then: Signature is applied with no links
+    eq_(sig.link.call_count, 0)
+    eq_(sig.link_error.call_count, 0)
+    eq_(ret_value, sig.apply_async.return_value)
+
+
+@patch('orchestrator.tasks.common.AsyncResult')
+@patch('orchestrator.tasks.common.signature')
+def test_notify_failure(m_signature, m_async_result):
+    """
+    Should invoke the callback with result of failed task
+    """
+    # Given: Callback signature
+    callback = dict(async_wait.s())
+
+    # When: I notify failure for the task
+    _notify_failure('MockTaskId', callback)
+
+    # Then: Callback is invoked with the failed result
+    m_async_result.assert_called_once_with(
+        'MockTaskId', app=m_signature.call_args[1]['app'])
+    m_signature.return_value.delay.assert_called_once_with(
+        m_async_result.return_value)
@@ -0,0 +1,579 @@
+import json
+import etcd
+from celery.exceptions import Retry
+from mock import patch, MagicMock
+from nose.tools import eq_, raises
+from requests.exceptions import ConnectionError, ReadTimeout
+from orchestrator.services.app_queue import AppQueueService
+from orchestrator.services.distributed_lock import ResourceLockedException
+from orchestrator.services.storage.base import EVENT_COMMIT_IGNORED, \
+    EVENT_CALLBACK_HOOK, EVENT_DEPLOY_REQUESTED
+from orchestrator.tasks import job as job_tasks
+from orchestrator.tasks.exceptions import DeploymentFailed
+
+MOCK_OWNER = 'mock-owner'
+MOCK_REPO = 'mock-repo'
+MOCK_REF = 'mock-ref'
+MOCK_LOCK_NAME = 'local-mock-owner-mock-repo-mock-ref'
+MOCK_QUEUE_KEY = '/totem/orchestrator/queues/apps/' + MOCK_LOCK_NAME
+MOCK_LOCK = {
+    'name': MOCK_LOCK_NAME,
+    'key': '/totem/orchestrator/locks/' + MOCK_LOCK_NAME,
+    'value': 'mock-lock-value'
+}
+MOCK_JOB_CONFIG = {
+    'enabled': True,
+    'notifications': {},
+    'security': {
+        'profile': 'default'
+    }
+}
+
+
+def _queued_hook(hook_type, hook_name, commit):
+    return {
+        'hook_type': hook_type,
+        'hook_name': hook_name,
+        'hook_status': 'success',
+        'hook_result': None,
+        'commit': commit,
+        'force_deploy': False,
+        'owner': MOCK_OWNER,
+        'repo': MOCK_REPO,
+        'ref': MOCK_REF
+    }
+
+
+def _etcd_queue(items, start_index=1):
+    return etcd.EtcdResult(node={
+        'key': MOCK_QUEUE_KEY,
+        'dir': True,
+        'nodes': [
+            {
+                'key': '%s/%020d' % (MOCK_QUEUE_KEY, index),
+                'value': json.dumps(item),
+                'modifiedIndex': index
+            } for index, item in enumerate(items, start_index)
+        ]
+    })
+
+
+def _app_queue(*batches):
+    """
+    Creates app queue (backed by mock etcd client) that returns given batches
+    of queued items on successive reads (and empty queue afterwards).
+    """
+    etcd_cl = MagicMock(spec=etcd.Client)
+    batches = list(batches)
+
+    def read(key, **kwargs):
+        if not batches:
+            raise etcd.EtcdKeyNotFound()
+        return batches.pop(0)
+
+    etcd_cl.read.side_effect = read
+    return AppQueueService(etcd_cl=etcd_cl, etcd_base='/totem')
+
+
+class TestDrainAppQueue:
+    """
+    Tests for draining the application queue
+    """
+
+    def setup(self):
+        self.patchers = {
+            name: patch('orchestrator.tasks.job.{}'.format(name))
+            for name in ('LockService', 'AppQueueService', 'get_store',
+                         '_load_job_config', '_new_job')
+        }
+        self.mocks = {name: patcher.start()
+                      for name, patcher in self.patchers.items()}
+        self.mocks['LockService'].return_value.apply_lock.return_value = \
+            MOCK_LOCK
+        self.mocks['_load_job_config'].return_value = MOCK_JOB_CONFIG
+
+    def teardown(self):
+        for patcher in self.patchers.values():
+            patcher.stop()
+
+    def test_drain_app_queue(self):
+        """
+        Should process the hooks for the latest queued commit
+        """
+        # Given: Hooks queued for multiple commits
+        queue = _app_queue(_etcd_queue([
+            _queued_hook('ci', 'mock-ci', 'commit1'),
+            _queued_hook('ci', 'mock-ci', 'commit2'),
+            _queued_hook('builder', 'mock-builder', 'commit2'),
+            _queued_hook('ci', 'mock-ci-2', 'commit2'),
+        ]))
+        self.mocks['AppQueueService'].return_value = queue
+
+        # And: Hook that expires before it is drained
+        queue.etcd_cl.delete.side_effect = lambda key, **kwargs: \
+            _raise(etcd.EtcdKeyNotFound()) if key.endswith('%020d' % 4) \
+            else None
+
+        # When: I drain the queue
+        processed = job_tasks._drain_app_queue(MOCK_LOCK_NAME)
+
+        # Then: Hooks for the latest commit are processed (using single
+        # config load)
+        eq_(processed, 2)
+        eq_(self.mocks['_load_job_config'].call_count, 1)
+        eq_(self.mocks['_load_job_config'].call_args[1],
+            {'commit': 'commit2'})
+        eq_([(args[0], kwargs['hook_name'], kwargs['commit'])
+             for args, kwargs in self.mocks['_new_job'].call_args_list],
+            [(MOCK_JOB_CONFIG, 'mock-ci', 'commit2'),
+             (MOCK_JOB_CONFIG, 'mock-builder', 'commit2')])
+
+        # And: Superseded commit is ignored
+        store = self.mocks['get_store'].return_value
+        eq_(store.add_event.call_count, 1)
+        eq_(store.add_event.call_args[0][0], EVENT_COMMIT_IGNORED)
+        eq_(store.add_event.call_args[1]['details']['commits'], ['commit1'])
+
+        # And: Lock is released
+        self.mocks['LockService'].return_value.release\
+            .assert_called_once_with(MOCK_LOCK)
+
+    def test_drain_app_queue_when_lock_is_held(self):
+        """
+        Should not drain the queue
+        """
+        # Given: Lock held by another task
+        self.mocks['LockService'].return_value.apply_lock.side_effect = \
+            ResourceLockedException('mock', 'mock')
+
+        # When: I drain the queue
+        processed = job_tasks._drain_app_queue(MOCK_LOCK_NAME)
+
+        # Then: Queue is not drained
+        eq_(processed, 0)
+        self.mocks['AppQueueService'].return_value.drain.assert_not_called()
+
+    def test_drain_app_queue_when_config_load_fails(self):
+        """
+        Should continue with the hooks queued afterwards
+        """
+        # Given: Hooks queued in two batches
+        self.mocks['AppQueueService'].return_value = _app_queue(
+            _etcd_queue([_queued_hook('ci', 'mock-ci', 'commit1')]),
+            _etcd_queue([_queued_hook('ci', 'mock-ci', 'commit2')],
+                        start_index=2))
+
+        # And: Config for the first batch fails to load
+        self.mocks['_load_job_config'].side_effect = [
+            ValueError('mock'), MOCK_JOB_CONFIG]
+
+        # When: I drain the queue
+        processed = job_tasks._drain_app_queue(MOCK_LOCK_NAME)
+
+        # Then: Hooks of the second batch are processed
+        eq_(processed, 1)
+        self.mocks['_new_job'].assert_called_once_with(
+            MOCK_JOB_CONFIG, **_queued_hook('ci', 'mock-ci', 'commit2'))
+
+        # And: Lock is released
+        self.mocks['LockService'].return_value.release\
+            .assert_called_once_with(MOCK_LOCK)
+
+
+def _raise(error):
+    raise error
+
+
+@patch.dict(job_tasks.APP_QUEUE, {'enabled': True})
+@patch('orchestrator.tasks.job._drain_app_queue')
+@patch('orchestrator.tasks.job.AppQueueService')
+@patch('orchestrator.tasks.job.LockService')
+def test_release_lock_with_queued_hooks(m_lock, m_queue, m_drain):
+    # Given: Hooks queued while the lock was held
+    m_queue.return_value.is_empty.return_value = False
+
+    # When: I release the lock
+    job_tasks._release_lock(MOCK_LOCK)
+
+    # Then: Lock is released
+    m_lock.return_value.release.assert_called_once_with(MOCK_LOCK)
+
+    # And: Queue is drained
+    m_queue.return_value.is_empty.assert_called_once_with(MOCK_LOCK_NAME)
+    m_drain.si.assert_called_once_with(MOCK_LOCK_NAME)
+    m_drain.si.return_value.delay.assert_called_once_with()
+
+
+@patch.dict(job_tasks.APP_QUEUE, {'enabled': True})
+@patch('orchestrator.tasks.job._drain_app_queue')
+@patch('orchestrator.tasks.job.AppQueueService')
+@patch('orchestrator.tasks.job.LockService')
+def test_release_lock_with_empty_queue(m_lock, m_queue, m_drain):
+    # Given: No hooks queued while the lock was held
+    m_queue.return_value.is_empty.return_value = True
+
+    # When: I release the lock
+    job_tasks._release_lock(MOCK_LOCK)
+
+    # Then: Queue is not drained
+    m_drain.si.assert_not_called()
+
+
+class TestHandleCallbackHook:
+    """
+    Tests for debouncing the callback hooks
+    """
+
+    def setup(self):
+        self.patchers = {
+            name: patch('orchestrator.tasks.job.{}'.format(name))
+            for name in ('LockService', 'AppQueueService', 'get_store',
+                         '_load_job_config', '_new_job', '_using_lock',
+                         'notify', '_flush_hooks.si')
+        }
+        self.patchers['APP_QUEUE'] = patch.dict(job_tasks.APP_QUEUE,
+                                                {'enabled': False})
+        self.mocks = {name: patcher.start()
+                      for name, patcher in self.patchers.items()}
+        self.mocks['_load_job_config'].return_value = MOCK_JOB_CONFIG
+
+        # Hooks buffer (in memory)
+        self.buffered = []
+        hooks_queue = self.mocks['AppQueueService'].return_value
+        hooks_queue.enqueue.side_effect = \
+            lambda name, hook: self.buffered.append(hook)
+        hooks_queue.drain.side_effect = \
+            lambda name: [self.buffered.pop(0) for _ in list(self.buffered)]
+
+        # Only the first hook in the window gets the marker
+        self.mocks['LockService'].return_value.apply_lock.side_effect = [
+            MOCK_LOCK, ResourceLockedException('mock', 'mock'),
+            ResourceLockedException('mock', 'mock')]
+
+    def teardown(self):
+        for patcher in self.patchers.values():
+            patcher.stop()
+
+    def _handle_hook(self, commit):
+        return job_tasks.handle_callback_hook(
+            MOCK_OWNER, MOCK_REPO, MOCK_REF, 'ci', 'mock-ci', commit=commit)
+
+    @patch.dict(job_tasks.HOOK_SETTINGS, {'debounce-window': 30})
+    def test_handle_callback_hook_within_debounce_window(self):
+        """
+        Should create single job for the latest commit received in the window
+        """
+        # When: I receive multiple hooks (including redelivery) in the window
+        for commit in ('commit1', 'commit2', 'commit2'):
+            self._handle_hook(commit)
+
+        # Then: Hooks are buffered and a single flush gets scheduled
+        eq_(len(self.buffered), 3)
+        self.mocks['_flush_hooks.si'].assert_called_once_with(
+            MOCK_OWNER, MOCK_REPO, MOCK_REF, MOCK_LOCK)
+        self.mocks['_flush_hooks.si'].return_value.apply_async\
+            .assert_called_once_with(countdown=30)
+        self.mocks['_load_job_config'].assert_not_called()
+
+        # When: The window elapses
+        job_tasks._flush_hooks(MOCK_OWNER, MOCK_REPO, MOCK_REF, MOCK_LOCK)
+
+        # Then: Marker is released for the next window
+        self.mocks['LockService'].return_value.release\
+            .assert_called_once_with(MOCK_LOCK)
+
+        # And: Single job is created for the latest commit
+        eq_(self.mocks['_load_job_config'].call_count, 1)
+        eq_(self.mocks['_load_job_config'].call_args[1],
+            {'commit': 'commit2'})
+        self.mocks['_new_job'].si.assert_called_once_with(
+            MOCK_JOB_CONFIG, MOCK_OWNER, MOCK_REPO, MOCK_REF,
+            hook_type='ci', hook_name='mock-ci', hook_status='success',
+            hook_result=None, commit='commit2', force_deploy=False)
+        self.mocks['_using_lock'].si.assert_called_once_with(
+            name=MOCK_LOCK_NAME,
+            do_task=self.mocks['_new_job'].si.return_value)
+
+        # And: Superseded commit is ignored
+        store = self.mocks['get_store'].return_value
+        eq_([call[0][0] for call in store.add_event.call_args_list],
+            [EVENT_COMMIT_IGNORED, EVENT_CALLBACK_HOOK])
+        eq_(store.add_event.call_args_list[0][1]['details']['commits'],
+            ['commit1'])
+
+    @patch.dict(job_tasks.HOOK_SETTINGS, {'debounce-window': 30})
+    def test_flush_hooks_with_empty_buffer(self):
+        """
+        Should not process any hooks
+        """
+        # When: I flush the hooks for the window with no buffered hooks
+        ret_value = job_tasks._flush_hooks(
+            MOCK_OWNER, MOCK_REPO, MOCK_REF, MOCK_LOCK)
+
+        # Then: No job is created
+        eq_(ret_value, None)
+        self.mocks['_load_job_config'].assert_not_called()
+        self.mocks['_using_lock'].si.assert_not_called()
+
+    @patch.dict(job_tasks.HOOK_SETTINGS, {'debounce-window': 0})
+    def test_handle_callback_hook_without_debounce_window(self):
+        """
+        Should process each hook as it is received
+        """
+        # When: I receive multiple hooks
+        for commit in ('commit1', 'commit2'):
+            self._handle_hook(commit)
+
+        # Then: Hooks are not buffered
+        self.mocks['AppQueueService'].assert_not_called()
+        self.mocks['_flush_hooks.si'].assert_not_called()
+
+        # And: Job is created for every hook
+        eq_([call[1]['commit'] for call in
+             self.mocks['_load_job_config'].call_args_list],
+            ['commit1', 'commit2'])
+        eq_([call[1]['commit'] for call in
+             self.mocks['_new_job'].si.call_args_list],
+            ['commit1', 'commit2'])
+        eq_(self.mocks['_using_lock'].si.call_count, 2)
+
+        # And: No commit is ignored
+        store = self.mocks['get_store'].return_value
+        eq_([call[0][0] for call in store.add_event.call_args_list],
+            [EVENT_CALLBACK_HOOK, EVENT_CALLBACK_HOOK])
+
+
+def _deploy_response(deployer_name, status):
+    return {
+        'name': deployer_name,
+        'url': 'http://{}/apps'.format(deployer_name),
+        'status': status,
+        'response': {}
+    }
+
+
+class TestDeployAll:
+    """
+    Tests for sending deploy requests to all deployers
+    """
+
+    def setup(self):
+        self.patchers = {
+            name: patch('orchestrator.tasks.job.{}'.format(name))
+            for name in ('job_service', 'get_store',
+                         'create_search_parameters', '_deploy_request',
+                         '_notify_deploy_requested', '_job_complete',
+                         '_deploy_all.retry')
+        }
+        self.patchers['DEPLOY_FANOUT'] = patch.dict(job_tasks.DEPLOY_FANOUT, {
+            'max-workers': 8,
+            'retries': 3,
+            'retry-delay': 2.0,
+            'retry-backoff': 2
+        })
+        self.mocks = {name: patcher.start()
+                      for name, patcher in self.patchers.items()}
+        self.mocks['_deploy_all.retry'].side_effect = Retry()
+        self.job = self.mocks['job_service'].get_job_for_ref.return_value
+        self.responses = {}
+
+        def deploy_request(job, deployer_name):
+            response = self.responses[deployer_name]
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        self.mocks['_deploy_request'].side_effect = deploy_request
+
+    def teardown(self):
+        job_tasks._deploy_all.pop_request()
+        for patcher in self.patchers.values():
+            patcher.stop()
+
+    def _deploy_all(self, deployer_names, retries=0, errors=None):
+        job_tasks._deploy_all.push_request(retries=retries)
+        return job_tasks._deploy_all.run('mock-job-ref', deployer_names,
+                                         errors=errors)
+
+    def _requested_deployers(self):
+        add_events = self.mocks['get_store'].return_value.add_events
+        add_events.assert_called_once()
+        events = add_events.call_args[0][0]
+        for event in events:
+            eq_(event['type'], EVENT_DEPLOY_REQUESTED)
+        return [event['details']['name'] for event in events]
+
+    def test_deploy_all(self):
+        """
+        Should deploy to all deployers and complete the job
+        """
+        # Given: Deployers accepting the deploy request
+        self.responses = {
+            'deployer1': _deploy_response('deployer1', 202),
+            'deployer2': _deploy_response('deployer2', 202)
+        }
+
+        # When: I deploy to all deployers
+        ret_value = self._deploy_all(['deployer1', 'deployer2'])
+
+        # Then: Job is completed
+        eq_(ret_value, self.mocks['_job_complete'].return_value)
+        self.mocks['_job_complete'].assert_called_once_with('mock-job-ref')
+
+        # And: Deploy requests are recorded (using single store call)
+        eq_(self._requested_deployers(), ['deployer1', 'deployer2'])
+        eq_(self.mocks['_notify_deploy_requested'].call_count, 2)
+        self.mocks['_deploy_all.retry'].assert_not_called()
+
+    @raises(Retry)
+    def test_deploy_all_with_failed_deployers(self):
+        """
+        Should retry only the deployers that could not be reached or are
+        unavailable
+        """
+        # Given: Deployers with different failures
+        self.responses = {
+            'deployer1': _deploy_response('deployer1', 202),
+            'deployer2': _deploy_response('deployer2', 503),
+            'deployer3': ConnectionError(),
+            'deployer4': _deploy_response('deployer4', 500),
+            'deployer5': ReadTimeout()
+        }
+
+        # When: I deploy to all deployers
+        try:
+            self._deploy_all(sorted(self.responses))
+
+        # Then: Task is retried for unavailable deployers (carrying over the
+        # errors for failed deployers)
+        finally:
+            retry = self.mocks['_deploy_all.retry']
+            retry.assert_called_once()
+            eq_(retry.call_args[1]['args'],
+                ('mock-job-ref', ['deployer2', 'deployer3']))
+            eq_(retry.call_args[1]['countdown'], 2.0)
+            eq_(retry.call_args[1]['max_retries'], 3)
+            errors = retry.call_args[1]['kwargs']['errors']
+            eq_([type(error) for error in errors],
+                [DeploymentFailed, ReadTimeout])
+
+            # And: Deploy requests are recorded (using single store call)
+            eq_(self._requested_deployers(),
+                ['deployer1', 'deployer2', 'deployer4'])
+            self.mocks['_notify_deploy_requested'].assert_called_once_with(
+                self.job, self.responses['deployer1'])
+            self.mocks['_job_complete'].assert_not_called()
+
+    @raises(Retry)
+    def test_deploy_all_on_retry(self):
+        """
+        Should back off the retry countdown
+        """
+        # Given: Deployer that is still unavailable
+        self.responses = {
+            'deployer2': _deploy_response('deployer2', 503)
+        }
+        error = DeploymentFailed(_deploy_response('deployer4', 500))
+
+        # When: I retry the deploy (second attempt)
+        try:
+            self._deploy_all(['deployer2'], retries=2, errors=[error])
+
+        # Then: Task is retried with backoff
+        finally:
+            retry = self.mocks['_deploy_all.retry']
+            eq_(retry.call_args[1]['countdown'], 8.0)
+            eq_(retry.call_args[1]['kwargs']['errors'], [error])
+
+    def test_deploy_all_on_retry_with_earlier_errors(self):
+        """
+        Should fail the task with the errors from earlier attempts
+        """
+        # Given: Deployer that is available on retry
+        self.responses = {
+            'deployer2': _deploy_response('deployer2', 202)
+        }
+
+        # And: Deployer that failed in earlier attempt
+        error = DeploymentFailed(_deploy_response('deployer4', 500))
+
+        # When: I retry the deploy
+        try:
+            self._deploy_all(['deployer2'], retries=1, errors=[error])
+        except DeploymentFailed as exc:
+            raised = exc
+        else:
+            raised = None
+
+        # Then: Error from the earlier attempt is raised
+        eq_(raised, error)
+        self.mocks['_notify_deploy_requested'].assert_called_once_with(
+            self.job, self.responses['deployer2'])
+        self.mocks['_job_complete'].assert_not_called()
+
+    @raises(DeploymentFailed)
+    def test_deploy_all_after_retry_limit(self):
+        """
+        Should give up on unavailable deployers
+        """
+        # Given: Deployer that is still unavailable
+        self.responses = {
+            'deployer2': _deploy_response('deployer2', 503)
+        }
+
+        # When: I deploy on the last attempt
+        try:
+            self._deploy_all(['deployer2'], retries=3)
+
+        # Then: Task is not retried
+        finally:
+            self.mocks['_deploy_all.retry'].assert_not_called()
+            self.mocks['_job_complete'].assert_not_called()
+
+
+@patch.dict(job_tasks.TASK_PAYLOAD, {'job-refs': True})
+@patch.dict(job_tasks.DEPLOY_FANOUT, {'enabled': True})
+@patch('orchestrator.tasks.job.continue_with')
+@patch('orchestrator.tasks.job.job_service')
+@patch('orchestrator.tasks.job.get_store')
+def test_check_and_fire_deploy_with_job_refs(m_get_store, m_job_service,
+                                             m_continue_with):
+    """
+    Should write job snapshot before publishing deploy task
+    """
+    # Given: Job ready for deploy
+    job = {
+        'meta-info': {
+            'job-id': 'mock-job-id',
+            'git': {
+                'owner': MOCK_OWNER,
+                'repo': MOCK_REPO,
+                'ref': MOCK_REF,
+                'commit': 'mock-commit'
+            }
+        },
+        'force-deploy': True,
+        'config': {
+            'deployers': {
+                'deployer1': {
+                    'enabled': True,
+                    'url': 'http://deployer1'
+                }
+            }
+        }
+    }
+    calls = []
+    m_job_service.as_job_ref.side_effect = \
+        lambda job: calls.append('as_job_ref') or 'mock-job-ref'
+    m_continue_with.side_effect = \
+        lambda task, sig, **kwargs: calls.append('continue_with') or sig
+
+    # When: I check and fire deploy
+    ret_value = job_tasks._check_and_fire_deploy(job)
+
+    # Then: Job reference (with snapshot) is created before publishing
+    eq_(calls, ['as_job_ref', 'continue_with'])
+    m_job_service.as_job_ref.assert_called_once_with(job)
+
+    # And: Deploy task is passed the job reference
+    eq_(ret_value['args'], ('mock-job-ref', ['deployer1']))
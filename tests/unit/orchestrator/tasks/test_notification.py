@@ -1,6 +1,10 @@
+import json
 from mock import patch
+from requests.exceptions import ConnectionError
+from nose.tools import eq_
 from conf.appconfig import LEVEL_FAILED, LEVEL_FAILED_WARN, \
-    LEVEL_SUCCESS
+    LEVEL_SUCCESS, LEVEL_STARTED
+from orchestrator.services.distributed_lock import ResourceLockedException
 from orchestrator.tasks import notification
 
 
@@ -72,10 +76,10 @@ def test_notify(m_notify_hipchat):
     m_notify_hipchat.si.assert_called_once()
 
 
-@patch('orchestrator.tasks.notification.requests')
+@patch('orchestrator.tasks.notification._post')
 @patch('orchestrator.tasks.notification.templatefactory')
 @patch('orchestrator.tasks.notification.json')
-def test_notify_hipchat(m_json, m_templatefactory, m_requests):
+def test_notify_hipchat(m_json, m_templatefactory, m_post):
     """
     Should send hipchat notification
     :return:
@@ -94,7 +98,7 @@ def test_notify_hipchat(m_json, m_templatefactory, m_requests):
         'default')
 
     # Then: Notification gets send successfully
-    m_requests.post.assert_called_once_with(
+    m_post.assert_called_once_with(
         'https://api.hipchat.com/v2/room/mockroom/notification',
         headers={
             'content-type': 'application/json',
@@ -114,11 +118,11 @@ def test_notify_hipchat(m_json, m_templatefactory, m_requests):
     )
 
 
-@patch('orchestrator.tasks.notification.requests')
+@patch('orchestrator.tasks.notification._post')
 @patch('orchestrator.tasks.notification.templatefactory')
 @patch('orchestrator.tasks.notification.json')
 def test_notify_hipchat_for_level_success(m_json, m_templatefactory,
-                                          m_requests):
+                                          m_post):
     """
     Should send hipchat notification
     :return:
@@ -137,7 +141,7 @@ def test_notify_hipchat_for_level_success(m_json, m_templatefactory,
         'default')
 
     # Then: Notification gets send successfully
-    m_requests.post.assert_called_once_with(
+    m_post.assert_called_once_with(
         'https://api.hipchat.com/v2/room/mockroom/notification',
         headers={
             'content-type': 'application/json',
@@ -150,16 +154,16 @@ def test_notify_hipchat_for_level_success(m_json, m_templatefactory,
         })
 
 
-@patch('orchestrator.tasks.notification.requests')
+@patch('orchestrator.tasks.notification._post')
 @patch('orchestrator.tasks.notification.templatefactory')
 @patch('orchestrator.tasks.notification.json')
-def test_notify_slack(m_json, m_templatefactory, m_requests):
+def test_notify_slack(m_json, m_templatefactory, m_post):
     """
     Should send slack notification
     :return:
     """
-    # Given: Template factory that renders html template for notification
-    m_templatefactory.render_template.return_value = '{}'
+    # Given: Template factory that builds slack message for notification
+    m_templatefactory.build_slack_message.return_value = {}
 
     # And: Mock implementation for jsonify (for validating data)
     m_json.dumps.side_effect = lambda data: data
@@ -171,25 +175,25 @@ def test_notify_slack(m_json, m_templatefactory, m_requests):
         'default')
 
     # Then: Notification gets send successfully
-    m_requests.post.assert_called_once_with(
+    m_post.assert_called_once_with(
         'http://mockslackurl',
         headers={
             'content-type': 'application/json'
         },
-        data='{}')
+        data={})
 
 
-@patch('orchestrator.tasks.notification.requests')
+@patch('orchestrator.tasks.notification._post')
 @patch('orchestrator.tasks.notification.templatefactory')
 @patch('orchestrator.tasks.notification.json')
 def test_notify_slack_when_url_is_not_set(m_json, m_templatefactory,
-                                          m_requests):
+                                          m_post):
     """
     Should not send slack notification
     :return:
     """
-    # Given: Template factory that renders html template for notification
-    m_templatefactory.render_template.return_value = '{}'
+    # Given: Template factory that builds slack message for notification
+    m_templatefactory.build_slack_message.return_value = {}
 
     # And: Mock implementation for jsonify (for validating data)
     m_json.dumps.side_effect = lambda data: data
@@ -201,12 +205,12 @@ def test_notify_slack_when_url_is_not_set(m_json, m_templatefactory,
         'default')
 
     # Then: Notification is not sent
-    m_requests.post.assert_not_called()
+    m_post.assert_not_called()
 
 
-@patch('orchestrator.tasks.notification.requests')
+@patch('orchestrator.tasks.notification._post')
 @patch('orchestrator.tasks.notification.json')
-def test_github(m_json, m_requests):
+def test_github(m_json, m_post):
     """
     Should send github commit notification
     """
@@ -224,7 +228,7 @@ def test_github(m_json, m_requests):
         'default')
 
     # Then: Notification gets send successfully
-    m_requests.post.assert_called_once_with(
+    m_post.assert_called_once_with(
         'https://api.github.com/repos/mockowner/mockrepo/statuses/mockcommit',
         headers={
             'Content-Type': 'application/json',
@@ -238,9 +242,9 @@ def test_github(m_json, m_requests):
         })
 
 
-@patch('orchestrator.tasks.notification.requests')
+@patch('orchestrator.tasks.notification._post')
 @patch('orchestrator.tasks.notification.json')
-def test_github_with_no_git_metadata(m_json, m_requests):
+def test_github_with_no_git_metadata(m_json, m_post):
     """
     Should not send github commit notification when commit, ref, repo, owner is
     missing.
@@ -258,12 +262,12 @@ def test_github_with_no_git_metadata(m_json, m_requests):
         'default')
 
     # Then: Notification gets send successfully
-    m_requests.post.assert_not_called()
+    m_post.assert_not_called()
 
 
-@patch('orchestrator.tasks.notification.requests')
+@patch('orchestrator.tasks.notification._post')
 @patch('orchestrator.tasks.notification.json')
-def test_github_with_no_token(m_json, m_requests):
+def test_github_with_no_token(m_json, m_post):
     """
     Should not send github commit notification when GITHUB token is not
     specified.
@@ -282,4 +286,189 @@ def test_github_with_no_token(m_json, m_requests):
         'default')
 
     # Then: Notification gets send successfully
-    m_requests.post.assert_not_called()
+    m_post.assert_not_called()
+
+
+@patch.dict(notification.NOTIFICATION_SETTINGS, {'batch-window': 30})
+@patch('orchestrator.tasks.notification._buffer_notification')
+@patch('orchestrator.tasks.notification.notify_github')
+def test_notify_with_batching(m_notify_github, m_buffer_notification):
+    # Given: Enabled slack and github notifications
+    notifications = {
+        'slack': {
+            'enabled': True,
+            'level': LEVEL_FAILED
+        },
+        'github': {
+            'enabled': True,
+            'level': LEVEL_FAILED
+        }
+    }
+
+    # When: I invoke notify
+    notification.notify('mockerror', notifications=notifications)
+
+    # Then: Slack notification is buffered
+    m_buffer_notification.assert_called_once_with(
+        'slack', 'mockerror', None, LEVEL_FAILED, notifications['slack'],
+        'default')
+
+    # And: Github notification is sent right away
+    m_notify_github.si.assert_called_once_with(
+        'mockerror', None, LEVEL_FAILED, notifications['github'], 'default')
+
+
+@patch.dict(notification.NOTIFICATION_SETTINGS, {'batch-window': 30,
+                                                 'batch-max-size': 20})
+@patch('orchestrator.tasks.notification._flush_notifications')
+@patch('orchestrator.tasks.notification.LockService')
+@patch('orchestrator.tasks.notification.AppQueueService')
+def test_buffer_notification(m_queue, m_lock, m_flush):
+    # Given: Buffered notifications less than max size
+    m_queue.return_value.size.return_value = 1
+    target = notification._notification_target(
+        'slack', {'url': 'http://mockslackurl'}, 'default')
+
+    # When: I buffer the notification
+    notification._buffer_notification(
+        'slack', {'message': 'mock'}, {}, LEVEL_FAILED,
+        {'url': 'http://mockslackurl'}, 'default')
+
+    # Then: Notification is queued for the target
+    eq_(m_queue.return_value.enqueue.call_args[0][0], target)
+
+    # And: Flush is scheduled after the batch window
+    m_flush.si.assert_called_once_with(
+        'slack', target, {'url': 'http://mockslackurl'}, 'default',
+        marker=m_lock.return_value.apply_lock.return_value)
+    m_flush.si.return_value.apply_async.assert_called_once_with(countdown=30)
+
+
+@patch.dict(notification.NOTIFICATION_SETTINGS, {'batch-window': 30,
+                                                 'batch-max-size': 20})
+@patch('orchestrator.tasks.notification._flush_notifications')
+@patch('orchestrator.tasks.notification.LockService')
+@patch('orchestrator.tasks.notification.AppQueueService')
+def test_buffer_notification_when_flush_is_scheduled(m_queue, m_lock,
+                                                     m_flush):
+    # Given: Flush is already scheduled for the window
+    m_queue.return_value.size.return_value = 2
+    m_lock.return_value.apply_lock.side_effect = ResourceLockedException(
+        'mock', 'mock')
+
+    # When: I buffer the notification
+    ret_value = notification._buffer_notification(
+        'slack', {'message': 'mock'}, {}, LEVEL_FAILED,
+        {'url': 'http://mockslackurl'}, 'default')
+
+    # Then: Flush is not scheduled again
+    eq_(ret_value, None)
+    m_flush.si.assert_not_called()
+
+
+@patch.dict(notification.NOTIFICATION_SETTINGS, {'batch-window': 30,
+                                                 'batch-max-size': 20})
+@patch('orchestrator.tasks.notification._flush_notifications')
+@patch('orchestrator.tasks.notification.LockService')
+@patch('orchestrator.tasks.notification.AppQueueService')
+def test_buffer_notification_when_batch_is_full(m_queue, m_lock, m_flush):
+    # Given: Buffered notifications reach max size
+    m_queue.return_value.size.return_value = 20
+
+    # When: I buffer the notification
+    notification._buffer_notification(
+        'slack', {'message': 'mock'}, {}, LEVEL_FAILED,
+        {'url': 'http://mockslackurl'}, 'default')
+
+    # Then: Batch is flushed right away
+    m_flush.si.return_value.delay.assert_called_once_with()
+    m_lock.return_value.apply_lock.assert_not_called()
+
+
+@patch('orchestrator.tasks.notification.decrypt_config')
+@patch('orchestrator.tasks.notification._post')
+@patch('orchestrator.tasks.notification.LockService')
+@patch('orchestrator.tasks.notification.AppQueueService')
+def test_flush_notifications_for_slack(m_queue, m_lock, m_post,
+                                       m_decrypt_config):
+    # Given: Buffered slack notifications
+    m_queue.return_value.drain.return_value = [
+        {'obj': {'message': 'started'}, 'ctx': {}, 'level': LEVEL_STARTED,
+         'date': 1},
+        {'obj': {'message': 'success'}, 'ctx': {}, 'level': LEVEL_SUCCESS,
+         'date': 2},
+    ]
+    m_decrypt_config.side_effect = lambda config, profile: config
+
+    # When: I flush the notifications
+    ret_value = notification._flush_notifications(
+        'slack', 'mock-target', {'url': 'http://mockslackurl'}, 'default',
+        marker={'key': 'mock-marker'})
+
+    # Then: Marker is released
+    m_lock.return_value.release.assert_called_once_with(
+        {'key': 'mock-marker'})
+
+    # And: Single digest message is sent
+    eq_(ret_value, 2)
+    eq_(m_post.call_count, 1)
+    msg = json.loads(m_post.call_args[1]['data'])
+    eq_([attachment['ts'] for attachment in msg['attachments']], ['1', '2'])
+
+
+@patch('orchestrator.tasks.notification._flush_notifications.retry')
+@patch('orchestrator.tasks.notification.decrypt_config')
+@patch('orchestrator.tasks.notification._post')
+@patch('orchestrator.tasks.notification.LockService')
+@patch('orchestrator.tasks.notification.AppQueueService')
+def test_flush_notifications_when_post_fails(m_queue, m_lock, m_post,
+                                             m_decrypt_config, m_retry):
+    # Given: Buffered slack notifications
+    items = [
+        {'obj': {'message': 'started'}, 'ctx': {}, 'level': LEVEL_STARTED,
+         'date': 1}
+    ]
+    m_queue.return_value.drain.return_value = items
+    m_decrypt_config.side_effect = lambda config, profile: config
+
+    # And: Slack that could not be reached
+    error = ConnectionError('mock')
+    m_post.side_effect = error
+    m_retry.side_effect = Exception('mock-retry')
+
+    # When: I flush the notifications
+    try:
+        notification._flush_notifications(
+            'slack', 'mock-target', {'url': 'http://mockslackurl'},
+            'default', marker={'key': 'mock-marker'})
+    except Exception:
+        pass
+
+    # Then: Flush is retried with the drained notifications
+    m_retry.assert_called_once_with(exc=error, kwargs={'items': items})
+
+
+@patch('orchestrator.tasks.notification.decrypt_config')
+@patch('orchestrator.tasks.notification._post')
+@patch('orchestrator.tasks.notification.LockService')
+@patch('orchestrator.tasks.notification.AppQueueService')
+def test_flush_notifications_on_retry(m_queue, m_lock, m_post,
+                                      m_decrypt_config):
+    # Given: Notifications drained by earlier attempt
+    items = [
+        {'obj': {'message': 'started'}, 'ctx': {}, 'level': LEVEL_STARTED,
+         'date': 1}
+    ]
+    m_decrypt_config.side_effect = lambda config, profile: config
+
+    # When: I flush the notifications
+    ret_value = notification._flush_notifications(
+        'slack', 'mock-target', {'url': 'http://mockslackurl'}, 'default',
+        items=items)
+
+    # Then: Drained notifications are sent
+    eq_(ret_value, 1)
+    eq_(m_post.call_count, 1)
+
+    # And: Queue is not drained again
+    m_queue.return_value.drain.assert_not_called()
@@ -1,6 +1,9 @@
+from celery.exceptions import ChordError
+from celery.result import AsyncResult
 from mock import MagicMock
-from nose.tools import eq_
+from nose.tools import eq_, raises
 from orchestrator.tasks import util
+from orchestrator.tasks.exceptions import TaskExecutionException
 
 
 def test_as_dict_for_dictionary_type():
@@ -53,3 +56,20 @@ def test_as_dict_for_obj_with_no_to_dict_method():
         'code': 'INTERNAL',
         'message': repr(input)
     })
+
+
+@raises(TaskExecutionException)
+def test_check_or_raise_task_exception_for_chord_error_with_no_parent():
+    """
+    Should raise TaskExecutionException for failed chord with unknown parent
+    """
+    # Given: Failed chord result (restored using task id)
+    result = MagicMock(spec=AsyncResult)
+    result.failed.return_value = True
+    result.result = ChordError('Mock Error')
+    result.parent = None
+
+    # When: I check the result for exception
+    util.check_or_raise_task_exception(result)
+
+    # Then: TaskExecutionException is raised
@@ -0,0 +1,69 @@
+from mock import patch
+from nose.tools import eq_, raises
+from orchestrator.celery import app
+from orchestrator.serializer import JobReference
+from orchestrator.services.exceptions import JobNotFound
+
+__author__ = 'sukrit'
+
+"""
+Test for :mod: `orchestrator.celery`
+"""
+
+MOCK_JOB = {
+    'meta-info': {
+        'job-id': 'mock-job-id'
+    },
+    'config': {}
+}
+
+
+@app.task
+def _mock_task(job, error_tasks=None):
+    return job
+
+
+@app.task(bind=True)
+def _mock_bound_task(self):
+    return self.request.retries, self.request.callbacks
+
+
+@patch('orchestrator.serializer.get_job_for_ref')
+def test_task_with_job_reference(m_get_job_for_ref):
+    # Given: Existing job for the reference
+    m_get_job_for_ref.return_value = MOCK_JOB
+
+    # When: I run the task with job reference
+    result = _mock_task(JobReference('mock-job-id', 'mock-version'))
+
+    # Then: Task gets the job
+    eq_(result, MOCK_JOB)
+    m_get_job_for_ref.assert_called_once_with(
+        {'job-id': 'mock-job-id', 'version': 'mock-version'})
+
+
+@raises(JobNotFound)
+@patch('orchestrator.serializer.get_job_for_ref')
+def test_task_with_missing_job(m_get_job_for_ref):
+    # Given: Job reference that can not be resolved
+    m_get_job_for_ref.side_effect = JobNotFound('mock-job-id', 'mock-version')
+
+    # When: I run the task with job reference
+    _mock_task(JobReference('mock-job-id', 'mock-version'))
+
+    # Then: Task fails with JobNotFound
+
+
+def test_task_executed_by_worker():
+    # Given: Request pushed by the worker (on retry with callback)
+    _mock_bound_task.push_request(retries=2, callbacks=['mock-callback'],
+                                  called_directly=False)
+
+    # When: Worker executes the task
+    try:
+        result = _mock_bound_task()
+    finally:
+        _mock_bound_task.pop_request()
+
+    # Then: Task gets the request pushed by the worker
+    eq_(result, (2, ['mock-callback']))
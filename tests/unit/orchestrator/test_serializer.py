@@ -0,0 +1,211 @@
+import copy
+from celery import signature
+from mock import patch
+from nose.tools import eq_, ok_, raises
+from orchestrator import serializer
+from orchestrator.serializer import JobReference, SerializerError
+from orchestrator.services import metrics
+from orchestrator.services.exceptions import JobNotFound
+from orchestrator.services import job as job_service
+
+__author__ = 'sukrit'
+
+"""
+Test for :mod: `orchestrator.serializer`
+"""
+
+MOCK_JOB = {
+    'config': {
+        'deployers': {
+            'default': {
+                'url': 'http://mock-deployer'
+            }
+        }
+    },
+    'meta-info': {
+        'job-id': 'mock-job-id'
+    },
+    'state': 'SCHEDULED'
+}
+
+
+def _task_message(job):
+    return {
+        'task': 'orchestrator.tasks.job._deploy',
+        'id': 'mock-task-id',
+        'args': (job, 'default'),
+        'kwargs': {},
+        'chord': signature('orchestrator.tasks.job._job_complete',
+                           args=(job,), immutable=True)
+    }
+
+
+class TestSerializer:
+    """
+    Tests dumps and loads
+    """
+
+    def setup(self):
+        metrics.reset()
+        job_service.clear_cache()
+
+    def test_dumps_and_loads_small_payload(self):
+        """
+        Should encode payload without compression
+        """
+        # When: I encode small payload
+        data = serializer.dumps({'mock': 'result'})
+
+        # Then: Payload is not compressed
+        eq_(data[:2], b'\x01\x00')
+
+        # And: Payload is decoded as expected
+        eq_(serializer.loads(data), {'mock': 'result'})
+
+    def test_dumps_and_loads_large_payload(self):
+        """
+        Should compress payload
+        """
+        # Given: Task message with large payload
+        job = copy.deepcopy(MOCK_JOB)
+        job['config']['large'] = ['value'] * 1000
+        message = _task_message(job)
+
+        # When: I encode the message
+        data = serializer.dumps(message)
+
+        # Then: Payload is compressed
+        eq_(data[:2], b'\x01\x01')
+        ok_(len(data) < 1024)
+
+        # And: Payload is decoded as expected
+        eq_(serializer.loads(data), message)
+
+        # And: Payload size is recorded for the task
+        histogram = metrics.get_histograms()[
+            'celery.payload.orchestrator.tasks.job._deploy']
+        eq_(histogram['count'], 1)
+        eq_(histogram['sum'], len(data))
+
+    @raises(SerializerError)
+    def test_loads_with_unsupported_version(self):
+        """
+        Should raise SerializerError
+        """
+        # When: I decode payload with unknown schema version
+        serializer.loads(b'\x02\x00payload')
+
+    @patch.dict(serializer.TASK_PAYLOAD, {'job-refs': True})
+    @patch('orchestrator.services.job.get_store')
+    def test_dumps_with_job_refs(self, m_get_store):
+        """
+        Should encode job documents as is (without store writes)
+        """
+        # Given: Task message
+        message = _task_message(copy.deepcopy(MOCK_JOB))
+
+        # When: I encode the message
+        data = serializer.dumps(message)
+
+        # Then: Store is not used
+        m_get_store.assert_not_called()
+
+        # And: Job is encoded in the message
+        eq_(serializer.pickle.loads(data[2:]), message)
+
+    @patch('orchestrator.services.job.get_store')
+    def test_loads_with_job_references(self, m_get_store):
+        """
+        Should rehydrate job references using job snapshot from the store
+        """
+        # Given: Message containing job references (queued by older worker)
+        message = _task_message(copy.deepcopy(MOCK_JOB))
+        ref = JobReference('mock-job-id', job_service.job_version(MOCK_JOB))
+        data = b'\x01\x00' + serializer.pickle.dumps(
+            _task_message(ref), protocol=serializer.PICKLE_PROTOCOL)
+
+        # And: Job snapshot exists in the store
+        m_get_store.return_value.get_job_snapshot.return_value = \
+            copy.deepcopy(MOCK_JOB)
+
+        # When: I decode the message
+        decoded = serializer.loads(data)
+
+        # Then: Job references are decoded as is (without store lookups)
+        ok_(isinstance(decoded['args'][0], JobReference))
+        m_get_store.return_value.get_job_snapshot.assert_not_called()
+
+        # And: Job gets rehydrated using the store
+        eq_(serializer.rehydrate(decoded), message)
+        m_get_store.return_value.get_job_snapshot.assert_called_once_with(
+            job_service.job_version(MOCK_JOB))
+
+    @patch.dict(serializer.TASK_PAYLOAD, {'job-refs': False})
+    @patch('orchestrator.services.job.get_store')
+    def test_loads_without_job_refs(self, m_get_store):
+        """
+        Should decode deploy message passing job document (flag off)
+        """
+        # Given: Deploy message passing job in place of job reference
+        message = _task_message(copy.deepcopy(MOCK_JOB))
+
+        # When: I encode, decode and rehydrate the message
+        decoded = serializer.rehydrate(
+            serializer.loads(serializer.dumps(message)))
+
+        # Then: Job is decoded as is
+        eq_(decoded, message)
+
+        # And: Job is resolved without store lookups
+        eq_(job_service.get_job_for_ref(decoded['args'][0]), MOCK_JOB)
+        m_get_store.assert_not_called()
+
+    @patch('orchestrator.services.job.get_store')
+    def test_loads_with_job_refs(self, m_get_store):
+        """
+        Should decode deploy message passing job reference (flag on)
+        """
+        # Given: Deploy message passing job reference
+        job_ref = {
+            'job-id': 'mock-job-id',
+            'version': job_service.job_version(MOCK_JOB)
+        }
+        message = _task_message(job_ref)
+
+        # When: I encode and decode the message
+        decoded = serializer.loads(serializer.dumps(message))
+
+        # Then: Job reference is decoded as is
+        eq_(serializer.rehydrate(decoded), message)
+        m_get_store.assert_not_called()
+
+    def test_loads_compressed_payload_from_older_worker(self):
+        """
+        Should decode compressed payload irrespective of compression
+        threshold
+        """
+        # Given: Small payload compressed by worker using lower threshold
+        message = _task_message(copy.deepcopy(MOCK_JOB))
+        data = b'\x01\x01' + serializer.zlib.compress(serializer.pickle.dumps(
+            message, protocol=serializer.PICKLE_PROTOCOL))
+
+        # When: I decode the payload
+        decoded = serializer.loads(data)
+
+        # Then: Payload is decoded as expected
+        eq_(decoded, message)
+
+    @patch('orchestrator.services.job.get_store')
+    @raises(JobNotFound)
+    def test_rehydrate_for_missing_snapshot(self, m_get_store):
+        """
+        Should raise JobNotFound
+        """
+        # Given: Job snapshot and job do not exist
+        m_get_store.return_value.get_job_snapshot.return_value = None
+        m_get_store.return_value.get_job.return_value = None
+
+        # When: I rehydrate job reference
+        serializer.rehydrate({'args': [JobReference('mock-job-id', 'mock')]})
+
+        # Then: JobNotFound is raised
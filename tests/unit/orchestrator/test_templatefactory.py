@@ -0,0 +1,158 @@
+import json
+from jinja2 import Template
+from mock import patch
+from nose.tools import eq_
+from conf.appconfig import LEVEL_FAILED, LEVEL_FAILED_WARN, \
+    LEVEL_STARTED, LEVEL_SUCCESS
+from orchestrator import templatefactory
+
+__author__ = 'sukrit'
+
+"""
+Test for :mod: `orchestrator.templatefactory`
+"""
+
+MOCK_CTX = {
+    'env': 'local',
+    'operation': 'deploy',
+    'owner': 'mock-owner',
+    'repo': 'mock-repo',
+    'ref': 'mock-ref',
+    'commit': 'mock-commit',
+    'job-id': 'mock-job-id',
+    'github': True
+}
+
+# Former slack template (slack.json.jinja) that build_slack_message replaces
+SLACK_TEMPLATE = '''{
+  "username": "Orchestrator ({{ctx.env}}-{{ctx.operation}})",
+  "channel": "{{ notification.channel or '#totem' }}",
+  "text": " ",
+
+  "attachments": [
+      {
+          "text": "{% if notification.code %}{{ notification.code}}: \\
+{% endif %}{{ notification.message | truncate(1000) }} \\
+{%if notification.code == 'CONFIG_VALIDATION_ERROR' -%}
+            <https://github.com/totem/cluster-orchestrator/blob/master/\\
+schemas/job-config-v1.json | Click here to view the job-config-v1 schema.>
+          {%- endif %} {% if ctx['job-id'] -%}
+            (job-id: {{ ctx['job-id'] }})
+          {%- endif -%}",
+          "color":
+              {% if level == 1 %}
+                "danger"
+              {% elif level == 2 %}
+                "warning"
+              {% elif level == 3 %}
+                "good"
+              {% else %}
+                "#439FE0"
+              {% endif %},
+          "footer":
+              {% if ctx.github %}
+                "<https://github.com/{{ctx.owner}}|{{ctx.owner or 'NA'}}> / \\
+<https://github.com/{{ctx.owner}}/{{ctx.repo}}|{{ctx.repo or 'NA'}}> / \\
+<https://github.com/{{ctx.owner}}/{{ctx.repo}}/tree/{{ctx.ref}}|\\
+{{ctx.ref | truncate(30, True) or 'NA'}}> / \\
+<https://github.com/{{ctx.owner}}/{{ctx.repo}}/commit/\\
+{{(ctx.commit or ctx.ref or 'NA')[0:7]}}|\\
+{{(ctx.commit or ctx.ref or 'NA')[0:7]}}>\\n"
+              {% else %}
+                "{{ctx.owner or 'NA'}}/{{ctx.repo or 'NA'}}/\\
+{{ctx.ref | truncate(30, True) or 'NA' }}/{{(ctx.commit or 'NA')[0:7]}}"
+              {% endif %},
+          "ts": "{{ notification.date }}"
+      }
+  ]
+
+}'''.replace('\\\n', '')
+
+
+def test_build_slack_message():
+    """
+    Should build slack message for the notification
+    """
+    # When: I build slack message for failure notification
+    msg = templatefactory.build_slack_message(
+        {'message': 'mock message', 'code': 'MOCK_ERROR', 'date': 1,
+         'channel': '#mock'},
+        MOCK_CTX, LEVEL_FAILED)
+
+    # Then: Slack message is built as expected
+    eq_(msg, {
+        'username': 'Orchestrator (local-deploy)',
+        'channel': '#mock',
+        'text': ' ',
+        'attachments': [{
+            'text': 'MOCK_ERROR: mock message  (job-id: mock-job-id)',
+            'color': 'danger',
+            'footer': '<https://github.com/mock-owner|mock-owner> / '
+                      '<https://github.com/mock-owner/mock-repo|mock-repo> / '
+                      '<https://github.com/mock-owner/mock-repo/tree/mock-ref'
+                      '|mock-ref> / '
+                      '<https://github.com/mock-owner/mock-repo/commit/'
+                      'mock-co|mock-co>\n',
+            'ts': '1'
+        }]
+    })
+
+
+def test_build_slack_message_for_non_github_ctx():
+    """
+    Should build slack message with plain footer
+    """
+    # Given: Context for non github repository
+    ctx = dict(MOCK_CTX, github=False)
+
+    # When: I build slack message with long notification message
+    msg = templatefactory.build_slack_message(
+        {'message': 'word ' * 400, 'date': 1}, ctx, LEVEL_STARTED)
+
+    # Then: Slack message is built with defaults
+    eq_(msg['channel'], '#totem')
+    attachment = msg['attachments'][0]
+    eq_(attachment['color'], '#439FE0')
+    eq_(attachment['footer'], 'mock-owner/mock-repo/mock-ref/mock-co')
+
+    # And: Message is truncated at word boundary
+    eq_(attachment['text'], 'word ' * 200 + '...  (job-id: mock-job-id)')
+
+
+def test_build_slack_message_matches_template():
+    """
+    Should build the same slack message as the former slack template
+    """
+    template = Template(SLACK_TEMPLATE)
+    long_ref = 'feature/' + 'r' * 40
+    for notification, ctx, level in (
+            ({'message': 'mock message', 'code': 'MOCK_ERROR', 'date': 1,
+              'channel': '#mock'}, MOCK_CTX, LEVEL_FAILED),
+            ({'message': 'invalid', 'code': 'CONFIG_VALIDATION_ERROR'},
+             dict(MOCK_CTX, ref=long_ref), LEVEL_FAILED_WARN),
+            ({'message': 'word ' * 400, 'date': 1},
+             dict(MOCK_CTX, github=False, ref=long_ref), LEVEL_STARTED),
+            ({'message': 'm' * 2000}, {'github': False}, LEVEL_SUCCESS)):
+
+        # When: I build slack message for the notification
+        msg = templatefactory.build_slack_message(notification, ctx, level)
+
+        # Then: Message matches the rendered template
+        eq_(msg, json.loads(template.render(
+            notification=notification, ctx=ctx, level=level)))
+
+
+@patch.object(templatefactory, 'env')
+def test_precompile(m_env):
+    """
+    Should compile all templates
+    """
+    # Given: Templates
+    m_env.list_templates.return_value = ['hipchat.html']
+
+    # When: I precompile the templates
+    templates = templatefactory.precompile()
+
+    # Then: All templates are compiled
+    eq_(templates, ['hipchat.html'])
+    m_env.get_template.assert_called_once_with('hipchat.html')
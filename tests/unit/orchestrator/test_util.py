@@ -1,6 +1,7 @@
-from nose.tools import eq_
+import copy
+from nose.tools import eq_, ok_, assert_raises
 
-from orchestrator.util import dict_merge
+from orchestrator.util import dict_merge, dict_merge_shared, FrozenDict
 
 
 __author__ = 'sukrit'
@@ -43,3 +44,79 @@ def test_dict_merge():
         },
         'key3': 'value3',
     })
+
+
+def test_dict_merge_shared():
+    """
+    should merge the dictionaries sharing the untouched sub trees
+    """
+
+    # Given: Dict obj that needs to be merged
+    dict1 = {
+        'key1': 'value1',
+        'key2': {
+            'key2.1': 'value2.1a'
+        }
+    }
+
+    dict2 = {
+        'key3': {
+            'key3.1': 'value3.1'
+        },
+        'key2': {
+            'key2.1': 'value2.1b',
+            'key2.2': 'value2.2a'
+        }
+    }
+
+    # When: I merge the two dictionaries
+    merged_dict = dict_merge_shared(dict1, dict2)
+
+    # Then: Merged dictionary is returned
+    eq_(merged_dict, dict_merge(dict1, dict2))
+
+    # And: Untouched sub trees are shared
+    ok_(merged_dict['key3'] is dict2['key3'])
+
+    # And: Input dictionaries are not modified
+    eq_(dict1, {
+        'key1': 'value1',
+        'key2': {
+            'key2.1': 'value2.1a'
+        }
+    })
+
+
+def test_dict_merge_shared_with_frozen_result():
+    """
+    should return immutable merged dictionary
+    """
+
+    # Given: Dict obj that needs to be merged
+    dict1 = {
+        'key1': {
+            'key1.1': ['value1.1']
+        }
+    }
+
+    # When: I merge the dictionaries using frozen result
+    merged_dict = dict_merge_shared(dict1, {'key2': 'value2'}, frozen=True)
+
+    # Then: Frozen dictionary is returned
+    ok_(isinstance(merged_dict, FrozenDict))
+    ok_(isinstance(merged_dict['key1'], FrozenDict))
+    eq_(merged_dict['key1']['key1.1'], ('value1.1', ))
+
+    # And: Modification of merged dictionary is not allowed
+    assert_raises(TypeError, merged_dict.__setitem__, 'key1', 'new')
+    assert_raises(TypeError, merged_dict['key1'].update, {})
+
+    # And: Mutable copy can be created using deepcopy
+    copied_dict = copy.deepcopy(merged_dict)
+    copied_dict['key1']['key1.1'].append('value1.2')
+    eq_(copied_dict, {
+        'key1': {
+            'key1.1': ['value1.1', 'value1.2']
+        },
+        'key2': 'value2'
+    })
@@ -0,0 +1,87 @@
+import json
+from mock import patch
+from nose.tools import eq_
+from conf.appconfig import MIME_JSON
+from orchestrator.server import app
+
+
+class TestMetricsView:
+    """
+    Tests metrics api
+    """
+
+    def setup(self):
+        self.client = app.test_client()
+
+    @patch('orchestrator.views.metrics.get_store')
+    @patch('orchestrator.views.metrics.metrics')
+    def test_get_metrics(self, m_metrics, m_get_store):
+        """
+        Should return the histograms and counters aggregated across processes
+        """
+        # Given: Metrics published by API and worker processes
+        m_get_store.return_value.get_metrics.return_value = [
+            'mock-snapshot-1', 'mock-snapshot-2']
+        m_metrics.merge.return_value = {
+            'histograms': {'config.total': {'count': 1}},
+            'counters': {'config.cache-hits': 3}
+        }
+
+        # When: I invoke the metrics endpoint
+        resp = self.client.get('/metrics')
+
+        # Then: Aggregated histograms and counters are returned
+        eq_(resp.status_code, 200)
+        eq_(resp.headers['Content-Type'], MIME_JSON)
+        data = json.loads(resp.data.decode())
+        eq_(data, {
+            'histograms': {'config.total': {'count': 1}},
+            'counters': {'config.cache-hits': 3},
+            'processes': 2
+        })
+
+        # And: Published metrics are aggregated (without publishing)
+        m_get_store.return_value.publish_metrics.assert_not_called()
+        m_metrics.merge.assert_called_once_with(
+            ['mock-snapshot-1', 'mock-snapshot-2'])
+
+    @patch('orchestrator.views.metrics.get_store')
+    @patch('orchestrator.views.metrics.metrics')
+    def test_get_metrics_for_process(self, m_metrics, m_get_store):
+        """
+        Should return the histograms and counters of the API process
+        """
+        # Given: Recorded histograms and counters
+        m_metrics.snapshot.return_value = {
+            'histograms': {'config.total': {'count': 1}},
+            'counters': {'config.cache-hits': 2}
+        }
+
+        # When: I invoke the metrics endpoint for process scope
+        resp = self.client.get('/metrics?scope=process')
+
+        # Then: Histograms and counters of the process are returned
+        eq_(resp.status_code, 200)
+        eq_(json.loads(resp.data.decode()), m_metrics.snapshot.return_value)
+        m_get_store.return_value.get_metrics.assert_not_called()
+
+    @patch('orchestrator.views.metrics.config')
+    def test_explain_config(self, m_config):
+        """
+        Should explain the config load for given owner, repo and ref
+        """
+        # Given: Explain report for config load
+        m_config.explain_config.return_value = {
+            'stages': [],
+            'counters': {}
+        }
+
+        # When: I invoke the config explain endpoint
+        resp = self.client.get(
+            '/metrics/config/totem/cluster-orchestrator/feature/mock')
+
+        # Then: Explain report is returned
+        eq_(resp.status_code, 200)
+        eq_(json.loads(resp.data.decode()), {'stages': [], 'counters': {}})
+        eq_(m_config.explain_config.call_args[0][1:],
+            ('totem', 'cluster-orchestrator', 'feature/mock'))